@@ -6,6 +6,8 @@ from datetime import timedelta
 import numpy as np
 from scipy.stats import gaussian_kde
 
+from trade_store import get_deal_arrays
+
 logger = logging.getLogger('xmb')
 
 
@@ -34,15 +36,12 @@ class KDEDealSizer:
 
     def get_deal_size(self, price, profile):
         try:
-            ds = self._deals_provider.get_deals()
             delta = timedelta(days=self._kde_days).total_seconds()
             start_time = self._get_time() - delta
-            deals = [d for d in ds if int(d['date']) > start_time]
-            prices = [float(p['price']) for p in deals]
-            pr_array = np.array(prices)
+            dates, pr_array = get_deal_arrays(self._deals_provider, since=start_time)
             # pr_reshaped = pr_array.reshape(len(prices), 1)
             # kde = KernelDensity(kernel='gaussian', bandwidth=self._kde_bandwith).fit(pr_reshaped)
-            kde = gaussian_kde(prices, bw_method=self._kde_bandwith / pr_array.std(ddof=1))
+            kde = gaussian_kde(pr_array, bw_method=self._kde_bandwith / pr_array.std(ddof=1))
             if profile == 'UP':
                 left = price
                 right = math.inf
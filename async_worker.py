@@ -0,0 +1,224 @@
+import asyncio
+import functools
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from exceptions import ApiError
+from exmo_general import Worker, Lazy
+
+logger = logging.getLogger('xmb')
+
+
+class AsyncApi:
+    """Asyncio facade over a blocking exchange api (ExmoApi, BinanceApi, MarketSimulator).
+
+    Calls are executed in a thread pool. Per exchange at most max_concurrent calls are in flight and
+    consecutive calls are started at least min_interval seconds apart.
+    """
+
+    def __init__(self, api, max_concurrent=3, min_interval=0.0, executor=None):
+        self._api = api
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._min_interval = min_interval
+        self._next_call_time = 0
+        self._executor = executor if executor is not None else ThreadPoolExecutor(max_workers=max_concurrent)
+
+    async def get_open_orders(self, currency_1, currency_2):
+        return await self._call(self._api.get_open_orders, currency_1, currency_2)
+
+    async def get_user_trades(self, currency_1, currency_2, *args, **kwargs):
+        return await self._call(self._api.get_user_trades, currency_1, currency_2, *args, **kwargs)
+
+    async def get_trades(self, currency_1, currency_2):
+        return await self._call(self._api.get_trades, currency_1, currency_2)
+
+    async def get_balances(self):
+        return await self._call(self._api.get_balances)
+
+    async def cancel_order(self, order_id):
+        return await self._call(self._api.cancel_order, order_id)
+
+    async def create_order(self, **kwargs):
+        return await self._call(self._api.create_order, **kwargs)
+
+    async def _call(self, func, *args, **kwargs):
+        async with self._semaphore:
+            await self._wait_rate_limit()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def _wait_rate_limit(self):
+        now = time.monotonic()
+        call_time = max(now, self._next_call_time)
+        self._next_call_time = call_time + self._min_interval
+        if call_time > now:
+            await asyncio.sleep(call_time - now)
+
+
+def _raise(e):
+    raise e
+
+
+class AsyncWorker(Worker):
+    """Worker running independent exchange calls of a tick concurrently.
+
+    Decisions are taken by the Worker methods. Cancels and order creations requested while handling
+    a group of orders are collected and sent together when the group is handled, so the order state
+    machine and storage updates are the same as in Worker. api must be an AsyncApi.
+    """
+
+    def __init__(self, api, storage, advisor, **kwargs):
+        super(AsyncWorker, self).__init__(api, storage, advisor, **kwargs)
+        self._pending_cancels = []
+        self._pending_creates = []
+
+    def run(self):
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        self._interrupted = False
+        while not self._interrupted:
+            try:
+                await self.main_flow()
+                await asyncio.sleep(self._period)
+            except ApiError as e:
+                logger.exception('Merket api error')
+            except Exception as e:
+                logger.exception('Fatal exception')
+
+    async def main_flow(self):
+        with self._storage.batch():
+            await self._main_flow()
+
+    async def _main_flow(self):
+        open_orders = [o for o in self._storage.get_open_orders() if o['status'] == 'OPEN']
+
+        traded_order_ids = None
+        if open_orders:
+            traded_order_ids = await self._handle_open_orders(open_orders)
+            await self._send_pending()
+
+        all_orders = self._storage.get_open_orders()
+        wait_orders = [o for o in all_orders if
+                       o['status'] == 'WAIT_FOR_PROFIT' or o['status'] == 'PROFIT_ORDER_CANCELED']
+
+        if wait_orders:
+            self._handle_orders_wait_for_profit(wait_orders, traded_order_ids, all_orders)
+            await self._send_pending()
+        self._make_reserve()
+        await self._send_pending()
+
+    async def _handle_open_orders(self, open_orders):
+        market_open_orders, trades = await asyncio.gather(
+            self._api.get_open_orders(self._currency_1, self._currency_2),
+            self._api.get_user_trades(self._currency_1, self._currency_2),
+            return_exceptions=True)
+        if isinstance(trades, Exception):
+            # fail only orders which need trades, like Lazy in Worker does
+            traded_order_ids = Lazy(_raise, trades)
+        else:
+            traded_order_ids = Lazy(lambda: {str(t['order_id']) for t in trades})
+        try:
+            if isinstance(market_open_orders, Exception):
+                raise market_open_orders
+            market_open_orders = {str(order['order_id']) for order in market_open_orders}
+            for order in open_orders:
+                self._handle_open_order(market_open_orders, order, traded_order_ids)
+        except Exception as e:
+            logger.exception('Cannot handle open orders')
+        return traded_order_ids
+
+    def _cancel_order(self, order):
+        self._pending_cancels.append(order)
+
+    def _create_profit_order(self, base_order):
+        self._pending_creates.append(functools.partial(self._create_profit_order_async, base_order))
+
+    def _create_reserve_order(self, profile, avg_price, reserve_markup, deal_size):
+        self._pending_creates.append(functools.partial(self._create_reserve_order_async, profile, avg_price,
+                                                       reserve_markup, deal_size))
+
+    async def _send_pending(self):
+        cancels, self._pending_cancels = self._pending_cancels, []
+        creates, self._pending_creates = self._pending_creates, []
+        # cancels first: they release balance required by new orders
+        if cancels:
+            await asyncio.gather(*[self._cancel_order_async(order) for order in cancels])
+        if creates:
+            await asyncio.gather(*[create() for create in creates])
+            await self._store_placed_orders_async()
+
+    async def _cancel_order_async(self, order):
+        try:
+            logger.info('Cancel order {}'.format(order['order_id']))
+            await self._api.cancel_order(order['order_id'])
+            self._storage.delete(order['order_id'], 'CANCELED', self._get_time())
+        except Exception as e:
+            logger.exception('Cannot cancel order: {}'.format(order['order_id']))
+
+    async def _create_reserve_order_async(self, profile, avg_price, reserve_markup, deal_size):
+        try:
+            my_need_price = self._calculate_desired_reserve_price(avg_price, profile, reserve_markup)
+            my_amount = self._calculate_desired_reserve_amount(profile, avg_price, deal_size)
+            if my_amount is None:
+                logger.debug('Deal size too small')
+                return
+
+            order_type = self._reserve_order_type(profile)
+            new_order_id = str(await self._api.create_order(
+                currency_1=self._currency_1,
+                currency_2=self._currency_2,
+                quantity=my_amount,
+                price=my_need_price,
+                type=order_type
+            ))
+            self._placed_orders.append((new_order_id, functools.partial(
+                self._store_reserve_order, profile=profile, quantity=my_amount, price=my_need_price)))
+        except Exception as e:
+            logger.exception('Cannot make reserve')
+
+    async def _create_profit_order_async(self, base_order):
+        try:
+            quantity, price, order_type, order_profit_markup = self._get_profit_order_params(base_order)
+            logger.info('Create new profit order for base order: {}'.format(base_order['order_id']))
+            new_order_id = str(await self._api.create_order(
+                currency_1=self._currency_1,
+                currency_2=self._currency_2,
+                quantity=quantity,
+                price=price,
+                type=order_type,
+            ))
+            self._placed_orders.append((new_order_id, functools.partial(
+                self._store_profit_order, base_order=base_order, quantity=quantity, price=price,
+                order_profit_markup=order_profit_markup)))
+        except Exception as e:
+            logger.exception('Cannot create profit order for base order: {}'.format(base_order['order_id']))
+
+    async def _store_placed_orders_async(self):
+        """Finds orders created since the last call in one market snapshot and stores them."""
+        placed_orders, self._placed_orders = self._placed_orders, []
+        if not placed_orders:
+            return
+        new_order_ids = {order_id for order_id, store in placed_orders}
+        try:
+            open_orders, user_trades = await asyncio.gather(
+                self._api.get_open_orders(self._currency_1, self._currency_2),
+                self._api.get_user_trades(self._currency_1, self._currency_2))
+        except Exception as e:
+            logger.exception('Cannot read created orders: {}'.format(sorted(new_order_ids)))
+            return
+        new_orders = {}
+        # orders completed right after creation are found in trades
+        for order in itertools.chain(open_orders, user_trades):
+            if str(order['order_id']) in new_order_ids:
+                new_orders.setdefault(str(order['order_id']), order)
+        with self._storage.batch():
+            for order_id, store in placed_orders:
+                try:
+                    if order_id not in new_orders:
+                        raise ApiError('Order not found: {}'.format(order_id))
+                    store(new_orders[order_id])
+                except Exception as e:
+                    logger.exception('Cannot store created order: {}'.format(order_id))
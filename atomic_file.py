@@ -0,0 +1,22 @@
+import os
+
+
+def atomic_write(path, write, mode='w', **kwargs):
+    """Calls write(f) with a temporary file which then replaces path, so a crash never leaves a torn file.
+
+    The temporary file is named by the process id, processes of a sweep may write the same file, and
+    removed when write fails. Nothing is written for an empty path (storages without files), in that
+    case False is returned.
+    """
+    if not path:
+        return False
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
@@ -1,5 +1,4 @@
 import hashlib
-import http.client
 import json
 import logging
 import urllib.parse
@@ -7,7 +6,9 @@ import hmac
 import time
 from math import floor
 
+import http_pool
 from exceptions import ApiError
+from order import Order, Trade
 
 # Class uses API method from Binance.
 # information about API
@@ -104,7 +105,8 @@ class BinanceApi:
         timestamp = BinanceApi._calculateTimestamp()
         url = "/api/" + API_VERSION_3 + "/" + 'myTrades' + '?limit=' + str(limit) + '&symbol=' + currency_1 + currency_2 \
               + '&timestamp=' + str(timestamp)
-        return BinanceApi._call_binance_api(url, 'GET', limit = limit, symbol=currency_1 + currency_2, timestamp=timestamp)
+        data = BinanceApi._call_binance_api(url, 'GET', limit = limit, symbol=currency_1 + currency_2, timestamp=timestamp)
+        return BinanceApi._create_exmo_user_trades(data, currency_1 + '_' + currency_2)
 
 
     @staticmethod
@@ -127,10 +129,7 @@ class BinanceApi:
         headers = {"Content-type": "application/x-www-form-urlencoded",
                    "X-MBX-APIKEY": API_KEY,
                    "signature": sign}
-        conn = http.client.HTTPSConnection(API_URL, timeout=60)
-        conn.request(http_method, url, payload, headers)
-        response = conn.getresponse().read()
-        conn.close()
+        status, response = http_pool.get_pool().request(API_URL, http_method, url, payload, headers)
         try:
             obj = json.loads(response.decode('utf-8'))
             logger.debug('Received response: {}'.format(response))
@@ -158,7 +157,7 @@ class BinanceApi:
             newObj['pair'] = obj['symbol'][:3]+'_'+obj['symbol'][3:]
             newObj['price'] = obj['price']
             newObj['quantity'] = obj['origQty']
-            newData.append(newObj)
+            newData.append(Order(newObj))
         return newData
 
     @staticmethod
@@ -182,5 +181,21 @@ class BinanceApi:
             newObj['date'] = obj['time']
             newObj['price'] = obj['price']
             newObj['quantity'] = obj['qty']
-            newData.append(newObj)
+            newData.append(Trade(newObj))
+        return newData
+
+    @staticmethod
+    def _create_exmo_user_trades(data, pair):
+        newData = []
+        for obj in data:
+            newObj = {}
+            newObj['trade_id'] = obj['id']
+            newObj['date'] = obj['time']
+            newObj['type'] = 'buy' if obj['isBuyer'] else 'sell'
+            newObj['pair'] = pair
+            newObj['order_id'] = obj['orderId']
+            newObj['price'] = obj['price']
+            newObj['quantity'] = obj['qty']
+            newObj['amount'] = obj['quoteQty']
+            newData.append(Trade(newObj))
         return newData
\ No newline at end of file
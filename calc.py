@@ -45,10 +45,10 @@ class Calc:
 
         for d in ok_deals.values():
             if d['type'] == 'buy':
-                c['BTC'] += float(d['quantity']) * (1 - self._fee)
-                c['USD'] -= float(d['price']) * float(d['quantity'])
+                c['BTC'] += d['quantity'] * (1 - self._fee)
+                c['USD'] -= d['price'] * d['quantity']
             else:
-                c['BTC'] -= float(d['quantity'])
-                c['USD'] += float(d['price']) * float(d['quantity']) * (1 - self._fee)
+                c['BTC'] -= d['quantity']
+                c['USD'] += d['price'] * d['quantity'] * (1 - self._fee)
 
         return ok_deals, c
@@ -1,32 +1,167 @@
 import datetime
+import heapq
 import json
+import logging
 import os
 import time
 
+import numpy as np
+
+from trade_store import SegmentReader, TradeStore, date_range, deals_to_arrays, is_segment_folder, list_json_files
+
+logger = logging.getLogger('xmb')
+
+
+def _deal_key(deal):
+    return int(deal['date']), int(deal['trade_id'])
+
 
 class DiskDealReader:
+    """Reads deals dumped by the trades collector.
+
+    The reader is stateful: files already ingested are remembered by (mtime, size) and only new or
+    changed files are parsed on the next call. Deals are kept in a buffer sorted by (date, trade_id)
+    with their dates and prices in arrays extended by the new deals, and deals older than the read
+    window are evicted. A trade store is memory mapped, and segments written by
+    trades_collector.SegmentWriter are read with a SegmentReader, which reads only the new trades.
+    """
+
     def __init__(self, deals_folder, **kwargs):
         self._deals_folder = deals_folder
         if 'deal_read_days' in kwargs:
             self._deal_read_days = kwargs['deal_read_days']
         else:
             self._deal_read_days = None
+        self._files = {}
+        self._deals = []
+        self._trade_ids = set()
+        # dates and prices of the deal buffer are buffers[start:stop]
+        self._date_buffer = np.empty(0, dtype=np.int64)
+        self._price_buffer = np.empty(0, dtype=np.float64)
+        self._start = 0
+        self._stop = 0
+        self._store = None
+        self._segments = None
+
+    def get_deals(self, since=None, until=None):
+        """Returns sorted deals with since < date <= until.
+
+        Without since and until the deal buffer itself is returned. It is updated in place by the next call
+        and must not be modified.
+        """
+        start_date = self._get_start_date()
+        since = start_date if since is None else max(since, start_date)
+        if TradeStore.is_store(self._deals_folder):
+            return self._get_store().get_deals(since=since, until=until)
+        if is_segment_folder(self._deals_folder):
+            return self._get_segments(since).get_deals(since=since, until=until)
+        self._read_new_files(start_date)
+        self._evict(start_date)
+        if since == start_date and until is None:
+            return self._deals
+        start, stop = date_range(self._date_buffer[self._start:self._stop], since, until)
+        return self._deals[start:stop]
 
-    def get_deals(self):
+    def get_deal_arrays(self, since=None, until=None):
+        """Returns (dates, prices) arrays of the deals with since < date <= until.
+
+        The arrays are views, of the memory mapped columns for a trade store, and are not changed by later calls.
+        """
+        start_date = self._get_start_date()
+        since = start_date if since is None else max(since, start_date)
+        if TradeStore.is_store(self._deals_folder):
+            trades = self._get_store()
+            dates, prices = trades.column('date'), trades.column('price')
+        elif is_segment_folder(self._deals_folder):
+            trades = self._get_segments(since)
+            dates, prices = trades.column('date'), trades.column('price')
+        else:
+            self._read_new_files(start_date)
+            self._evict(start_date)
+            dates = self._date_buffer[self._start:self._stop]
+            prices = self._price_buffer[self._start:self._stop]
+        start, stop = date_range(dates, since, until)
+        return dates[start:stop], prices[start:stop]
+
+    def _get_start_date(self):
         if self._deal_read_days is None:
-            start_date = 0
+            return 0
+        return self._get_time() - datetime.timedelta(days=self._deal_read_days).total_seconds()
+
+    def _get_store(self):
+        if self._store is None:
+            self._store = TradeStore(self._deals_folder)
         else:
-            start_date = self._get_time() - datetime.timedelta(days=self._deal_read_days).total_seconds()
-        files = [f for f in os.listdir(self._deals_folder) if int(os.path.splitext(f)[0]) > start_date]
-        deals = {}
+            self._store.reload()
+        return self._store
+
+    def _get_segments(self, since):
+        if self._segments is None:
+            self._segments = SegmentReader(self._deals_folder)
+        return self._segments.read(since)
+
+    def _read_new_files(self, start_date):
+        files = [f for f in list_json_files(self._deals_folder) if int(os.path.splitext(f)[0]) > start_date]
+        for filename in set(self._files) - set(files):
+            self._files.pop(filename)
+        new_deals = []
         for filename in files:
+            stat = os.stat(os.path.join(self._deals_folder, filename))
+            file_key = (stat.st_mtime, stat.st_size)
+            if self._files.get(filename) == file_key:
+                continue
             with open(os.path.join(self._deals_folder, filename)) as f:
                 try:
                     d = json.load(f)
-                    deals.update(d)
                 except:
-                    pass
-        return sorted(deals.values(), key=lambda v: (int(v['date']), int(v['trade_id'])))
+                    # file may be partially written by the collector, retry on next call
+                    logger.debug('Cannot read deals file {}'.format(filename))
+                    continue
+            self._files[filename] = file_key
+            for deal in d.values():
+                trade_id = str(deal['trade_id'])
+                if trade_id not in self._trade_ids:
+                    self._trade_ids.add(trade_id)
+                    new_deals.append(deal)
+        if not new_deals:
+            return
+        new_deals.sort(key=_deal_key)
+        if not self._deals or _deal_key(new_deals[0]) >= _deal_key(self._deals[-1]):
+            self._deals.extend(new_deals)
+            self._extend_arrays(new_deals)
+        else:
+            self._deals = list(heapq.merge(self._deals, new_deals, key=_deal_key))
+            # out of order deals: the arrays are built again in new buffers
+            self._date_buffer = np.empty(0, dtype=np.int64)
+            self._price_buffer = np.empty(0, dtype=np.float64)
+            self._start = self._stop = 0
+            self._extend_arrays(self._deals)
+
+    def _extend_arrays(self, deals):
+        # returned views are never overwritten: new deals go after the buffer window or to new buffers
+        count = len(deals)
+        if self._stop + count > len(self._date_buffer):
+            size = self._stop - self._start
+            capacity = max(2 * (size + count), 1024)
+            date_buffer = np.empty(capacity, dtype=np.int64)
+            price_buffer = np.empty(capacity, dtype=np.float64)
+            date_buffer[:size] = self._date_buffer[self._start:self._stop]
+            price_buffer[:size] = self._price_buffer[self._start:self._stop]
+            self._date_buffer, self._price_buffer = date_buffer, price_buffer
+            self._start, self._stop = 0, size
+        dates, prices = deals_to_arrays(deals)
+        self._date_buffer[self._stop:self._stop + count] = dates
+        self._price_buffer[self._stop:self._stop + count] = prices
+        self._stop += count
+
+    def _evict(self, start_date):
+        count = 0
+        while count < len(self._deals) and int(self._deals[count]['date']) <= start_date:
+            self._trade_ids.discard(str(self._deals[count]['trade_id']))
+            count += 1
+        if count:
+            del self._deals[:count]
+            self._start += count
 
     def _get_time(self):
         return int(time.time())
@@ -1,29 +1,37 @@
 import hashlib
 import hmac
-import http.client
 import json
 import logging
 import math
+import threading
 import time
 import urllib
 import urllib.parse
 
+import http_pool
 from exceptions import ApiError
+from order import Order, Trade
 
 API_URL = 'api.exmo.me'
 API_VERSION = 'v1'
 
+# methods whose request is not sent again after a broken connection, an order may be placed twice
+NOT_RESENT = frozenset(('order_create',))
+
 logger = logging.getLogger('xmb')
 
 class ExmoApi:
 
-    def __init__(self, api_key, api_secret):
+    def __init__(self, api_key, api_secret, pool=None):
         self._api_key = api_key
         self._api_secret = api_secret.encode('ascii')
+        self._pool = pool if pool is not None else http_pool.get_pool()
+        self._nonce_lock = threading.Lock()
+        self._last_nonce = 0
 
     def get_open_orders(self, currency_1, currency_2):
         try:
-            return self._call_api('user_open_orders')[currency_1 + '_' + currency_2]
+            return [Order(o) for o in self._call_api('user_open_orders')[currency_1 + '_' + currency_2]]
         except KeyError:
             logger.debug('No open market orders')
             return []
@@ -62,15 +70,22 @@ class ExmoApi:
         )['order_id'])
 
     def get_trades(self, currency_1, currency_2):
-        return self._call_api('trades', pair=currency_1 + '_' + currency_2)[currency_1 + '_' + currency_2]
+        pair = currency_1 + '_' + currency_2
+        return [Trade(t) for t in self._call_api('trades', pair=pair)[pair]]
 
     def get_user_trades(self, currency_1, currency_2, offset=0, limit=100):
-        return self._call_api('user_trades', pair=currency_1 + '_' + currency_2, offset=offset, limit=limit)[
-            currency_1 + '_' + currency_2]
+        pair = currency_1 + '_' + currency_2
+        return [Trade(t) for t in self._call_api('user_trades', pair=pair, offset=offset, limit=limit)[pair]]
+
+    def _get_nonce(self):
+        # nonce must grow with every request, also when requests are sent from several threads
+        with self._nonce_lock:
+            self._last_nonce = max(self._last_nonce + 1, int(math.floor(time.time() * 1000)))
+            return self._last_nonce
 
     def _call_api(self, api_method, http_method="POST", **kwargs):
         logger.debug('Call Exmo api. Method {}. Payload: {}'.format(api_method, kwargs))
-        payload = {'nonce': int(math.floor(time.time() * 1000))}
+        payload = {'nonce': self._get_nonce()}
 
         if kwargs:
             payload.update(kwargs)
@@ -83,10 +98,8 @@ class ExmoApi:
         headers = {"Content-type": "application/x-www-form-urlencoded",
                    "Key": self._api_key,
                    "Sign": sign}
-        conn = http.client.HTTPSConnection(API_URL, timeout=60)
-        conn.request(http_method, "/" + API_VERSION + "/" + api_method, payload, headers)
-        response = conn.getresponse().read()
-        conn.close()
+        status, response = self._pool.request(API_URL, http_method, "/" + API_VERSION + "/" + api_method, payload,
+                                              headers, retry=api_method not in NOT_RESENT)
         try:
             obj = json.loads(response.decode('utf-8'))
             logger.debug('Received response: {}'.format(response))
@@ -95,3 +108,32 @@ class ExmoApi:
             return obj
         except json.decoder.JSONDecodeError:
             raise ApiError('Ошибка анализа возвращаемых данных, получена строка', response)
+
+
+class ExmoPublicApi:
+    """Public exmo endpoints without keys, sent over the shared keep-alive pool.
+
+    host, port and scheme can point to a replay server (see replay_server.ReplayServer).
+    """
+
+    def __init__(self, host=API_URL, port=None, scheme='https', pool=None):
+        self._host = host
+        self._port = port
+        self._scheme = scheme
+        self._pool = pool if pool is not None else http_pool.get_pool()
+
+    def get_trades(self, currency_1, currency_2):
+        pair = currency_1 + '_' + currency_2
+        return [Trade(t) for t in self._call_api('trades', pair=pair)[pair]]
+
+    def _call_api(self, api_method, **kwargs):
+        logger.debug('Call Exmo public api. Method {}. Payload: {}'.format(api_method, kwargs))
+        url = "/" + API_VERSION + "/" + api_method + "?" + urllib.parse.urlencode(kwargs)
+        status, response = self._pool.request(self._host, 'GET', url, scheme=self._scheme, port=self._port)
+        try:
+            obj = json.loads(response.decode('utf-8'))
+            if 'error' in obj and obj['error']:
+                raise ApiError(obj['error'])
+            return obj
+        except json.decoder.JSONDecodeError:
+            raise ApiError('Ошибка анализа возвращаемых данных, получена строка', response)
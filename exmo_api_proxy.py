@@ -2,9 +2,9 @@ import json
 import logging
 import time
 
-import requests
-
+import http_pool
 from exceptions import ApiError
+from order import Trade
 
 API_URL = 'api.exmo.me'
 API_VERSION = 'v1'
@@ -18,7 +18,8 @@ class ExmoApiProxy:
         self._proxy_port = proxy_port
 
     def get_trades(self, currency_1, currency_2):
-        return self._call_api('trades', pair=currency_1 + '_' + currency_2)[currency_1 + '_' + currency_2]
+        pair = currency_1 + '_' + currency_2
+        return [Trade(t) for t in self._call_api('trades', pair=pair)[pair]]
 
     @staticmethod
     def _call_api(api_method, **kwargs):
@@ -27,8 +28,8 @@ class ExmoApiProxy:
 
         if kwargs:
             payload.update(kwargs)
-        response = requests.get('http://' + API_URL + "/" + API_VERSION + "/" + api_method, params=payload,
-                                proxies=dict(http='socks5://localhost:9050'))
+        response = http_pool.get_session().get('http://' + API_URL + "/" + API_VERSION + "/" + api_method,
+                                               params=payload, proxies=dict(http='socks5://localhost:9050'))
 
         try:
             obj = json.loads(response.content.decode('utf-8'))
@@ -1,6 +1,8 @@
+import functools
 import logging
 import math
 import time
+from collections import defaultdict
 
 from exceptions import ApiError
 
@@ -122,6 +124,8 @@ class Worker:
         else:
             self._suspend_price_up_down_deviation = 0.05
 
+        # created orders waiting to be found on the market and stored: (order id, store function)
+        self._placed_orders = []
 
     # TODO move
     def run(self):
@@ -139,40 +143,53 @@ class Worker:
         self._interrupted = True
 
     def main_flow(self):
+        # storage changes of the tick are committed once
+        with self._storage.batch():
+            self._main_flow()
+
+    def _main_flow(self):
         user_trades = Lazy(self._api.get_user_trades, self._currency_1, self._currency_2)
+        # ids of orders having trades, built once per tick on first use
+        traded_order_ids = Lazy(self._get_traded_order_ids, user_trades)
 
         open_orders = [o for o in self._storage.get_open_orders() if o['status'] == 'OPEN']
 
         if open_orders:
-            self._handle_open_orders(open_orders, user_trades)
+            self._handle_open_orders(open_orders, traded_order_ids)
+            self._store_placed_orders()
 
         all_orders = self._storage.get_open_orders()
         wait_orders = [o for o in all_orders if
                        o['status'] == 'WAIT_FOR_PROFIT' or o['status'] == 'PROFIT_ORDER_CANCELED']
 
         if wait_orders:
-            self._handle_orders_wait_for_profit(wait_orders, user_trades, all_orders)
+            self._handle_orders_wait_for_profit(wait_orders, traded_order_ids, all_orders)
+            self._store_placed_orders()
         self._make_reserve()
+        self._store_placed_orders()
+
+    def _get_traded_order_ids(self, user_trades):
+        return {str(t['order_id']) for t in user_trades.get_value()}
 
-    def _handle_open_orders(self, open_orders, user_trades):
+    def _handle_open_orders(self, open_orders, traded_order_ids):
 
         try:
-            market_open_orders = [str(order['order_id']) for order in
-                                  self._api.get_open_orders(self._currency_1, self._currency_2)]
+            market_open_orders = {str(order['order_id']) for order in
+                                  self._api.get_open_orders(self._currency_1, self._currency_2)}
             for order in open_orders:
-                self._handle_open_order(market_open_orders, order, user_trades)
+                self._handle_open_order(market_open_orders, order, traded_order_ids)
         except Exception as e:
             logger.exception('Cannot handle open orders')
 
-    def _handle_open_order(self, market_open_orders, order, user_trades):
+    def _handle_open_order(self, market_open_orders, order, traded_order_ids):
         try:
             if str(order['order_id']) in market_open_orders:
                 # order still open
                 if order['order_type'] == 'RESERVE':
                     # open profit orders can be ignored
-                    self._handle_open_reserve_order(order, user_trades)
+                    self._handle_open_reserve_order(order, traded_order_ids)
             else:
-                if not self._is_order_in_trades(order, user_trades):
+                if not self._is_order_in_trades(order, traded_order_ids):
                     logger.error('Something strange happened. Order {} is completed, but not in trades'.format(
                         order['order_id']))
                     return
@@ -181,8 +198,8 @@ class Worker:
         except Exception as e:
             logger.exception('Cannot handle order: {}'.format(order['order_id']))
 
-    def _is_order_in_trades(self, order, user_trades):
-        return order['order_id'] in [str(t['order_id']) for t in user_trades.get_value()]
+    def _is_order_in_trades(self, order, traded_order_ids):
+        return order['order_id'] in traded_order_ids.get_value()
 
     def _handle_completed_order(self, order):
         if order['order_type'] == 'PROFIT':
@@ -195,8 +212,8 @@ class Worker:
         logger.info('Profit order {} completed. Profit: {}, Profile: {}'.format(order['order_id'],
                                                                                 order['profit_markup'],
                                                                                 order['profile']))
-        self._storage.delete(order['order_id'], 'COMPLETED', self._get_time())
-        self._storage.delete(order['base_order']['order_id'], 'COMPLETED', self._get_time())
+        self._storage.archive_many([order['order_id'], order['base_order']['order_id']], 'COMPLETED',
+                                   self._get_time())
 
     def _handle_completed_reserve_order(self, order):
         logger.info('Reserve order {} completed'.format(order['order_id']))
@@ -205,15 +222,14 @@ class Worker:
 
         self._create_profit_order(order)
 
-    def _handle_open_reserve_order(self, order, user_trades):
+    def _handle_open_reserve_order(self, order, traded_order_ids):
         profile, profit_markup, mean_price, deal_size = self._advisor.get_advice()
         if order['profile'] == profile:
             my_need_price = self._calculate_desired_reserve_price(mean_price, profile, 0)
-            if math.fabs(my_need_price - float(order['price'])) > float(
-                    order['price']) * self._reserve_price_avg_price_deviation:
+            if math.fabs(my_need_price - order['price']) > order['price'] * self._reserve_price_avg_price_deviation:
                 logger.debug('Reserve price has changed for order {} -> {}: {}'
                              .format(order['order_id'], order['price'], my_need_price))
-                is_order_partially_completed = self._is_order_partially_completed(order, user_trades)
+                is_order_partially_completed = self._is_order_partially_completed(order, traded_order_ids)
                 if is_order_partially_completed:
                     logger.debug('Order {} is partially completed'.format(order['order_id']))
                 else:
@@ -228,23 +244,25 @@ class Worker:
             else:
                 self._cancel_order(order)
 
-    def _is_order_partially_completed(self, order, user_trades):
-        return order['order_id'] in [str(t['order_id']) for t in
-                                     user_trades.get_value()]
+    def _is_order_partially_completed(self, order, traded_order_ids):
+        return order['order_id'] in traded_order_ids.get_value()
 
-    def _handle_orders_wait_for_profit(self, wait_orders, user_trades, all_orders):
+    def _handle_orders_wait_for_profit(self, wait_orders, traded_order_ids, all_orders):
         try:
+            profit_orders_by_base = defaultdict(list)
+            for o in all_orders:
+                if o['order_type'] == 'PROFIT':
+                    profit_orders_by_base[o['base_order']['order_id']].append(o)
             for order in wait_orders:
-                self._handle_order_wait_for_profit(order, user_trades, all_orders)
+                self._handle_order_wait_for_profit(order, profit_orders_by_base)
         except Exception as e:
             logger.exception('Cannot handle orders waiting for profit')
 
-    def _handle_order_wait_for_profit(self, order, user_trades, all_orders):
+    def _handle_order_wait_for_profit(self, order, profit_orders_by_base):
         try:
-            profit_orders = [o for o in all_orders if o['order_type'] == 'PROFIT'
-                             and o['base_order']['order_id'] == order['order_id']]
+            profit_orders = profit_orders_by_base.get(order['order_id'], [])
             profile, profit_markup, avg_price, deal_size = self._advisor.get_advice()
-            price = float(order['price'])
+            price = order['price']
             if not profit_orders:
                 if self._suspend_deviation is None \
                         or order['profile'] == 'UP' and (
@@ -290,9 +308,8 @@ class Worker:
             if same_profile_orders:
                 # TODO check
                 min_price_diff = min(
-                    [abs(float(
-                        o['price'] if o['order_type'] == 'RESERVE' else o['base_order'][
-                            'price']) - avg_price) for o in same_profile_orders]) / avg_price
+                    [abs((o['price'] if o['order_type'] == 'RESERVE' else o['base_order']['price']) - avg_price)
+                     for o in same_profile_orders]) / avg_price
                 # Првоеряем минимальное отклонение цены от существующих ордеров:
                 if min_price_diff <= self._same_profile_order_price_deviation:
                     logger.debug('Price deviation with other orders is too small: {} < {}'.format(min_price_diff,
@@ -317,39 +334,54 @@ class Worker:
             price=my_need_price,
             type=order_type
         ))
-        open_orders = self._get_open_orders_for_create()
-        new_orders = [order for order in open_orders if str(order['order_id']) == new_order_id]
-        if not new_orders:
+        self._placed_orders.append((new_order_id, functools.partial(
+            self._store_reserve_order, profile=profile, quantity=my_amount, price=my_need_price)))
+
+    def _store_placed_orders(self):
+        """Finds orders created since the last call in one market snapshot and stores them."""
+        placed_orders, self._placed_orders = self._placed_orders, []
+        if not placed_orders:
+            return
+        try:
+            new_orders = self._find_created_orders({order_id for order_id, store in placed_orders})
+        except Exception as e:
+            logger.exception('Cannot read created orders: {}'.format([order_id for order_id, store in placed_orders]))
+            return
+        with self._storage.batch():
+            for order_id, store in placed_orders:
+                try:
+                    if order_id not in new_orders:
+                        # TODO fix
+                        raise ApiError('Order not found: {}'.format(order_id))
+                    store(new_orders[order_id])
+                except Exception as e:
+                    logger.exception('Cannot store created order: {}'.format(order_id))
+
+    def _find_created_orders(self, new_order_ids):
+        new_orders = {}
+        for order in self._get_open_orders_for_create():
+            if str(order['order_id']) in new_order_ids:
+                new_orders.setdefault(str(order['order_id']), order)
+        if len(new_orders) < len(new_order_ids):
             # Order already completed
-            # Fixme what to do in this case?
-            time.sleep(1)
-            new_orders = [order for order in open_orders if str(order['order_id']) == new_order_id]
-            if not new_orders:
-                user_trades = self._get_user_trades()
-                new_orders = [order for order in user_trades if str(order['order_id']) == new_order_id]
-        if not new_orders:
-            # TODO fix
-            raise ApiError('Order not found: {}'.format(new_order_id))
-        new_order = new_orders[0]
-        new_order['quantity'] = str(my_amount)
-        new_order['price'] = str(my_need_price)
+            for order in self._get_user_trades():
+                if str(order['order_id']) in new_order_ids:
+                    new_orders.setdefault(str(order['order_id']), order)
+        return new_orders
+
+    def _store_reserve_order(self, new_order, profile, quantity, price):
+        new_order['quantity'] = quantity
+        new_order['price'] = price
         stored_order = self._storage.create_order(new_order, profile, 'RESERVE', base_order=None,
                                                   created=self._get_time())
         logger.info('Created new reserve order:\n{}'.format(stored_order))
 
     def _get_user_trades(self):
-        try:
-            return self._api.get_user_trades(self._currency_1, self._currency_2)
-        except Exception as e:
-            # assume api calls limit exceeded
-            logger.exception('Cannot read last created order id in trades', e)
-            time.sleep(1)
-            return self._api.get_user_trades(self._currency_1, self._currency_2)
+        # rate limit errors are retried by the api scheduler (see rate_limiter.ScheduledApi)
+        return self._api.get_user_trades(self._currency_1, self._currency_2)
 
     def _create_profit_order(self, base_order):
         # profile, profit_markup, reserve_markup, avg_price = self._advisor.get_advice()
-        base_status = base_order['status']
-        base_profile = base_order['profile']
         # if profile != base_profile:
         #     logger.debug('Profile has changed: {}->{}. Will not create profit order for reserve order {}'
         #                  .format(base_profile, profile, base_order['order_id']))
@@ -358,14 +390,7 @@ class Worker:
         #     logger.debug('Profit markup too small: {:.4f} < {}. Will not create profit order for reserve order {}'
         #                  .format(profit_markup, self._profit_markup, base_order['order_id']))
 
-        if base_status == 'WAIT_FOR_PROFIT':
-            order_profit_markup = self._profit_markup
-        else:
-            order_profit_markup = self._profit_markup
-        quantity = self._calculate_profit_quantity(float(base_order['quantity']), base_profile, order_profit_markup)
-        price = self._calculate_profit_price(quantity, float(base_order['quantity']), float(base_order['price']),
-                                             base_profile, order_profit_markup)
-        order_type = self._profit_order_type(base_profile)
+        quantity, price, order_type, order_profit_markup = self._get_profit_order_params(base_order)
         logger.info('Create new profit order for base order: {}'.format(base_order['order_id']))
         new_order_id = str(self._api.create_order(
             currency_1=self._currency_1,
@@ -374,35 +399,35 @@ class Worker:
             price=price,
             type=order_type,
         ))
-        open_orders = self._get_open_orders_for_create()
-        new_orders = [order for order in open_orders if str(order['order_id']) == new_order_id]
-        if not new_orders:
-            # Order already completed
-            # Fixme what to do in this case?
-            time.sleep(1)
-            new_orders = [order for order in open_orders if str(order['order_id']) == new_order_id]
-            if not new_orders:
-                user_trades = self._get_user_trades()
-                new_orders = [order for order in user_trades if str(order['order_id']) == new_order_id]
-        if not new_orders:
-            raise ApiError('Order not found: {}'.format(new_order_id))
-        new_order = new_orders[0]
-        new_order['quantity'] = str(quantity)
-        new_order['price'] = str(price)
-
-        stored_order = self._storage.create_order(new_order, base_profile, 'PROFIT', base_order=base_order,
+        self._placed_orders.append((new_order_id, functools.partial(
+            self._store_profit_order, base_order=base_order, quantity=quantity, price=price,
+            order_profit_markup=order_profit_markup)))
+
+    def _get_profit_order_params(self, base_order):
+        base_status = base_order['status']
+        base_profile = base_order['profile']
+        if base_status == 'WAIT_FOR_PROFIT':
+            order_profit_markup = self._profit_markup
+        else:
+            order_profit_markup = self._profit_markup
+        quantity = self._calculate_profit_quantity(base_order['quantity'], base_profile, order_profit_markup)
+        price = self._calculate_profit_price(quantity, base_order['quantity'], base_order['price'],
+                                             base_profile, order_profit_markup)
+        order_type = self._profit_order_type(base_profile)
+        return quantity, price, order_type, order_profit_markup
+
+    def _store_profit_order(self, new_order, base_order, quantity, price, order_profit_markup):
+        new_order['quantity'] = quantity
+        new_order['price'] = price
+
+        stored_order = self._storage.create_order(new_order, base_order['profile'], 'PROFIT', base_order=base_order,
                                                   created=self._get_time(), profit_markup=order_profit_markup)
         # self._storage.update_order_status(base_order['order_id'], 'PROFIT_ORDER_CREATED', self._get_time())
         logger.info('Created new profit order: {}'.format(stored_order))
 
     def _get_open_orders_for_create(self):
-        try:
-            return self._api.get_open_orders(self._currency_1, self._currency_2)
-        except Exception as e:
-            # assume api calls limit exceeded
-            logger.exception('Cannot read last created order id', e)
-            time.sleep(1)
-            return self._api.get_open_orders(self._currency_1, self._currency_2)
+        # rate limit errors are retried by the api scheduler (see rate_limiter.ScheduledApi)
+        return self._api.get_open_orders(self._currency_1, self._currency_2)
 
     def _get_time(self):
         return int(time.time())
@@ -504,22 +529,22 @@ class Worker:
         return
         profile, profit_markup, reserve_markup, avg_price = self._advisor.get_advice()
         if int(self._get_time() - profit_order['created']) > self._profit_order_lifetime \
-                and float(profit_order['profit_markup']) != self._profit_markup:
+                and profit_order['profit_markup'] != self._profit_markup:
             if profit_order['profile'] == 'DOWN':
-                desired_profit_amount = self._calculate_profit_quantity(float(profit_order['base_order']['quantity']),
+                desired_profit_amount = self._calculate_profit_quantity(profit_order['base_order']['quantity'],
                                                                         profit_order['profile'],
                                                                         self._profit_markup)
             else:
-                desired_profit_amount = float(profit_order['quantity'])
+                desired_profit_amount = profit_order['quantity']
             desired_profit_price = self._calculate_profit_price(desired_profit_amount,
-                                                                float(profit_order['base_order']['quantity']),
-                                                                float(profit_order['base_order']['price']),
+                                                                profit_order['base_order']['quantity'],
+                                                                profit_order['base_order']['price'],
                                                                 profit_order['profile'],
                                                                 self._profit_markup)
-            if abs(desired_profit_price - float(profit_order[
-                                                    'price'])) / desired_profit_price > self._profit_price_prev_price_deviation \
-                    and abs(
-                                desired_profit_price - avg_price) / desired_profit_price > self._profit_price_avg_price_deviation:
+            if abs(desired_profit_price - profit_order['price']) / desired_profit_price \
+                    > self._profit_price_prev_price_deviation \
+                    and abs(desired_profit_price - avg_price) / desired_profit_price \
+                    > self._profit_price_avg_price_deviation:
                 logger.debug('Profit markup has changed for order {}'.format(profit_order['order_id']))
                 self._cancel_order(profit_order)
                 self._storage.update_order_status(profit_order['base_order']['order_id'], 'PROFIT_ORDER_CANCELED',
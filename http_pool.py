@@ -0,0 +1,146 @@
+import http.client
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger('xmb')
+
+# Errors raised when a kept-alive connection has been closed by the server meanwhile
+RECONNECT_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest, BrokenPipeError,
+                    ConnectionResetError, ConnectionAbortedError)
+
+# methods whose request can be sent again when the connection broke after it was sent
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'DELETE', 'OPTIONS'))
+
+
+class ConnectionPool:
+    """Keep-alive http(s) connections shared between api clients, pooled per (scheme, host, port)."""
+
+    def __init__(self, pool_size=4, timeout=60):
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def request(self, host, http_method, url, body=None, headers=None, scheme='https', port=None, retry=None):
+        """Sends request and returns (status, response body).
+
+        When a reused connection turns out to be closed, the request is sent again on a new connection
+        if it could not be sent, or if retry is true (by default for idempotent methods). A request broken
+        while waiting for the response may have been processed, so e.g. an order must not be sent again.
+        """
+        if retry is None:
+            retry = http_method in IDEMPOTENT_METHODS
+        key = (scheme, host, port)
+        conn, reused = self._acquire(key)
+        sent = []
+        try:
+            response, data = self._send(conn, http_method, url, body, headers, sent)
+        except RECONNECT_ERRORS:
+            conn.close()
+            if not reused or sent and not retry:
+                raise
+            logger.debug('Connection to {} was closed, reconnect'.format(host))
+            conn = self._connect(key)
+            try:
+                response, data = self._send(conn, http_method, url, body, headers)
+            except:
+                conn.close()
+                raise
+        except:
+            conn.close()
+            raise
+        self._release(key, conn, response)
+        return response.status, data
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for conn in connections:
+                    conn.close()
+            self._idle.clear()
+
+    @property
+    def pool_size(self):
+        return self._pool_size
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    def idle_count(self, host, scheme='https', port=None):
+        with self._lock:
+            return len(self._idle[(scheme, host, port)])
+
+    @staticmethod
+    def _send(conn, http_method, url, body, headers, sent=None):
+        conn.request(http_method, url, body, headers or {})
+        if sent is not None:
+            sent.append(True)
+        response = conn.getresponse()
+        # response has to be read completely before the connection is reused
+        return response, response.read()
+
+    def _acquire(self, key):
+        with self._lock:
+            if self._idle[key]:
+                return self._idle[key].pop(), True
+        return self._connect(key), False
+
+    def _connect(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self._timeout)
+        return http.client.HTTPConnection(host, port, timeout=self._timeout)
+
+    def _release(self, key, conn, response):
+        if response.will_close:
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle[key]) < self._pool_size:
+                self._idle[key].append(conn)
+                return
+        conn.close()
+
+
+_default_pool = None
+_default_session = None
+_default_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide pool used by api clients created without an explicit pool."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ConnectionPool()
+        return _default_pool
+
+
+def get_session():
+    """Process-wide keep-alive requests session for clients that need requests features (e.g. socks proxies)."""
+    global _default_session
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    pool = get_pool()
+    with _default_pool_lock:
+        if _default_session is None:
+            _default_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool.pool_size, pool_maxsize=pool.pool_size)
+            _default_session.mount('http://', adapter)
+            _default_session.mount('https://', adapter)
+        return _default_session
+
+
+def configure(pool_size=4, timeout=60):
+    global _default_pool, _default_session
+    with _default_pool_lock:
+        if _default_pool is not None:
+            _default_pool.close()
+        if _default_session is not None:
+            _default_session.close()
+            _default_session = None
+        _default_pool = ConnectionPool(pool_size=pool_size, timeout=timeout)
+        return _default_pool
@@ -3,14 +3,53 @@ import logging
 import os
 import os.path
 from collections import Counter
+from contextlib import contextmanager
+
+from atomic_file import atomic_write
+from order import Order
 
 logger = logging.getLogger('xmb')
 
+ARCHIVE_JOURNAL = 'archive.jsonl'
+
+
+def load_archive(archive_folder):
+    """Archived orders, stored either one file per order or as lines of the archive journal."""
+    orders = []
+    for filename in os.listdir(archive_folder):
+        if filename.endswith('.tmp'):
+            continue
+        with open(os.path.join(archive_folder, filename)) as f:
+            if filename == ARCHIVE_JOURNAL:
+                orders.extend(json.loads(line) for line in f if line.strip())
+            else:
+                orders.append(json.load(f))
+    return orders
+
+
 class JsonStorage:
-    def __init__(self, order_file='', archive_folder=''):
+    """Orders storage in a json file.
+
+    In journal mode every mutation is appended as one line to <order_file>.journal, and the journal
+    is compacted into the order file (written to a temporary file and renamed) every compact_every
+    records. Archived orders are appended to the archive journal instead of one file per order.
+    Mutations made inside batch() are written to disk once, when the outermost batch exits.
+    """
+
+    def __init__(self, order_file='', archive_folder='', journal=False, compact_every=1000):
         self._order_file = order_file
         self._archive_folder = archive_folder
+        self._journal = journal
+        self._journal_file = order_file + '.journal'
+        self._compact_every = compact_every
+        self._journal_size = 0
+        self._batch_level = 0
+        self._dirty = False
+        self._pending_records = []
+        self._pending_archive = []
         self.orders = self.load_orders_from_disk()
+        if self._journal:
+            self._replay_journal()
 
     def delete(self, order_id, status, completed):
         logger.debug('Archive order {} with status {}'.format(order_id, status))
@@ -18,9 +57,17 @@ class JsonStorage:
         order_to_store['status'] = status
         if order_to_store['order_type'] == 'PROFIT' and status == 'COMPLETED' or order_to_store['status'] == 'CANCELED':
             order_to_store['completed'] = completed
-        self.save_to_disk(order_to_store, os.path.join(self._archive_folder, str(order_id) + '.json'))
+        if self._journal:
+            self._pending_archive.append(Order(order_to_store))
+        else:
+            self.save_to_disk(order_to_store, os.path.join(self._archive_folder, str(order_id) + '.json'))
         self.orders.pop(str(order_id))
-        self.save_orders()
+        self._log({'op': 'delete', 'order_id': str(order_id)})
+
+    def archive_many(self, order_ids, status, completed):
+        with self.batch():
+            for order_id in order_ids:
+                self.delete(order_id, status, completed)
 
     def cancel_order(self, order_id, canceled):
         self.delete(str(order_id), 'CANCELED', canceled)
@@ -30,7 +77,7 @@ class JsonStorage:
         order['status'] = status
         if status == 'WAIT_FOR_PROFIT':
             order['completed'] = timestamp
-        self.save_orders()
+        self._log({'op': 'update', 'order_id': str(order_id), 'status': status, 'timestamp': timestamp})
 
     def get_open_orders(self):
         return self.orders.values()
@@ -48,47 +95,143 @@ class JsonStorage:
             'profit_markup': profit_markup,
             'created': created
         }
-        order_to_store = dict(order, **order_to_store)
+        order_to_store = Order(order, **order_to_store)
         logger.debug('Save order: %s', order_to_store)
         self.orders[str(order['order_id'])] = order_to_store
-        self.save_orders()
+        self._log({'op': 'create', 'order': order_to_store.copy()})
         return order_to_store
 
+    @contextmanager
+    def batch(self):
+        self._batch_level += 1
+        try:
+            yield self
+        finally:
+            self._batch_level -= 1
+            if self._batch_level == 0:
+                self.flush()
+
+    def flush(self):
+        if not self._journal:
+            if self._dirty:
+                self._dirty = False
+                self.save_orders()
+            return
+        if self._pending_archive:
+            archive, self._pending_archive = self._pending_archive, []
+            self._append_lines(os.path.join(self._archive_folder, ARCHIVE_JOURNAL), archive)
+        if self._pending_records:
+            records, self._pending_records = self._pending_records, []
+            self._append_lines(self._journal_file, records)
+            self._journal_size += len(records)
+            if self._journal_size >= self._compact_every:
+                self.compact()
+
+    def compact(self):
+        self.save_orders()
+        # replaying records already contained in the snapshot is harmless, so a crash here loses nothing
+        with open(self._journal_file, 'w'):
+            pass
+        self._journal_size = 0
+
+    def _log(self, record):
+        if self._journal:
+            self._pending_records.append(record)
+        else:
+            self._dirty = True
+        if self._batch_level == 0:
+            self.flush()
+
+    def _append_lines(self, path, objects):
+        try:
+            with open(path, 'a') as f:
+                f.write(''.join(json.dumps(o) + '\n' for o in objects))
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception:
+            logger.exception('Cannot write journal {}'.format(path))
+
+    def _replay_journal(self):
+        if not os.path.exists(self._journal_file):
+            return
+        with open(self._journal_file) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.decoder.JSONDecodeError:
+                    # torn last line after a crash
+                    logger.warning('Cannot read journal record: {}'.format(line))
+                    break
+                self._apply(record)
+                self._journal_size += 1
+
+    def _apply(self, record):
+        if record['op'] == 'create':
+            self.orders[record['order']['order_id']] = Order.from_dict(record['order'])
+        elif record['op'] == 'update':
+            order = self.orders.get(record['order_id'])
+            if order is not None:
+                order['status'] = record['status']
+                if record['status'] == 'WAIT_FOR_PROFIT':
+                    order['completed'] = record['timestamp']
+        elif record['op'] == 'delete':
+            self.orders.pop(record['order_id'], None)
+
     def save_orders(self):
         self.save_to_disk(self.orders, self._order_file)
 
+    def snapshot(self):
+        """Open orders and archive files, which restore() writes back (also to a storage in another folder)."""
+        self.flush()
+        archive = {}
+        for filename in os.listdir(self._archive_folder):
+            if not filename.endswith('.tmp'):
+                with open(os.path.join(self._archive_folder, filename), 'rb') as f:
+                    archive[filename] = f.read()
+        return {'orders': dict(self.orders), 'archive': archive}
+
+    def restore(self, snapshot):
+        for filename in os.listdir(self._archive_folder):
+            os.remove(os.path.join(self._archive_folder, filename))
+        for filename, data in snapshot['archive'].items():
+            with open(os.path.join(self._archive_folder, filename), 'wb') as f:
+                f.write(data)
+        self.orders = dict(snapshot['orders'])
+        self._pending_records = []
+        self._pending_archive = []
+        self._dirty = False
+        if self._journal:
+            self.compact()
+        else:
+            self.save_orders()
+
     def get_stats(self, start=None, stop=None):
         stats = Counter()
-        for filename in os.listdir(self._archive_folder):
-            with open(os.path.join(self._archive_folder, filename)) as f:
-                d = json.load(f)
-                # TODO check time
-                if d['order_type'] == 'PROFIT' and d['status'] == 'COMPLETED':
-                    stats[d['profile']] += float(d['profit_markup'])
+        for d in load_archive(self._archive_folder):
+            # TODO check time
+            if d['order_type'] == 'PROFIT' and d['status'] == 'COMPLETED':
+                stats[d['profile']] += float(d['profit_markup'])
         return stats
 
     def get_archive_completed_orders(self):
         orders = []
-        for a in os.listdir(self._archive_folder):
-            with open(os.path.join(self._archive_folder, a)) as f:
-                order = json.load(f)
-                if order['status'] == 'COMPLETED' or order['status'] == 'WAIT_FOR_PROFIT':
-                    if order['base_order'] is not None:
-                        order['base_order_id'] = order['base_order']['order_id']
-                    orders.append(order)
+        for order in load_archive(self._archive_folder):
+            if order['status'] == 'COMPLETED' or order['status'] == 'WAIT_FOR_PROFIT':
+                if order['base_order'] is not None:
+                    order['base_order_id'] = order['base_order']['order_id']
+                orders.append(Order.from_dict(order))
         return orders
 
     def save_to_disk(self, obj, path):
         try:
-            with open(path, 'w') as f:
-                json.dump(obj, f, indent=4)
+            atomic_write(path, lambda f: json.dump(obj, f, indent=4))
         except Exception:
-            logger.exception('Cannot save archive')
+            logger.exception('Cannot save {}'.format(path))
 
     def load_orders_from_disk(self):
         try:
             with open(self._order_file, 'r') as f:
-                return json.load(f)
+                return {order_id: Order.from_dict(order) for order_id, order in json.load(f).items()}
         except:
             logger.exception('Cannot read orders')
             return {}
@@ -2,14 +2,20 @@ import argparse
 import logging
 import os
 import sys
+import time
 from logging.handlers import RotatingFileHandler
 from threading import Thread
 
 from advisor import BackgroundStatAdvisor
-from disk_deal_reader import DiskDealReader
 from exmo_api import ExmoApi
 from exmo_api_proxy import ExmoApiProxy
 from exmo_general import Worker
+from metrics import Metrics, MetricsReporter, instrument, instrument_worker
+from rate_limiter import ScheduledApi, get_scheduler
+from trade_cache import CachedTradesApi
+from trade_store import load_segments
+from trade_stream import PollingTradeStream
+from trades_collector import Collector
 
 # run period in seconds
 from sqlite_api import SQLiteStorage
@@ -73,18 +79,36 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-k', '--key', type=str, help='Api key')
     parser.add_argument('-s', '--secret', type=str, help='Api secret')
+    parser.add_argument('--metrics-file', type=str, default=None,
+                        help='Record latencies of tick phases, api and storage calls to .json or text file')
+    parser.add_argument('--metrics-period', type=int, default=60, help='Metrics report period in seconds')
     sysargs = parser.parse_args(sys.argv[1:])
 
-    exmo_api = ExmoApi(sysargs.key, sysargs.secret)
-    exmo_public_api = ExmoApiProxy(proxy_host='localhost', proxy_port=9050)
+    # worker and advisor share the request rate of the exchange
+    # user trades are polled incrementally and kept in a local cache
+    exmo_api = CachedTradesApi(ScheduledApi(ExmoApi(sysargs.key, sysargs.secret), get_scheduler('exmo')))
+    exmo_public_api = ScheduledApi(ExmoApiProxy(proxy_host='localhost', proxy_port=9050), get_scheduler('exmo'))
 
     # storage = JsonStorage(order_file=os.path.join('real_run', 'orders.json'),
     #                       archive_folder=os.path.join('real_run', 'archive'))
 
     storage = SQLiteStorage(os.path.join('real_run', 'orders.db'))
 
-    dp = DiskDealReader(r'C:\Users\ozavorot\Documents\GitHub\xmb\trades-2018-02-15', **args)
-    ds = TrendDealSizer(dp, **args)
+    # trades are collected in process, the deal sizer reads them from the ring buffer
+    ring_size = 300000
+    collector = Collector(os.path.join('real_run', 'trades'), ring_size=ring_size)
+    feed = collector.add_feed('exmo', PollingTradeStream(exmo_public_api, 'BTC', 'USD', period=3, min_period=1,
+                                                         max_period=10), 'BTC', 'USD')
+    # the ring starts with the trades of the deal read window collected before the restart
+    since = int(time.time()) - args['deal_read_days'] * 24 * 60 * 60
+    history = load_segments(collector.get_folder('exmo', 'BTC', 'USD'), since=since)
+    start, stop = history.get_range(since=since)
+    feed.ring.append(history.slice_deals(max(start, stop - ring_size), stop))
+    collector.run_in_thread()
+    ds = TrendDealSizer(feed.ring, **args)
+    metrics = Metrics() if sysargs.metrics_file is not None else None
+    if metrics is not None:
+        instrument(ds, ('get_deal_size',), metrics, 'advisor')
 
     advisor = BackgroundStatAdvisor(ds, exmo_public_api, period=300)
 
@@ -92,5 +116,8 @@ if __name__ == '__main__':
                     storage,
                     advisor,
                     **args)
+    if metrics is not None:
+        instrument_worker(worker, metrics)
+        MetricsReporter(metrics, sysargs.metrics_period, sysargs.metrics_file).run_in_thread()
     t = Thread(target=worker.run)
     t.run()
@@ -0,0 +1,223 @@
+import bisect
+import inspect
+import json
+import logging
+import math
+import threading
+import time
+
+from atomic_file import atomic_write
+
+logger = logging.getLogger('xmb')
+
+# phases of a Worker tick
+WORKER_PHASES = ('main_flow', '_handle_open_orders', '_handle_orders_wait_for_profit', '_make_reserve',
+                 '_store_placed_orders')
+
+QUANTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+
+# context managers: only their creation would be timed
+UNTIMED = frozenset(('batch',))
+
+
+def _bucket_bounds(low=1e-6, high=1000.0, ratio=1.05):
+    bounds = [low]
+    while bounds[-1] < high:
+        bounds.append(bounds[-1] * ratio)
+    return bounds
+
+
+class Histogram:
+    """Latencies in seconds counted in log-spaced buckets, quantiles are exact within 5%.
+
+    Memory does not grow with the number of records: buckets run from 1 microsecond to 1000 seconds.
+    """
+
+    BOUNDS = _bucket_bounds()
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket of the q-quantile, not more than the largest record."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.BOUNDS[index] if index < len(self.BOUNDS) else math.inf, self.max)
+        return self.max
+
+    def summary(self):
+        summary = {'count': self.count, 'total': self.total, 'mean': self.total / self.count if self.count else 0.0}
+        summary.update((name, self.quantile(q)) for name, q in QUANTILES)
+        summary['max'] = self.max
+        return summary
+
+
+class Metrics:
+    """Latency histograms by name, recorded from any thread."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # instrumented objects are pickled by backtest checkpoints
+        with self._lock:
+            return {'histograms': dict(self._histograms)}
+
+    def __setstate__(self, state):
+        self._histograms = state['histograms']
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram()
+            self._histograms[name].record(seconds)
+
+    def get_histogram(self, name):
+        return self._histograms.get(name)
+
+    def summary(self):
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in sorted(self._histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+    def format_line(self):
+        return ' '.join('{}: n={} p50={:.3f}ms p95={:.3f}ms p99={:.3f}ms'.format(
+            name, s['count'], s['p50'] * 1000, s['p95'] * 1000, s['p99'] * 1000) for name, s in self.summary().items())
+
+    def write(self, path):
+        """Writes the summary as json, or as text lines '<name> <field> <value>' unless path ends with .json."""
+        summary = self.summary()
+
+        def write(f):
+            if path.endswith('.json'):
+                json.dump(summary, f, indent=4)
+            else:
+                f.writelines('{} {} {}\n'.format(name, field, value) for name, s in summary.items()
+                             for field, value in s.items())
+
+        atomic_write(path, write)
+
+
+class TimedCall:
+    """Callable recording the latency of every call of func as `name`. Coroutine functions are awaited."""
+
+    def __init__(self, metrics, name, func):
+        self._metrics = metrics
+        self._name = name
+        self._func = func
+        self._is_coroutine = inspect.iscoroutinefunction(func)
+
+    def __call__(self, *args, **kwargs):
+        if self._is_coroutine:
+            return self._call_async(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return self._func(*args, **kwargs)
+        finally:
+            self._metrics.record(self._name, time.perf_counter() - start)
+
+    async def _call_async(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await self._func(*args, **kwargs)
+        finally:
+            self._metrics.record(self._name, time.perf_counter() - start)
+
+
+class TimedProxy:
+    """Object (api, storage, advisor) whose public method calls are recorded as <prefix>.<method>."""
+
+    def __init__(self, obj, metrics, prefix):
+        self._obj = obj
+        self._metrics = metrics
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        attr = getattr(self._obj, name)
+        if not callable(attr) or name in UNTIMED:
+            return attr
+        return TimedCall(self._metrics, self._prefix + '.' + name, attr)
+
+
+def instrument(obj, methods, metrics, prefix):
+    """Records calls of the methods of obj as <prefix>.<method>.
+
+    Instrumenting again replaces the previous instrumentation (e.g. of an object restored from a checkpoint).
+    """
+    for name in methods:
+        # instance attributes shadow the methods of the class
+        obj.__dict__.pop(name, None)
+        setattr(obj, name, TimedCall(metrics, prefix + '.' + name.lstrip('_'), getattr(obj, name)))
+
+
+def instrument_worker(worker, metrics):
+    """Records the tick phases of a Worker (or AsyncWorker) and the calls of its api, storage and advisor.
+
+    Nothing is recorded and nothing costs time for a worker which is not instrumented.
+    """
+    instrument(worker, WORKER_PHASES, metrics, 'worker')
+    for attr, prefix in (('_api', 'api'), ('_storage', 'storage'), ('_advisor', 'advisor')):
+        obj = getattr(worker, attr)
+        if isinstance(obj, TimedProxy):
+            obj = obj._obj
+        setattr(worker, attr, TimedProxy(obj, metrics, prefix))
+
+
+class MetricsReporter:
+    """Logs a line with the metrics and writes them to `path` every `period` seconds."""
+
+    def __init__(self, metrics, period=60, path=None, clock=time.monotonic):
+        self._metrics = metrics
+        self._period = period
+        self._path = path
+        self._clock = clock
+        self._last_report = clock()
+        self._stopped = threading.Event()
+
+    def report(self):
+        self._last_report = self._clock()
+        logger.info('Metrics: {}'.format(self._metrics.format_line()))
+        if self._path is not None:
+            try:
+                self._metrics.write(self._path)
+            except Exception:
+                logger.exception('Cannot write metrics {}'.format(self._path))
+
+    def maybe_report(self):
+        """Reports if the period passed since the last report, for loops without a reporting thread."""
+        if self._clock() - self._last_report >= self._period:
+            self.report()
+
+    def run_in_thread(self):
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+        return thread
+
+    def _run(self):
+        while not self._stopped.wait(self._period):
+            self.report()
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,78 @@
+from operator import methodcaller
+
+
+class Record(dict):
+    """Dict whose numeric fields always hold floats, with typed attribute access to known fields.
+
+    Records stay dicts, so json files, storages and code indexing orders by key work unchanged:
+    values are converted once when a record is built from an exchange response or a storage row
+    instead of being re-parsed with float() at every use. Missing fields read as None through attributes.
+    """
+    __slots__ = ()
+
+    FIELDS = ()
+    NUMERIC = frozenset()
+
+    def __init__(self, *args, **kwargs):
+        super(Record, self).__init__(*args, **kwargs)
+        for key in self.NUMERIC:
+            value = dict.get(self, key)
+            if value is not None and type(value) is not float:
+                dict.__setitem__(self, key, float(value))
+
+    @classmethod
+    def from_dict(cls, d):
+        if d is None or isinstance(d, cls):
+            return d
+        return cls(d)
+
+    @classmethod
+    def from_values(cls, fields, values):
+        """Record of already converted values."""
+        record = cls.__new__(cls)
+        dict.__init__(record, zip(fields, values))
+        return record
+
+    def __setitem__(self, key, value):
+        if key in self.NUMERIC and value is not None:
+            value = float(value)
+        super(Record, self).__setitem__(key, value)
+
+    def copy(self):
+        return type(self)(self)
+
+
+def _add_fields(cls):
+    for name in cls.FIELDS:
+        setattr(cls, name, property(methodcaller('get', name), doc='{} field'.format(name)))
+    return cls
+
+
+@_add_fields
+class Order(Record):
+    """Order stored by the bot. Price, quantity, amount and profit markup are floats."""
+    __slots__ = ()
+
+    FIELDS = ('order_id', 'type', 'price', 'quantity', 'profile', 'order_type', 'status', 'base_order',
+              'profit_markup', 'created', 'completed', 'pair', 'amount', 'trade_id', 'date')
+    NUMERIC = frozenset(('price', 'quantity', 'amount', 'profit_markup'))
+
+    def __init__(self, *args, **kwargs):
+        super(Order, self).__init__(*args, **kwargs)
+        base_order = dict.get(self, 'base_order')
+        if base_order is not None and not isinstance(base_order, Order):
+            dict.__setitem__(self, 'base_order', Order(base_order))
+
+    def __setitem__(self, key, value):
+        if key == 'base_order':
+            value = Order.from_dict(value)
+        super(Order, self).__setitem__(key, value)
+
+
+@_add_fields
+class Trade(Record):
+    """Market deal. Price, quantity and amount are floats."""
+    __slots__ = ()
+
+    FIELDS = ('trade_id', 'date', 'type', 'price', 'quantity', 'amount', 'order_id', 'pair')
+    NUMERIC = frozenset(('price', 'quantity', 'amount'))
@@ -9,7 +9,9 @@ from collections import defaultdict
 import os
 import json
 
+from json_api import JsonStorage, load_archive
 from sqlite_api import SQLiteStorage
+from trade_store import TradeStore, is_segment_folder, list_json_files, load_trades
 from trend_analyze import TrendAnalyzer
 
 deals_folder = r'C:\Users\ozavorot\Documents\GitHub\xmb\real_data_test\datasets3'
@@ -20,8 +22,13 @@ db_file = None  # r'C:\Users\ozavorot\Documents\GitHub\xmb\datasets\orders.db'
 
 
 def get_deals(deals_folder):
+    if TradeStore.is_store(deals_folder) or is_segment_folder(deals_folder):
+        store = load_trades(deals_folder)
+        df = pd.DataFrame({'date': store.column('date'), 'price': store.column('price')})
+        df = df.groupby('date', as_index=False)['price'].mean()
+        return df.to_dict('records')
     deals = {}
-    for filename in os.listdir(deals_folder):
+    for filename in list_json_files(deals_folder):
         with open(os.path.join(deals_folder, filename)) as f:
             try:
                 d = json.load(f)
@@ -52,16 +59,12 @@ def get_orders_from_db(db_file):
 
 
 def get_orders_from_json(run_folder):
-    arch = []
     arch_folder = os.path.join(run_folder, 'archive')
-    for filename in os.listdir(arch_folder):
-        with open(os.path.join(arch_folder, filename)) as f:
-            d = json.load(f)
-            arch.append(d)
-
-    with open(os.path.join(run_folder, 'orders.json')) as f:
-        d = json.load(f)
-        arch.extend(d.values())
+    arch = load_archive(arch_folder)
+
+    # journal replay also covers runs which were not compacted
+    storage = JsonStorage(os.path.join(run_folder, 'orders.json'), arch_folder, journal=True)
+    arch.extend(storage.get_open_orders())
     return arch
 
 
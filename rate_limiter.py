@@ -0,0 +1,216 @@
+import functools
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+
+from exceptions import ApiError
+
+logger = logging.getLogger('xmb')
+
+# priorities of api methods, lower is served first
+PRIORITY_ORDER = 0
+PRIORITY_ACCOUNT = 1
+PRIORITY_MARKET_DATA = 2
+
+METHOD_PRIORITIES = {
+    'create_order': PRIORITY_ORDER,
+    'cancel_order': PRIORITY_ORDER,
+    'get_open_orders': PRIORITY_ACCOUNT,
+    'get_user_trades': PRIORITY_ACCOUNT,
+    'get_canceled_orders': PRIORITY_ACCOUNT,
+    'is_order_partially_completed': PRIORITY_ACCOUNT,
+    'get_balances': PRIORITY_ACCOUNT,
+    'get_trades': PRIORITY_MARKET_DATA,
+}
+
+# methods which are not repeated after an error, a repeated order may be placed twice
+NOT_RETRIED = frozenset(('create_order',))
+
+# binance: too many requests, too many orders
+BACKOFF_CODES = frozenset((-1003, -1015))
+
+# exmo answers {'result': false, 'error': '<message>'} without a stable code for throttling
+BACKOFF_MESSAGES = re.compile(r'too many requests|rate limit|requests? limit|limit exceeded|maintenance',
+                              re.IGNORECASE)
+
+# requests per second and burst size per exchange
+EXCHANGE_LIMITS = {
+    'exmo': {'rate': 3, 'capacity': 10},
+    'binance': {'rate': 20, 'capacity': 50},
+}
+
+_EXMO_CODE = re.compile(r'Error (\d+)')
+
+
+def get_error_code(e):
+    """Exchange error code of ApiError: binance raises ApiError(code, msg), exmo 'Error <code>: <msg>'."""
+    if not isinstance(e, ApiError) or not e.args:
+        return None
+    if isinstance(e.args[0], int):
+        return e.args[0]
+    match = _EXMO_CODE.search(str(e.args[0]))
+    return int(match.group(1)) if match else None
+
+
+class TokenBucket:
+    """Token bucket refilled with `rate` tokens per second up to `capacity` tokens. Not thread safe."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else max(rate, 1)
+        self._clock = clock
+        self._tokens = self._capacity
+        self._last = clock()
+
+    @property
+    def tokens(self):
+        self._refill()
+        return self._tokens
+
+    def wait_time(self, tokens=1):
+        """Seconds until `tokens` tokens are available."""
+        self._refill()
+        return max(0.0, (tokens - self._tokens) / self._rate)
+
+    def take(self, tokens=1):
+        self._refill()
+        self._tokens -= tokens
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+
+class RequestScheduler:
+    """Serves api calls of all threads in priority order within the request rate of an exchange.
+
+    When a call fails with a rate limit error (see backoff_codes and backoff_messages), an unparsable
+    response or a connection error, all calls to the exchange are suspended for an exponentially growing delay
+    and the call is repeated up to max_retries times.
+    """
+
+    def __init__(self, rate, capacity=None, max_retries=3, backoff=1.0, max_backoff=60.0,
+                 backoff_codes=BACKOFF_CODES, backoff_messages=BACKOFF_MESSAGES):
+        self._bucket = TokenBucket(rate, capacity)
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._backoff_codes = backoff_codes
+        self._backoff_messages = backoff_messages
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._paused_until = 0
+        self._errors = 0
+
+    def call(self, priority, func, *args, **kwargs):
+        return self._call(priority, self._max_retries, func, *args, **kwargs)
+
+    def call_once(self, priority, func, *args, **kwargs):
+        """Calls func without repeating it after errors."""
+        return self._call(priority, 0, func, *args, **kwargs)
+
+    def _call(self, priority, retries, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.acquire(priority)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self._should_back_off(e):
+                    raise
+                self._back_off(e)
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                continue
+            with self._condition:
+                self._errors = 0
+            return result
+
+    def acquire(self, priority=PRIORITY_MARKET_DATA):
+        """Blocks until a request with the priority may be sent."""
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            # waiting calls re-check whether they are first in the queue
+            self._condition.notify_all()
+            try:
+                while True:
+                    timeout = None
+                    if self._waiting[0] == ticket:
+                        timeout = max(self._paused_until - time.monotonic(), self._bucket.wait_time())
+                        if timeout <= 0:
+                            self._bucket.take()
+                            heapq.heappop(self._waiting)
+                            self._condition.notify_all()
+                            return
+                    self._condition.wait(timeout)
+            except BaseException:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._condition.notify_all()
+                raise
+
+    def _should_back_off(self, e):
+        if isinstance(e, OSError):
+            return True
+        if isinstance(e, ApiError):
+            if get_error_code(e) in self._backoff_codes:
+                return True
+            if e.args and isinstance(e.args[0], str) and self._backoff_messages.search(e.args[0]):
+                return True
+            # exchanges answer with an html page instead of json when requests are throttled
+            return len(e.args) > 1 and isinstance(e.args[1], bytes)
+        return False
+
+    def _back_off(self, e):
+        with self._condition:
+            delay = min(self._backoff * 2 ** self._errors, self._max_backoff)
+            self._errors += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._condition.notify_all()
+        logger.warning('Api calls suspended for {} seconds: {}'.format(delay, e))
+
+    @property
+    def paused_until(self):
+        return self._paused_until
+
+
+class ScheduledApi:
+    """Exchange api (ExmoApi, ExmoApiProxy, BinanceApi) whose calls go through a RequestScheduler."""
+
+    def __init__(self, api, scheduler, priorities=None):
+        self._api = api
+        self._scheduler = scheduler
+        self._priorities = priorities if priorities is not None else METHOD_PRIORITIES
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if name not in self._priorities:
+            return attr
+        call = self._scheduler.call_once if name in NOT_RETRIED else self._scheduler.call
+        return functools.partial(call, self._priorities[name], attr)
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(exchange):
+    """Process-wide scheduler of the exchange, shared by all its clients."""
+    with _schedulers_lock:
+        if exchange not in _schedulers:
+            _schedulers[exchange] = RequestScheduler(**EXCHANGE_LIMITS.get(exchange, {'rate': 1}))
+        return _schedulers[exchange]
+
+
+def configure(exchange, **kwargs):
+    with _schedulers_lock:
+        _schedulers[exchange] = RequestScheduler(**kwargs)
+        return _schedulers[exchange]
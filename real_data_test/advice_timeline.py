@@ -0,0 +1,94 @@
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from atomic_file import atomic_write
+from real_data_test.result_cache import dataset_fingerprint
+
+logger = logging.getLogger('xmb')
+
+# config keys the advice of TrendDealSizer depends on
+ADVICE_KEYS = ('profit_markup', 'currency_1_deal_size', 'mean_price_period')
+ADVICE_PREFIX = 'trend_'
+
+PROFILES = (None, 'UP', 'DOWN')
+
+
+def advice_times(first_tick, last_timestamp, step, period):
+    """Ticks at which InstantAdvisor refreshes the advice: the first tick and then the first tick
+    more than `period` seconds after the previous refresh, up to the last tick of the run."""
+    interval = step * (period // step + 1)
+    return np.arange(first_tick, last_timestamp + step, interval, dtype=np.int64)
+
+
+def advice_key(trades, cfg, times, cutoffs):
+    """Hash of the dataset, the advice config and the refresh schedule."""
+    h = hashlib.sha1()
+    # hashed once per trades object, also by the result cache
+    h.update(dataset_fingerprint(trades).encode('utf-8'))
+    advice_cfg = {k: v for k, v in cfg.items() if k in ADVICE_KEYS or k.startswith(ADVICE_PREFIX)}
+    h.update(json.dumps(advice_cfg, sort_keys=True).encode('utf-8'))
+    h.update(np.asarray(times, dtype=np.int64).tobytes())
+    h.update(np.asarray(cutoffs, dtype=np.int64).tobytes())
+    return h.hexdigest()
+
+
+class AdviceTimeline:
+    """Advice of a deal sizer precomputed for the refresh times of a backtest.
+
+    Advice is looked up by (timestamp, cutoff), cutoff being the timestamp of the deals provider:
+    deals with date < cutoff are visible. Lookups of other times return None.
+    """
+
+    def __init__(self, times, cutoffs, advice):
+        self._advice = {(int(t), int(c)): a for t, c, a in zip(times, cutoffs, advice)}
+
+    def __len__(self):
+        return len(self._advice)
+
+    def get_advice(self, timestamp, cutoff):
+        return self._advice.get((int(timestamp), int(cutoff)))
+
+    @classmethod
+    def build(cls, deal_sizer, trades, times, cutoffs):
+        advice = deal_sizer.get_deal_sizes(trades.column('date'), trades.column('price'), times, cutoffs)
+        return cls(times, cutoffs, advice)
+
+    @classmethod
+    def load_or_build(cls, cache_folder, deal_sizer, trades, cfg, times, cutoffs):
+        """Timeline from the cache folder, built and saved there if missing."""
+        path = os.path.join(cache_folder, 'advice-{}.npz'.format(advice_key(trades, cfg, times, cutoffs)))
+        if os.path.exists(path):
+            try:
+                return cls.load(path)
+            except Exception as e:
+                logger.exception('Cannot read advice cache {}'.format(path))
+        timeline = cls.build(deal_sizer, trades, times, cutoffs)
+        os.makedirs(cache_folder, exist_ok=True)
+        timeline.save(path)
+        return timeline
+
+    def save(self, path):
+        keys = sorted(self._advice)
+        advice = [self._advice[k] for k in keys]
+        atomic_write(path, lambda f: np.savez(
+            f,
+            times=np.array([t for t, c in keys], dtype=np.int64),
+            cutoffs=np.array([c for t, c in keys], dtype=np.int64),
+            profiles=np.array([PROFILES.index(a[0]) for a in advice], dtype=np.int8),
+            values=np.array([[np.nan if v is None else v for v in a[1:]] for a in advice],
+                            dtype=np.float64).reshape(-1, 3)), 'wb')
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            advice = []
+            for profile, values in zip(data['profiles'].tolist(), data['values'].tolist()):
+                if PROFILES[profile] is None:
+                    advice.append((None, None, None, None))
+                else:
+                    advice.append((PROFILES[profile],) + tuple(values))
+            return cls(data['times'].tolist(), data['cutoffs'].tolist(), advice)
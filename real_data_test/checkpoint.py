@@ -0,0 +1,79 @@
+import logging
+import os
+import pickle
+
+from atomic_file import atomic_write
+from real_data_test.result_cache import code_version, dataset_fingerprint, run_key
+from trade_store import COLUMNS
+
+logger = logging.getLogger('xmb')
+
+EXTENSION = '.pickle'
+
+
+def checkpoint_path(folder, cfg, trades):
+    """Checkpoint file of a run, named like its result in the result cache."""
+    return os.path.join(folder, run_key(cfg, dataset_fingerprint(trades), code_version()) + EXTENSION)
+
+
+class _Pickler(pickle.Pickler):
+    def __init__(self, f, externals):
+        super(_Pickler, self).__init__(f, pickle.HIGHEST_PROTOCOL)
+        self._ids = {id(obj): name for name, obj in externals.items()}
+
+    def persistent_id(self, obj):
+        return self._ids.get(id(obj))
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, f, externals):
+        super(_Unpickler, self).__init__(f)
+        self._externals = externals
+
+    def persistent_load(self, pid):
+        return self._externals[pid]
+
+
+class Checkpoint:
+    """State of a backtest run in one pickle file.
+
+    The state is a dict of objects (simulator, advisor, worker, ...) pickled as one graph, so objects
+    shared between them stay shared after load(). The dataset and the storage are not pickled: references
+    to them are stored by name and replaced by the trades and the storage given to the loading run,
+    and the storage content is saved with its snapshot(). The file is replaced atomically by save().
+    """
+
+    def __init__(self, path, trades, storage):
+        self.path = path
+        self._trades = trades
+        self._storage = storage
+
+    def _externals(self):
+        externals = {'trades': self._trades, 'storage': self._storage}
+        # simulator and deals providers keep the columns of the dataset
+        externals.update(('column_' + name, self._trades.column(name)) for name, dtype in COLUMNS)
+        return externals
+
+    def save(self, state):
+        def write(f):
+            pickler = _Pickler(f, self._externals())
+            pickler.dump({'dataset': dataset_fingerprint(self._trades), 'storage': self._storage.snapshot()})
+            pickler.dump(state)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        atomic_write(self.path, write, 'wb')
+        logger.info('Saved checkpoint {}'.format(self.path))
+
+    def load(self):
+        """Restores the storage and returns the state, None if there is no checkpoint."""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'rb') as f:
+            unpickler = _Unpickler(f, self._externals())
+            header = unpickler.load()
+            if header['dataset'] != dataset_fingerprint(self._trades):
+                raise ValueError('Checkpoint {} was made with another dataset'.format(self.path))
+            state = unpickler.load()
+        self._storage.restore(header['storage'])
+        logger.info('Loaded checkpoint {}'.format(self.path))
+        return state
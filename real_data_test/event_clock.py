@@ -0,0 +1,60 @@
+import math
+
+
+class EventClock:
+    """Chooses timestamps of backtest ticks on the grid of `step` seconds.
+
+    Modes:
+    'step' - every tick of the grid is run.
+    'exact' - after a tick which changed neither the simulator orders nor the advice the worker would
+    repeat the same decisions, so the clock jumps to the tick of the next event: a deal crossing a
+    resting order, an advisor refresh or max_gap seconds. Results are identical to 'step'.
+    'fast' - the clock always jumps to the next event, follow-up actions of a tick are delayed to it.
+    """
+
+    MODES = ('step', 'exact', 'fast')
+
+    def __init__(self, sim, advisor, until, step=10, max_gap=None, mode='exact'):
+        if mode not in self.MODES:
+            raise ValueError('Unknown clock mode: {}'.format(mode))
+        self._sim = sim
+        self._advisor = advisor
+        self._until = until
+        self._step = step
+        self._max_gap = max_gap
+        self._mode = mode
+        self._state = None
+        self._idle = False
+        self.ticks = 0
+
+    @property
+    def step(self):
+        return self._step
+
+    def begin_tick(self):
+        self._state = self._get_state()
+        self._idle = False
+        self.ticks += 1
+
+    def end_tick(self):
+        self._idle = self._get_state() == self._state
+
+    def _get_state(self):
+        return self._sim.version, self._advisor.last_update_ts
+
+    def next_timestamp(self, timestamp):
+        next_timestamp = timestamp + self._step
+        if self._mode == 'step' or self._mode == 'exact' and not self._idle:
+            return next_timestamp
+        # the last tick is the first one not earlier than until
+        events = [self._until - 1, self._advisor.next_update_timestamp()]
+        fill_date = self._sim.next_fill_date()
+        if fill_date is not None:
+            events.append(fill_date)
+        if self._max_gap is not None:
+            events.append(timestamp + self._max_gap - 1)
+        return max(next_timestamp, self._tick_after(timestamp, min(events)))
+
+    def _tick_after(self, timestamp, event_time):
+        # first tick of the grid later than event_time: deals dated before a tick are handled at it
+        return timestamp + self._step * (math.floor((event_time - timestamp) / self._step) + 1)
@@ -1,47 +1,103 @@
-import json
 import logging
-import os
+import math
+from bisect import bisect_left, bisect_right
+
+import numpy as np
 
 from exceptions import ApiError
+from order import Order
+from trade_store import TradeColumns, load_trades
 
 logger = logging.getLogger('xmb')
 
 
+class OrderBook:
+    """Resting orders of one side kept sorted by numeric price."""
+
+    def __init__(self):
+        self._prices = []
+        self._order_ids = []
+
+    def __len__(self):
+        return len(self._prices)
+
+    def add(self, order_id, price):
+        index = bisect_right(self._prices, price)
+        self._prices.insert(index, price)
+        self._order_ids.insert(index, order_id)
+
+    def remove(self, order_id, price):
+        index = bisect_left(self._prices, price)
+        while index < len(self._prices) and self._prices[index] == price:
+            if self._order_ids[index] == order_id:
+                del self._prices[index]
+                del self._order_ids[index]
+                return True
+            index += 1
+        return False
+
+    def pop_not_lower(self, price):
+        # orders with price >= given price (buy orders crossed by a deal)
+        index = bisect_left(self._prices, price)
+        order_ids = self._order_ids[index:]
+        del self._prices[index:]
+        del self._order_ids[index:]
+        return order_ids
+
+    def pop_lower(self, price):
+        # orders with price < given price (sell orders crossed by a deal)
+        index = bisect_left(self._prices, price)
+        order_ids = self._order_ids[:index]
+        del self._prices[:index]
+        del self._order_ids[:index]
+        return order_ids
+
+    def min_price(self):
+        return self._prices[0] if self._prices else math.inf
+
+    def max_price(self):
+        return self._prices[-1] if self._prices else -math.inf
+
+
 class MarketSimulator:
     def __init__(self, folder, initial_btc_balance, initial_usd_balance,
-                 stock_fee, initial_timestamp=None, last_deals=100):
+                 stock_fee, initial_timestamp=None, last_deals=100, deals=None):
         self.balances = {'BTC': initial_btc_balance, 'USD': initial_usd_balance}
         self.initial_balances = {'BTC': initial_btc_balance, 'USD': initial_usd_balance}
         self.balances_in_orders = {'BTC': 0, 'USD': 0}
         self.stock_fee = stock_fee
         self.index = 0
         self.orders = {}
+        self._buy_orders = OrderBook()
+        self._sell_orders = OrderBook()
         self.order_id = 0
-        self.deals = self.read_data(folder)
+        # already loaded trades can be shared between simulators
+        if deals is None:
+            deals = self.read_data(folder)
+        elif not isinstance(deals, TradeColumns):
+            deals = TradeColumns.from_deals(deals)
+        self.trades = deals
+        self._dates = deals.column('date')
+        self._prices = deals.column('price')
         self._set_initial_timestamp(initial_timestamp)
         self._last_deals = last_deals
         self._trades = []
         self.max_balances = {'USD': 0, 'BTC': 0}
+        # incremented on every order change, lets the backtest clock detect idle ticks
+        self.version = 0
 
 
     def _set_initial_timestamp(self, initial_timestamp):
         if initial_timestamp is None:
-            self.timestamp = int(self.deals[0]['date'])
+            self.timestamp = int(self._dates[0])
         else:
             self.timestamp = initial_timestamp
         while self.index < 101:
             self.update_timestamp(self.timestamp + 1)
 
-    def read_data(self, folder):
-        deals = {}
-        for filename in os.listdir(folder):
-            with open(os.path.join(folder, filename)) as f:
-                try:
-                    d = json.load(f)
-                    deals.update(d)
-                except:
-                    pass
-        return sorted(deals.values(), key=lambda v: (int(v['date']), int(v['trade_id'])))
+    @staticmethod
+    def read_data(folder, shared=False):
+        return load_trades(folder, shared)
 
     def get_open_orders(self, currency_1, currency_2):
         return self.orders.values()
@@ -52,15 +108,17 @@ class MarketSimulator:
     def cancel_order(self, order_id):
         logger.debug('{}: Cancel order {}'.format(self.timestamp, order_id))
         order = self.orders[order_id]
-        if order['type'] == 'buy':
-            amount = float(order['price']) * float(order['quantity'])
+        if order.type == 'buy':
+            amount = order.price * order.quantity
             self.balances['USD'] += amount
             self.balances_in_orders['USD'] -= amount
-        elif order['type'] == 'sell':
-            amount = float(order['quantity'])
+        elif order.type == 'sell':
+            amount = order.quantity
             self.balances['BTC'] += amount
             self.balances_in_orders['BTC'] -= amount
+        self._get_book(order.type).remove(order_id, order.price)
         self.orders.pop(order_id)
+        self.version += 1
 
     def get_balances(self):
         return self.balances
@@ -88,67 +146,115 @@ class MarketSimulator:
                 self.max_balances['BTC'] = btc_diff
             # self.balances['USD'] += quantity * price * (1 - self.stock_fee)
         self.order_id += 1
-        self.orders[str(self.order_id)] = {'order_id': str(self.order_id), 'type': type, 'quantity': str(quantity),
-                                           'price': str(price), 'date': self.timestamp, 'trade_id': str(self.order_id)}
+        order = Order(order_id=str(self.order_id), type=type, quantity=quantity, price=price, date=self.timestamp,
+                      trade_id=str(self.order_id))
+        self.orders[order.order_id] = order
+        book = self._get_book(type)
+        if book is not None:
+            book.add(order.order_id, order.price)
+        self.version += 1
         return str(self.order_id)
 
+    def _get_book(self, order_type):
+        if order_type == 'buy':
+            return self._buy_orders
+        if order_type == 'sell':
+            return self._sell_orders
+        return None
+
     def update_timestamp(self, timestamp):
         self.timestamp = timestamp
-        new_deals = []
-        while int(self.deals[self.index]['date']) < timestamp:
-            new_deals.append(self.deals[self.index])
-            self.index += 1
-        self._handle_deals(new_deals)
+        stop = int(np.searchsorted(self._dates, timestamp, side='left'))
+        orders_to_complete = []
+        # only deals crossing a resting order are checked one by one
+        index = self._find_crossing(self.index, stop)
+        while index < stop:
+            orders_to_complete.extend(self._check_deal(float(self._prices[index])))
+            index = self._find_crossing(index + 1, stop)
+        self.index = stop
+        self._complete_orders(orders_to_complete)
+
+    def _find_crossing(self, start, stop):
+        """Index of the first deal in [start, stop) crossing a resting order, stop if there is none."""
+        if not self._buy_orders and not self._sell_orders:
+            return stop
+        max_buy_price = self._buy_orders.max_price()
+        min_sell_price = self._sell_orders.min_price()
+        chunk = 1024
+        while start < stop:
+            end = min(stop, start + chunk)
+            prices = self._prices[start:end]
+            crossing = np.flatnonzero((prices <= max_buy_price) | (prices > min_sell_price))
+            if len(crossing):
+                return start + int(crossing[0])
+            start = end
+            chunk *= 2
+        return stop
+
+    def next_fill_date(self):
+        """Date of the next deal crossing a resting order, None if no deal crosses them."""
+        index = self._find_crossing(self.index, len(self._dates))
+        if index == len(self._dates):
+            return None
+        return int(self._dates[index])
 
     def get_timestamp(self):
         return self.timestamp
 
     def get_max_timestamp(self):
-        return int(self.deals[-1]['date'])
+        return int(self._dates[-1])
 
     def get_user_trades(self, currency_1, currency_2, offset=0, limit=100):
         return self._trades
 
     def get_trades(self, currency_1, currency_2):
-        return self.deals[self.index - self._last_deals:self.index - 1]
+        return self.trades.slice_deals(self.index - self._last_deals, self.index - 1)
+
+    def get_deals(self, since=None, until=None):
+        return self.trades.slice_deals(*self._get_range(since, until))
+
+    def get_deal_arrays(self, since=None, until=None):
+        start, stop = self._get_range(since, until)
+        return self._dates[start:stop], self._prices[start:stop]
+
+    def _get_range(self, since, until):
+        # deals after the current timestamp are not visible
+        start, stop = self.trades.get_range(since, until)
+        return start, min(stop, self.index)
 
-    def _handle_deals(self, new_deals):
-        orders_to_complete = set()
-        for deal in new_deals:
-            orders_to_complete.update(self._check_deal(deal))
+    def _complete_orders(self, orders_to_complete):
         if orders_to_complete:
             for order_id in orders_to_complete:
                 self._complete_order(self.orders[order_id])
             logger.debug('{}: Balance: {}'.format(self.timestamp, self.balances))
 
-    def _check_deal(self, deal):
-        orders_to_complete = set()
-        for order_id, order in self.orders.items():
-            if order['type'] == 'buy':
-                if float(deal['price']) <= float(order['price']):
-                    orders_to_complete.add(order_id)
-            elif order['type'] == 'sell':
-                if float(deal['price']) > float(order['price']):
-                    orders_to_complete.add(order_id)
+    def _check_deal(self, price):
+        # Crossed orders are taken out of the books, so every order is returned once per batch
+        orders_to_complete = []
+        if self._buy_orders:
+            orders_to_complete.extend(self._buy_orders.pop_not_lower(price))
+        if self._sell_orders:
+            orders_to_complete.extend(self._sell_orders.pop_lower(price))
         return orders_to_complete
 
     def _complete_order(self, order):
         logger.info('{}: Complete {} order {}'.format(self.timestamp, order['type'], order['order_id']))
-        if order['type'] == 'buy':
-            withdrawed = float(order['quantity'])
+        if order.type == 'buy':
+            withdrawed = order.quantity
             got = withdrawed * (1 - self.stock_fee)
             logger.info('Amount: {} BTC'.format(got))
             self.balances['BTC'] += got
-            self.balances_in_orders['USD'] -= float(order['price']) * float(order['quantity'])
-        elif order['type'] == 'sell':
-            quantity = float(order['quantity'])
-            withdrawed = quantity * float(order['price'])
+            self.balances_in_orders['USD'] -= order.price * order.quantity
+        elif order.type == 'sell':
+            quantity = order.quantity
+            withdrawed = quantity * order.price
             got = withdrawed * (1 - self.stock_fee)
             self.balances['USD'] += got
             self.balances_in_orders['BTC'] -= quantity
             logger.info('Amount: {} USD'.format(got))
         self.orders.pop(order['order_id'])
         self._trades.append(order)
+        self.version += 1
         logger.info(
             '{}: Balance: BTC: {:.6f}, USD: {:.2f}'.format(self.timestamp, self.balances['BTC'], self.balances['USD']))
         logger.info('{}: Balance (with orders): BTC: {:.6f}, USD: {:.2f}'.format(self.timestamp, self.balances['BTC']
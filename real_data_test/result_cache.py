@@ -0,0 +1,147 @@
+import argparse
+import functools
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import weakref
+
+import numpy as np
+
+from atomic_file import atomic_write
+from trade_store import COLUMNS
+
+logger = logging.getLogger('xmb')
+
+INDEX_FILE = 'index.ndjson'
+RESULT_FILES = ('stats.json', 'ok_deals.json')
+
+# config keys naming caches and output locations, they do not change results of a run
+IGNORED_KEYS = ('advice_cache', 'result_cache', 'checkpoint_folder', 'checkpoint_interval', 'metrics_file',
+                'metrics_period')
+
+_fingerprints = weakref.WeakKeyDictionary()
+
+
+def dataset_fingerprint(trades):
+    """Hash of all trade columns, computed once per trades object."""
+    if trades not in _fingerprints:
+        h = hashlib.sha1()
+        for name, dtype in COLUMNS:
+            h.update(np.ascontiguousarray(trades.column(name)).tobytes())
+        _fingerprints[trades] = h.hexdigest()
+    return _fingerprints[trades]
+
+
+@functools.lru_cache()
+def code_version():
+    """Hash of the sources of the bot and the simulator: results of older code are not reused."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    h = hashlib.sha1()
+    paths = glob.glob(os.path.join(root, '*.py')) + glob.glob(os.path.join(root, 'real_data_test', '*.py'))
+    for path in sorted(paths):
+        h.update(os.path.relpath(path, root).encode('utf-8'))
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def run_key(cfg, fingerprint, version):
+    h = hashlib.sha1()
+    h.update(json.dumps({k: v for k, v in cfg.items() if k not in IGNORED_KEYS}, sort_keys=True).encode('utf-8'))
+    h.update(fingerprint.encode('utf-8'))
+    h.update(version.encode('utf-8'))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Results of backtest runs stored by the hash of the config, the dataset and the code version.
+
+    Each run is a folder <key> with stats.json and ok_deals.json. Stored runs are also appended to
+    index.ndjson (one json line per run with key, cfg and stats), which find() queries without
+    reading the run folders. Several processes of a sweep can store runs in the same cache.
+    """
+
+    def __init__(self, folder, version=None):
+        self._folder = folder
+        self._version = version if version is not None else code_version()
+        os.makedirs(folder, exist_ok=True)
+
+    def get_key(self, cfg, trades):
+        return run_key(cfg, dataset_fingerprint(trades), self._version)
+
+    def _run_folder(self, key):
+        return os.path.join(self._folder, key)
+
+    def __contains__(self, key):
+        return all(os.path.exists(os.path.join(self._run_folder(key), name)) for name in RESULT_FILES)
+
+    def get(self, key):
+        """Returns (ok_deals, stats) of a stored run or None."""
+        if key not in self:
+            return None
+        with open(os.path.join(self._run_folder(key), 'ok_deals.json')) as f:
+            ok_deals = json.load(f)
+        with open(os.path.join(self._run_folder(key), 'stats.json')) as f:
+            stats = json.load(f)
+        return ok_deals, stats
+
+    def copy_to(self, key, folder):
+        for name in RESULT_FILES:
+            shutil.copyfile(os.path.join(self._run_folder(key), name), os.path.join(folder, name))
+
+    def put(self, key, cfg, ok_deals, stats):
+        if key in self:
+            # stored by another process meanwhile
+            return
+        # a run is stored when all its result files exist, each of them is complete or missing
+        os.makedirs(self._run_folder(key), exist_ok=True)
+        for name, obj in (('ok_deals.json', ok_deals), ('stats.json', stats)):
+            atomic_write(os.path.join(self._run_folder(key), name), lambda f: json.dump(obj, f, indent=4))
+        entry = {'key': key, 'version': self._version,
+                 'cfg': {k: v for k, v in cfg.items() if k not in IGNORED_KEYS}, 'stats': stats}
+        # one write of a line in append mode, lines of concurrent writers do not interleave
+        with open(os.path.join(self._folder, INDEX_FILE), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def entries(self):
+        """Index entries of stored runs, the last entry of a key wins."""
+        entries = {}
+        path = os.path.join(self._folder, INDEX_FILE)
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    # partially written by a killed process
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning('Invalid result index line: {}'.format(line.strip()))
+                    continue
+                entries[entry['key']] = entry
+        return list(entries.values())
+
+    def find(self, all_versions=False, **params):
+        """Entries of runs whose config has the given values, by default only runs of the current code."""
+        return [e for e in self.entries() if (all_versions or e['version'] == self._version) and
+                all(k in e['cfg'] and e['cfg'][k] == v for k, v in params.items())]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Print stored backtest results matching config values')
+    parser.add_argument('folder', type=str, help='Result cache folder')
+    parser.add_argument('params', nargs='*', help='<key>=<json value>, e.g. profit_markup=0.03')
+    parser.add_argument('--all-versions', action='store_true', help='include runs of other code versions')
+    sysargs = parser.parse_args()
+    cache = ResultCache(sysargs.folder)
+    params = {}
+    for param in sysargs.params:
+        name, value = param.split('=', 1)
+        params[name] = json.loads(value)
+    for entry in cache.find(sysargs.all_versions, **params):
+        print(json.dumps({'cfg': entry['cfg'], 'stats': entry['stats']}))
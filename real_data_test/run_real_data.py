@@ -4,6 +4,8 @@ import logging
 import os
 from datetime import datetime
 
+import numpy as np
+
 from calc import Calc
 from json_api import JsonStorage
 from trend_deal_sizer import TrendDealSizer
@@ -11,7 +13,12 @@ from trend_deal_sizer import TrendDealSizer
 logging.basicConfig(level=logging.INFO)
 
 from exmo_general import Worker
+from metrics import Metrics, MetricsReporter, instrument, instrument_worker
+from real_data_test.advice_timeline import AdviceTimeline, advice_times
+from real_data_test.checkpoint import Checkpoint, checkpoint_path
+from real_data_test.event_clock import EventClock
 from real_data_test.market_simulator import MarketSimulator
+from real_data_test.result_cache import IGNORED_KEYS, ResultCache
 from trend_analyze import TrendAnalyzer
 from logging.handlers import RotatingFileHandler
 
@@ -68,11 +75,26 @@ def get_stats(sim, storage, stock_fee):
     # return stat
 
 
-def run(cfg, base_folder, handlers):
+def get_run_folder(cfg, base_folder):
+    folder = ''
+    for k in sorted(cfg):
+        if k in IGNORED_KEYS:
+            continue
+        names = k.split('_')
+        for n in names:
+            folder += n[0]
+        folder += '_'
+        # paths (fork_checkpoint) are named by their file
+        folder += os.path.basename(str(cfg[k]))
+        folder += '_'
+    return os.path.join(base_folder, folder)
+
+
+def run(cfg, base_folder, handlers, deals=None):
     sim = MarketSimulator('datasets3', initial_btc_balance=1,
                           initial_usd_balance=10000,
                           stock_fee=cfg['stock_fee'], last_deals=cfg['last_deals'],
-                          initial_timestamp=cfg['initial_timestamp'])
+                          initial_timestamp=cfg['initial_timestamp'], deals=deals)
     timestamp = sim.get_timestamp()
     if 'duration_days' in cfg and cfg['duration_days'] is not None:
         last_timestamp = timestamp + cfg['duration_days'] * 24 * 60 * 60
@@ -83,15 +105,7 @@ def run(cfg, base_folder, handlers):
         cfg[
             'last_timestamp']
 
-    folder = ''
-    for k in sorted(cfg):
-        names = k.split('_')
-        for n in names:
-            folder += n[0]
-        folder += '_'
-        folder += str(cfg[k])
-        folder += '_'
-    run_folder = os.path.join(base_folder, folder)
+    run_folder = get_run_folder(cfg, base_folder)
     shutil.rmtree(run_folder, ignore_errors=True)
     os.makedirs(run_folder, exist_ok=True)
 
@@ -99,6 +113,15 @@ def run(cfg, base_folder, handlers):
     for h in handlers:
         logger.removeHandler(h)
 
+    result_cache = None
+    if 'result_cache' in cfg and cfg['result_cache'] is not None:
+        result_cache = ResultCache(cfg['result_cache'])
+        result_key = result_cache.get_key(cfg, sim.trades)
+        if result_key in result_cache:
+            logger.info('Results of {} are reused from {}'.format(run_folder, cfg['result_cache']))
+            result_cache.copy_to(result_key, run_folder)
+            return []
+
     logs_dir = os.path.join(run_folder, 'logs')
     os.makedirs(logs_dir)
     handlers = create_handlers(logs_dir)
@@ -106,16 +129,30 @@ def run(cfg, base_folder, handlers):
     os.makedirs(archive_dir)
 
     # storage = SQLiteStorage(os.path.join(run_folder, 'test.db'))
-    storage = JsonStorage(os.path.join(run_folder, 'orders.json'), archive_dir)
+    storage = JsonStorage(os.path.join(run_folder, 'orders.json'), archive_dir, journal=True)
+
+    checkpoint, state = load_checkpoint(cfg, sim.trades, storage)
+    if state is not None:
+        sim, deal_provider, timestamp = state['sim'], state['deal_provider'], state['timestamp']
+        sim.stock_fee = cfg['stock_fee']
+    else:
+        deal_provider = DealsProvider(sim.trades)
 
     ta = TrendAnalyzer(**cfg)
     ta._current_time = lambda: sim.timestamp
 
-    deal_provider = DealsProvider(sim.deals)
     ds = TrendDealSizer(deal_provider, **cfg)
-    ds._get_time = lambda: sim.timestamp
-
-    advisor = InstantAdvisor(sim, ds)
+    ds._get_time = sim.get_timestamp
+
+    step = 10
+    advisor = InstantAdvisor(deal_provider, ds)
+    if 'advice_cache' in cfg and cfg['advice_cache'] is not None:
+        # advice of the run is computed at once, shared by runs with the same dataset and trend config
+        times = advice_times(timestamp + step, last_timestamp, step, advisor.period)
+        # deals provider is updated after the advisor: a tick sees the deals before the previous tick
+        cutoffs = times - step
+        cutoffs[0] = deal_provider.timestamp
+        advisor.timeline = AdviceTimeline.load_or_build(cfg['advice_cache'], ds, sim.trades, cfg, times, cutoffs)
     # ds = ConstDealSizer(**cfg)
 
 
@@ -123,35 +160,103 @@ def run(cfg, base_folder, handlers):
 
     worker = Worker(sim, storage, advisor,
                     **cfg)
-    worker._get_time = lambda: sim.timestamp
-    worker._is_order_partially_completed = lambda x, y: False
-    worker._is_order_in_trades = lambda x, y: True
+    # methods and module functions instead of lambdas: the worker is pickled by checkpoints
+    worker._get_time = sim.get_timestamp
+    worker._is_order_partially_completed = _is_order_partially_completed
+    worker._is_order_in_trades = _is_order_in_trades
     worker._check_balances = sim.check_balances
+    clock = EventClock(sim, advisor, last_timestamp, step=step,
+                       mode=cfg['clock_mode'] if 'clock_mode' in cfg else 'exact',
+                       max_gap=cfg['clock_max_gap'] if 'clock_max_gap' in cfg else None)
+    if state is not None and 'worker' in state:
+        # resumed run, forked runs continue with the bot of their own config
+        advisor, worker, clock = state['advisor'], state['worker'], state['clock']
+    reporter = None
+    if 'metrics_file' in cfg and cfg['metrics_file'] is not None:
+        # latencies of tick phases, simulator, storage and advisor calls
+        metrics = Metrics()
+        instrument_worker(worker, metrics)
+        instrument(advisor._ta, ('get_deal_size',), metrics, 'advisor')
+        reporter = MetricsReporter(metrics, cfg['metrics_period'] if 'metrics_period' in cfg else 60,
+                                   os.path.join(run_folder, cfg['metrics_file']))
+    checkpoint_interval = cfg['checkpoint_interval'] if 'checkpoint_interval' in cfg else 24 * 60 * 60
+    last_checkpoint = timestamp
     while timestamp < last_timestamp:
         try:
-            timestamp += 10
+            previous_timestamp = timestamp
+            timestamp = clock.next_timestamp(timestamp)
             logger.debug('Update timestamp: {}'.format(timestamp))
+            clock.begin_tick()
             sim.update_timestamp(timestamp)
+            if timestamp - previous_timestamp > clock.step:
+                # the advisor sees deals up to the previous tick of the grid, as without skipped ticks
+                deal_provider.update_timestamp(timestamp - clock.step)
             advisor.update_timestamp(timestamp)
             deal_provider.update_timestamp(timestamp)
             worker.main_flow()
+            clock.end_tick()
+            if checkpoint is not None and timestamp - last_checkpoint >= checkpoint_interval:
+                checkpoint.save(get_state(timestamp, sim, deal_provider, advisor, worker, clock))
+                last_checkpoint = timestamp
+            if reporter is not None:
+                reporter.maybe_report()
             # if timestamp - last_stat_timestamp >= 1000:
             #     logger.info('Stats: {}'.format(get_stats(sim, storage, worker._stock_fee)))
             #     last_stat_timestamp = timestamp
         except:
             logger.exception('Exception')
 
+    if checkpoint is not None:
+        # the state at the end of the run can be forked by runs continuing after last_timestamp
+        checkpoint.save(get_state(timestamp, sim, deal_provider, advisor, worker, clock))
+    storage.compact()
     ok_deals, stat = get_stats(sim, storage, worker._stock_fee)
     stat['BTC_max'] = sim.max_balances['BTC']
     stat['USD_max'] = sim.max_balances['USD']
-    logger.info('Finished.\n{}'.format(stat))
+    logger.info('Finished in {} ticks.\n{}'.format(clock.ticks, stat))
+    if reporter is not None:
+        reporter.report()
     with open(os.path.join(run_folder, 'stats.json'), 'w') as f:
         json.dump(stat, f, indent=4)
     with open(os.path.join(run_folder, 'ok_deals.json'), 'w') as f:
         json.dump(ok_deals, f, indent=4)
+    if result_cache is not None:
+        result_cache.put(result_key, cfg, ok_deals, stat)
     return handlers
 
 
+def load_checkpoint(cfg, trades, storage):
+    """Returns the checkpoint saved by the run (None without checkpoint_folder) and the state to continue from.
+
+    The state is the last checkpoint of the run, or else the market state (simulator and deals provider)
+    of the fork_checkpoint file saved by another run, or None.
+    """
+    checkpoint = None
+    state = None
+    if 'checkpoint_folder' in cfg and cfg['checkpoint_folder'] is not None:
+        checkpoint = Checkpoint(checkpoint_path(cfg['checkpoint_folder'], cfg, trades), trades, storage)
+        state = checkpoint.load()
+    if state is None and 'fork_checkpoint' in cfg and cfg['fork_checkpoint'] is not None:
+        state = Checkpoint(cfg['fork_checkpoint'], trades, storage).load()
+        if state is None:
+            raise ValueError('No checkpoint {}'.format(cfg['fork_checkpoint']))
+        state = {k: state[k] for k in ('timestamp', 'sim', 'deal_provider')}
+    return checkpoint, state
+
+
+def get_state(timestamp, sim, deal_provider, advisor, worker, clock):
+    return {'timestamp': timestamp, 'sim': sim, 'deal_provider': deal_provider, 'advisor': advisor,
+            'worker': worker, 'clock': clock}
+
+
+def _is_order_partially_completed(order, traded_order_ids):
+    return False
+
+
+def _is_order_in_trades(order, traded_order_ids):
+    return True
+
+
 def run_many(cfg, base_folder, handlers):
     if 'delta_days' not in cfg or cfg['delta_days'] is None:
         run(cfg, base_folder, handlers)
@@ -178,12 +283,14 @@ def create_handlers(dr):
     return [debug_handler, info_handler, error_handler]
 
 class InstantAdvisor:
-    def __init__(self, deal_provider, trend_analyzer):
+    def __init__(self, deal_provider, trend_analyzer, timeline=None):
         self._ta = trend_analyzer
         self._deal_provider = deal_provider
         self.period = 900
         self.timestamp = 0
         self.last_update_ts = 0
+        # precomputed advice (AdviceTimeline), looked up before computing it
+        self.timeline = timeline
 
     def get_advice(self):
         return self.profile, self.profit_markup, self.avg_price, self.deal_size
@@ -193,25 +300,42 @@ class InstantAdvisor:
 
     def update_timestamp(self, timestamp):
         if timestamp - self.last_update_ts > self.period:
-            self.profile, self.profit_markup, self.avg_price, self.deal_size = self._ta.get_deal_size(
-            )
+            advice = None
+            if self.timeline is not None:
+                advice = self.timeline.get_advice(timestamp, self._deal_provider.timestamp)
+            if advice is None:
+                advice = self._ta.get_deal_size()
+            self.profile, self.profit_markup, self.avg_price, self.deal_size = advice
             self.last_update_ts = timestamp
 
+    def next_update_timestamp(self):
+        # advice is refreshed at the first timestamp later than this
+        return self.last_update_ts + self.period
+
 
 class DealsProvider:
-    def __init__(self, all_deals):
-        self.all_deals = all_deals
+    def __init__(self, trades):
+        self.trades = trades
+        self.dates = trades.column('date')
+        self.prices = trades.column('price')
         self.timestamp = 0
-        self.cur_deals = []
         self.index = 0
 
     def update_timestamp(self, timestamp):
         self.timestamp = timestamp
-        while int(self.all_deals[self.index]['date']) < timestamp:
-            self.index += 1
+        self.index = int(np.searchsorted(self.dates, timestamp, side='left'))
+
+    def get_deals(self, since=None, until=None):
+        return self.trades.slice_deals(*self._get_range(since, until))
 
-    def get_deals(self):
-        return self.all_deals[:self.index]
+    def get_deal_arrays(self, since=None, until=None):
+        start, stop = self._get_range(since, until)
+        return self.dates[start:stop], self.prices[start:stop]
+
+    def _get_range(self, since, until):
+        # deals after the current timestamp are not visible
+        start, stop = self.trades.get_range(since, until)
+        return start, min(stop, self.index)
 
 
 args = {
@@ -267,15 +391,30 @@ cfgs = [
     },
 ]
 
-d = [list(zip(itertools.repeat(arg, len(values)), values)) for arg, values in args.items()]
-product = list(itertools.product(*d))
-configs = [dict(cfg) for cfg in product]
-handlers = []
-for cfg in cfgs:
-    try:
-        handlers = run_many(cfg, 'test_5_30_pm_003', handlers)
-    except:
-        logger.exception('Error')
+
+def product_configs(args):
+    d = [list(zip(itertools.repeat(arg, len(values)), values)) for arg, values in args.items()]
+    product = list(itertools.product(*d))
+    return [dict(cfg) for cfg in product]
+
+
+def split_windows(cfg):
+    """Configs of the runs made by run_many for the config."""
+    if 'delta_days' not in cfg or cfg['delta_days'] is None:
+        return [dict(cfg)]
+    delta_seconds = cfg['delta_days'] * 24 * 60 * 60
+    return [dict(cfg, initial_timestamp=i) for i in range(cfg['initial_timestamp'], cfg['last_timestamp'],
+                                                          delta_seconds)]
+
+
+if __name__ == '__main__':
+    configs = product_configs(args)
+    handlers = []
+    for cfg in cfgs:
+        try:
+            handlers = run_many(cfg, 'test_5_30_pm_003', handlers)
+        except:
+            logger.exception('Error')
 
 
 
@@ -0,0 +1,172 @@
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from atomic_file import atomic_write
+from real_data_test.market_simulator import MarketSimulator
+from real_data_test.result_cache import ResultCache, IGNORED_KEYS
+from real_data_test.run_real_data import run, get_run_folder, split_windows, product_configs, args, cfgs
+from trade_store import SharedTrades
+
+logger = logging.getLogger('xmb')
+
+RESULTS_FILE = 'results.csv'
+
+# trades of the dataset, published once by the parent process and attached by the workers
+_trades = None
+
+
+def _set_trades(trades):
+    global _trades
+    _trades = trades
+
+
+def _run_task(cfg, base_folder):
+    handlers = run(cfg, base_folder, [], deals=_trades)
+    if handlers is None:
+        # window exceeds the dataset
+        return cfg, None
+    for h in handlers:
+        logger.removeHandler(h)
+        h.close()
+    with open(os.path.join(get_run_folder(cfg, base_folder), 'stats.json')) as f:
+        return cfg, json.load(f)
+
+
+class ResultsTable:
+    """Results of the sweep runs, one row per run, appended to a csv file as runs finish.
+
+    Rows of an existing file are loaded, so a sweep started again in the same folder adds only the runs
+    missing there. Columns keep the order of the file header, and the file is rewritten when a run brings
+    new columns.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._columns = []
+        self.rows = []
+        if os.path.exists(path):
+            with open(path, newline='') as f:
+                reader = csv.DictReader(f)
+                self._columns = list(reader.fieldnames or [])
+                self.rows = list(reader)
+        self._run_folders = {row.get('run_folder') for row in self.rows}
+
+    def _get_run_folder(self, cfg):
+        return os.path.basename(get_run_folder(cfg, os.path.dirname(self._path)))
+
+    def __contains__(self, cfg):
+        return self._get_run_folder(cfg) in self._run_folders
+
+    def add(self, cfg, stat):
+        """Adds the row of a run, returns False if the table already has it."""
+        run_folder = self._get_run_folder(cfg)
+        if run_folder in self._run_folders:
+            return False
+        # caches and output locations given to the runs are not results
+        row = {'run_folder': run_folder}
+        row.update((k, v) for k, v in sorted(cfg.items()) if k not in IGNORED_KEYS)
+        row.update(('stat_' + str(k), v) for k, v in sorted(stat.items()))
+        self.rows.append(row)
+        self._run_folders.add(run_folder)
+        new_columns = [k for k in row if k not in self._columns]
+        if new_columns or not os.path.exists(self._path):
+            self._columns.extend(new_columns)
+            self._write_all()
+        else:
+            with open(self._path, 'a', newline='') as f:
+                csv.DictWriter(f, fieldnames=self._columns).writerow(row)
+        return True
+
+    def _write_all(self):
+        def write(f):
+            writer = csv.DictWriter(f, fieldnames=self._columns)
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+        atomic_write(self._path, write, newline='')
+
+
+def run_sweep(configs, base_folder, dataset_folder='datasets3', max_workers=None, result_cache=None,
+              checkpoint_folder=None):
+    """Runs all configs and their time windows in a process pool.
+
+    The dataset is read once: its columns are memory mapped from a trade store or published in
+    shared memory, and workers attach numpy views of them, so memory does not grow with max_workers.
+    With a result_cache folder, runs stored there are not run again and new runs are stored.
+    With a checkpoint_folder, runs save checkpoints there and a sweep started again resumes them.
+    Returns the results table.
+    """
+    os.makedirs(base_folder, exist_ok=True)
+    tasks = [window_cfg for cfg in configs for window_cfg in split_windows(cfg)]
+    if checkpoint_folder is not None:
+        tasks = [dict(cfg, checkpoint_folder=checkpoint_folder) for cfg in tasks]
+    trades = MarketSimulator.read_data(dataset_folder, shared=True)
+    results = ResultsTable(os.path.join(base_folder, RESULTS_FILE))
+    new_tasks = [cfg for cfg in tasks if cfg not in results]
+    logger.info('{} of {} runs are in {}'.format(len(tasks) - len(new_tasks), len(tasks), RESULTS_FILE))
+    tasks = new_tasks
+    if result_cache is not None:
+        tasks = _add_cached(tasks, base_folder, result_cache, trades, results)
+    if 'fork' in multiprocessing.get_all_start_methods():
+        _set_trades(trades)
+        pool = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('fork'))
+    else:
+        pool = ProcessPoolExecutor(max_workers, initializer=_set_trades, initargs=(trades,))
+
+    try:
+        with pool:
+            _collect(pool, tasks, base_folder, results)
+    finally:
+        _set_trades(None)
+        if isinstance(trades, SharedTrades):
+            trades.unlink()
+    return results
+
+
+def _add_cached(tasks, base_folder, cache_folder, trades, results):
+    # stored runs go to the results table at once, only the others are submitted to the pool
+    cache = ResultCache(cache_folder)
+    new_tasks = []
+    for cfg in tasks:
+        key = cache.get_key(cfg, trades)
+        cached = cache.get(key)
+        if cached is None:
+            new_tasks.append(dict(cfg, result_cache=cache_folder))
+        else:
+            run_folder = get_run_folder(cfg, base_folder)
+            os.makedirs(run_folder, exist_ok=True)
+            cache.copy_to(key, run_folder)
+            results.add(cfg, cached[1])
+    logger.info('{} of {} runs are cached'.format(len(tasks) - len(new_tasks), len(tasks)))
+    return new_tasks
+
+
+def _collect(pool, tasks, base_folder, results):
+    futures = [pool.submit(_run_task, cfg, base_folder) for cfg in tasks]
+    for finished, future in enumerate(as_completed(futures), 1):
+        try:
+            cfg, stat = future.result()
+        except Exception:
+            logger.exception('Run failed')
+            continue
+        if stat is not None:
+            results.add(cfg, stat)
+        logger.info('Finished {} of {} runs'.format(finished, len(tasks)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run backtest configs in parallel')
+    parser.add_argument('base_folder')
+    parser.add_argument('--dataset', default='datasets3')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--grid', action='store_true', help='run the args grid instead of cfgs')
+    parser.add_argument('--result-cache', default=None, help='folder of results reused between sweeps')
+    parser.add_argument('--checkpoint-folder', default=None, help='folder of checkpoints of interrupted runs')
+    a = parser.parse_args()
+    run_sweep(product_configs(args) if a.grid else cfgs, a.base_folder, a.dataset, a.workers, a.result_cache,
+              a.checkpoint_folder)
@@ -0,0 +1,117 @@
+import argparse
+import json
+import logging
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from trade_store import load_trades
+
+logger = logging.getLogger('xmb')
+
+
+class ReplayClock:
+    """Replay time running `speed` times faster than the wall clock from `start`."""
+
+    def __init__(self, start, speed=1.0):
+        self._start = start
+        self._speed = speed
+        self._started = time.monotonic()
+
+    def __call__(self):
+        return self._start + (time.monotonic() - self._started) * self._speed
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        self._answer(url.path, urllib.parse.parse_qs(url.query))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        self._answer(urllib.parse.urlsplit(self.path).path, urllib.parse.parse_qs(body))
+
+    def _answer(self, path, params):
+        if path.rstrip('/').endswith('/trades'):
+            pairs = params.get('pair', [''])[0].split(',')
+            obj = {pair: self.server.replay.get_trades(pair) for pair in pairs}
+        else:
+            obj = {'result': False, 'error': 'Error 40005: Unknown method {}'.format(path)}
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer:
+    """Local http server answering exmo `trades` requests from recorded trades.
+
+    A request returns the last `limit` trades with date <= clock(), the newest first like exmo.
+    clock defaults to a ReplayClock starting at the first recorded trade; tests can pass any callable.
+    trades is TradeColumns (see trade_store.load_trades) of the pair `pair`.
+    """
+
+    def __init__(self, trades, pair='BTC_USD', clock=None, speed=1.0, limit=100, host='127.0.0.1', port=0):
+        self._trades = trades
+        self._pair = pair
+        self._dates = trades.column('date')
+        if clock is None:
+            clock = ReplayClock(int(self._dates[0]) if len(trades) else 0, speed)
+        self._clock = clock
+        self._limit = limit
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.replay = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def get_trades(self, pair):
+        if pair != self._pair:
+            return []
+        start, stop = self._trades.get_range(until=self._clock())
+        trades = self._trades.slice_deals(max(start, stop - self._limit), stop)
+        trades.reverse()
+        for trade in trades:
+            trade['pair'] = pair
+        return trades
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Serve recorded trades as exmo trades endpoint')
+    parser.add_argument('folder', type=str, help='Trade store or folder with json trade dumps')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--speed', type=float, default=1.0)
+    parser.add_argument('--pair', type=str, default='BTC_USD')
+    sysargs = parser.parse_args()
+    server = ReplayServer(load_trades(sysargs.folder), pair=sysargs.pair, speed=sysargs.speed, port=sysargs.port)
+    logger.info('Replay server listening on {}'.format(server.address))
+    server.start()
+    server._thread.join()
@@ -0,0 +1,125 @@
+import math
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from trade_store import deals_to_arrays
+
+
+class RollingMeanIndicator:
+    """Incremental rolling mean of deal prices over the last `window` deals.
+
+    New deals are consumed with update()/update_arrays(); the rolling mean is kept in a ring buffer with a
+    running sum. Rolling means of the last `history_seconds` are kept to answer queries about the past.
+    Queries accept `since`: a mean whose window contains a deal with date <= since is NaN, the same as
+    a rolling mean computed over the deals with date > since only.
+    """
+
+    def __init__(self, window, history_seconds):
+        self._window = window
+        self._history_seconds = history_seconds
+        self._ring_prices = [0.0] * window
+        self._ring_dates = [0] * window
+        self._pos = 0
+        self._count = 0
+        self._sum = 0.0
+        self._added = 0
+        # history of deals with rolling means and dates of the first deal of their window
+        self._dates = []
+        self._prices = []
+        self._means = []
+        self._window_starts = []
+        self._offset = 0
+        self._last_date = None
+        self._last_date_count = 0
+
+    @property
+    def last_date(self):
+        return self._last_date
+
+    def update(self, trades):
+        """Consumes new deals (exmo format dicts sorted by date)."""
+        dates, prices = deals_to_arrays(trades)
+        return self.update_arrays(dates, prices)
+
+    def update_arrays(self, dates, prices):
+        """Consumes deals from append-only sorted arrays, skipping deals consumed by previous calls."""
+        start = 0
+        if self._last_date is not None:
+            start = int(np.searchsorted(dates, self._last_date, side='left'))
+            # the arrays may start after the last consumed deals
+            same_date = int(np.searchsorted(dates, self._last_date, side='right')) - start
+            start += min(same_date, self._last_date_count)
+        if start >= len(dates):
+            return 0
+        for date, price in zip(dates[start:].tolist(), prices[start:].tolist()):
+            self._add(date, price)
+        self._evict()
+        return len(dates) - start
+
+    def _add(self, date, price):
+        pos = self._pos
+        if self._count == self._window:
+            self._sum -= self._ring_prices[pos]
+        else:
+            self._count += 1
+        self._ring_prices[pos] = price
+        self._ring_dates[pos] = date
+        self._sum += price
+        self._pos = (pos + 1) % self._window
+        self._added += 1
+        if self._added % self._window == 0:
+            # drop accumulated rounding error of the running sum
+            self._sum = math.fsum(self._ring_prices[:self._count])
+
+        self._dates.append(date)
+        self._prices.append(price)
+        if self._count == self._window:
+            self._means.append(self._sum / self._window)
+            self._window_starts.append(self._ring_dates[self._pos])
+        else:
+            self._means.append(math.nan)
+            self._window_starts.append(None)
+
+        if date == self._last_date:
+            self._last_date_count += 1
+        else:
+            self._last_date = date
+            self._last_date_count = 1
+
+    def _evict(self):
+        self._offset = bisect_left(self._dates, self._last_date - self._history_seconds, lo=self._offset)
+        if self._offset > 1024 and self._offset * 2 > len(self._dates):
+            for values in (self._dates, self._prices, self._means, self._window_starts):
+                del values[:self._offset]
+            self._offset = 0
+
+    def mean_at_latest(self, since=None):
+        if not self._dates:
+            return math.nan
+        return self._mean_of(len(self._dates) - 1, since)
+
+    def mean_at(self, timestamp, since=None):
+        """Rolling mean at the first deal with date >= timestamp (and date > since)."""
+        index = bisect_left(self._dates, timestamp, lo=self._offset)
+        if since is not None:
+            index = max(index, bisect_right(self._dates, since, lo=self._offset))
+        if index >= len(self._dates):
+            return math.nan
+        return self._mean_of(index, since)
+
+    def _mean_of(self, index, since):
+        window_start = self._window_starts[index]
+        if window_start is None or since is not None and window_start <= since:
+            return math.nan
+        return self._means[index]
+
+    def mean_price(self, period, since=None):
+        """Mean price of deals made less than `period` seconds before the last deal."""
+        if not self._dates:
+            return None
+        start = bisect_right(self._dates, self._last_date - period, lo=self._offset)
+        if since is not None:
+            start = max(start, bisect_right(self._dates, since, lo=self._offset))
+        prices = self._prices[start:]
+        return sum(prices) / len(prices)
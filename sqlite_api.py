@@ -4,6 +4,8 @@ from datetime import datetime
 import peewee
 from peewee import *
 
+from order import Order as OrderRecord
+
 database_proxy = peewee.Proxy()
 
 
@@ -31,20 +33,34 @@ class BaseOrder(BaseModel):
 class Order(BaseOrder):
     base_order = ForeignKeyField('self', null=True, to_field='order_id')
 
+    class Meta:
+        indexes = (
+            (('status', 'order_type'), False),
+            (('profile', 'order_type'), False),
+        )
+
 
 class ArchiveOrder(BaseOrder):
     base_order_id = CharField(null=True)
 
+    class Meta:
+        indexes = (
+            (('order_type', 'status'), False),
+            (('profile', 'order_type'), False),
+            (('base_order_id',), False),
+        )
+
 
 class SQLiteStorage:
     def __init__(self, db_path):
-        self._db = peewee.SqliteDatabase(db_path)
+        self._db = peewee.SqliteDatabase(db_path, pragmas={'journal_mode': 'wal'})
         database_proxy.initialize(self._db)
         self._db.connect(reuse_if_open=True)
-        if not self._db.table_exists(Order):
-            self._db.create_tables([Order])
-        if not self._db.table_exists(ArchiveOrder):
-            self._db.create_tables([ArchiveOrder])
+        # safe mode also adds missing indexes to existing databases
+        self._db.create_tables([Order, ArchiveOrder], safe=True)
+
+    def batch(self):
+        return self._db.atomic()
 
     def create_order(self, order, profile, order_type, created, base_order=None, profit_markup=None):
         ord = Order.create(
@@ -67,8 +83,12 @@ class SQLiteStorage:
         return self._map_order(ord)
 
     def get_open_orders(self):
-        ords = Order.select()
-        return [self._map_order(o) for o in ords]
+        # base orders are fetched in the same query
+        base = Order.alias()
+        ords = (Order
+                .select(Order, base)
+                .join(base, JOIN.LEFT_OUTER, on=(Order.base_order == base.order_id), attr='joined_base_order'))
+        return [self._map_order(o, base_order=o.joined_base_order) for o in ords]
 
     def get_archive_orders(self):
         ords = ArchiveOrder.select()
@@ -80,10 +100,10 @@ class SQLiteStorage:
             | (ArchiveOrder.status == 'PROFIT_ORDER_CANCELED'))
         return [self._map_order(o, True) for o in ords]
 
-    def _map_order(self, ord, is_archive=False, full_map=False):
+    def _map_order(self, ord, is_archive=False, full_map=False, base_order=None):
         if ord is None:
             return None
-        order = {'order_id': str(ord.order_id),
+        order = OrderRecord({'order_id': str(ord.order_id),
                  'status': ord.status,
                  'profile': ord.profile,
                  'created': int(ord.created.timestamp()),
@@ -95,7 +115,7 @@ class SQLiteStorage:
                  'pair': ord.pair,
                  'amount': ord.amount,
                  'profit_markup': ord.profit_markup,
-                 'trade_id': ord.trade_id}
+                 'trade_id': ord.trade_id})
         if is_archive:
             if full_map:
                 if ord.base_order_id is not None:
@@ -108,33 +128,38 @@ class SQLiteStorage:
             else:
                 order['base_order_id'] = ord.base_order_id
         else:
-            order['base_order'] = self._map_order(ord.base_order)
+            if base_order is None and ord.base_order_id is not None:
+                base_order = ord.base_order
+            order['base_order'] = self._map_order(base_order)
         return order
 
     def delete(self, order_id, status, completed):
-        order = Order.get(Order.order_id == str(order_id))
-        # if order.base_order is not None:
-        #     self.delete(order.base_order.order_id, status, completed)
-        archive_order = ArchiveOrder(order_id=order.order_id,
-                                     status=order.status,
-                                     profile=order.profile,
-                                     created=order.created,
-                                     completed=datetime.fromtimestamp(completed),
-                                     type=order.type,
-                                     order_type=order.order_type,
-                                     price=order.price,
-                                     quantity=order.quantity,
-                                     trade_id=order.trade_id,
-                                     pair=order.pair,
-                                     amount=order.amount,
-                                     profit_markup=order.profit_markup,
-                                     base_order_id=order.base_order.order_id if order.base_order is not None else None)
-        archive_order.status = status
-        if order.order_type == 'PROFIT' and order.status == 'COMPLETED' \
-                or order.status == 'CANCELED':
-            archive_order.completed = datetime.fromtimestamp(completed)
-        archive_order.save()
-        Order.delete_instance(order)
+        self.archive_many([order_id], status, completed)
+
+    def archive_many(self, order_ids, status, completed):
+        """Moves orders to archive in one transaction. Raises Order.DoesNotExist if any order is missing."""
+        order_ids = [str(order_id) for order_id in order_ids]
+        with self._db.atomic():
+            orders = list(Order.select().where(Order.order_id.in_(order_ids)))
+            if len(orders) != len(set(order_ids)):
+                missing = set(order_ids) - {o.order_id for o in orders}
+                raise Order.DoesNotExist('Orders not found: {}'.format(', '.join(sorted(missing))))
+            completed = datetime.fromtimestamp(completed)
+            ArchiveOrder.insert_many([{'order_id': order.order_id,
+                                       'status': status,
+                                       'profile': order.profile,
+                                       'created': order.created,
+                                       'completed': completed,
+                                       'type': order.type,
+                                       'order_type': order.order_type,
+                                       'price': order.price,
+                                       'quantity': order.quantity,
+                                       'trade_id': order.trade_id,
+                                       'pair': order.pair,
+                                       'amount': order.amount,
+                                       'profit_markup': order.profit_markup,
+                                       'base_order_id': order.base_order_id} for order in orders]).execute()
+            Order.delete().where(Order.order_id.in_(order_ids)).execute()
 
     def cancel_order(self, order_id, canceled):
         self.delete(str(order_id), 'CANCELED', canceled)
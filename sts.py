@@ -4,6 +4,8 @@ import os
 import pandas as pd
 from tabulate import tabulate
 
+from json_api import load_archive
+
 base_folder = r'real_data_test\test_03_09'
 
 stat_file = 'stats.json'
@@ -23,11 +25,9 @@ def handle_folder(folder, data):
             data['total_rate'] = (data['BTC_rate'] + data['USD_rate']) / 2
             # data['profit'] = np.mean((data['BTC'], data['USD']))
         arch_fold = os.path.join(folder, 'archive')
-        for fl in os.listdir(arch_fold):
-            with open(os.path.join(arch_fold, fl)) as f:
-                o = json.load(f)
-                if o['order_type'] == 'PROFIT' and o['status'] == 'COMPLETED':
-                    completed_profit_orders += 1
+        for o in load_archive(arch_fold):
+            if o['order_type'] == 'PROFIT' and o['status'] == 'COMPLETED':
+                completed_profit_orders += 1
         data['orders'] = completed_profit_orders
     except Exception as e:
         print(e)
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from real_data_test.advice_timeline import AdviceTimeline, advice_times, advice_key
+from trade_data import make_trades
+
+
+class DealSizer:
+    def __init__(self):
+        self.calls = 0
+
+    def get_deal_sizes(self, dates, prices, times, cutoffs):
+        self.calls += 1
+        return [(None, None, None, None) if c == 0 else ('UP' if t % 2 else 'DOWN', 0.01, float(t), float('nan'))
+                for t, c in zip(times, cutoffs)]
+
+
+class TestAdviceTimeline(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.trades = make_trades(100)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_advice_times(self):
+        # refreshed at the first tick more than 900 seconds after the previous refresh
+        self.assertEqual([1010, 1920, 2830], advice_times(1010, 2830, 10, 900).tolist())
+
+    def test_cache(self):
+        times = np.array([1010, 1920, 2831])
+        cutoffs = np.array([0, 1910, 2821])
+        sizer = DealSizer()
+        cfg = {'trend_days': 1, 'profit_markup': 0.01, 'stock_fee': 0.002}
+        timeline = AdviceTimeline.load_or_build(self.folder, sizer, self.trades, cfg, times, cutoffs)
+        self.assertEqual((None, None, None, None), timeline.get_advice(1010, 0))
+        self.assertEqual('DOWN', timeline.get_advice(1920, 1910)[0])
+        self.assertIsNone(timeline.get_advice(1920, 1900))
+
+        # other settings than trend ones share the timeline
+        cached = AdviceTimeline.load_or_build(self.folder, sizer, self.trades, dict(cfg, stock_fee=0.001), times,
+                                              cutoffs)
+        self.assertEqual(1, sizer.calls)
+        self.assertEqual(('UP', 0.01, 2831.0), cached.get_advice(2831, 2821)[:3])
+        self.assertTrue(np.isnan(cached.get_advice(2831, 2821)[3]))
+        self.assertEqual(1, len(os.listdir(self.folder)))
+
+        AdviceTimeline.load_or_build(self.folder, sizer, self.trades, dict(cfg, trend_days=2), times, cutoffs)
+        self.assertEqual(2, sizer.calls)
+
+    def test_key_depends_on_dataset(self):
+        other = make_trades(101)
+        self.assertNotEqual(advice_key(self.trades, {}, [1], [0]), advice_key(other, {}, [1], [0]))
+
+    def test_dataset_hashed_once(self):
+        key = advice_key(self.trades, {}, [1], [0])
+        # the memoized fingerprint of the dataset is reused
+        self.trades.column('price')[0] = 1
+        self.assertEqual(key, advice_key(self.trades, {}, [1], [0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
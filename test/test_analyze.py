@@ -6,18 +6,24 @@ import numpy as np
 import pandas as pd
 import random
 
-from trend_analyze import TrendAnalyzer
+from trend_analyze import TrendAnalyzer, RankWarning, rolling_mean
 
+import importlib.util
 import warnings
 
-warnings.simplefilter('ignore', np.RankWarning)
+warnings.simplefilter('ignore', RankWarning)
 
 
 class TestAnalyze(unittest.TestCase):
+    def setUp(self):
+        # noisy prices are generated, keep them the same in every run
+        np.random.seed(1)
+        random.seed(1)
+
     def test_switching_linear_pos(self):
         ta = TrendAnalyzer(rolling_window=6, profit_multiplier=0.5, mean_price_period=10)
         ta._current_time = lambda: 20
-        profile, profit_markup, mean_price = ta.get_profile([{'date': str(i), 'trade_id': str(i),
+        profile, profit_markup, reserve_markup, mean_price = ta.get_profile([{'date': str(i), 'trade_id': str(i),
                                                   'price': str(1200 + 10 * i)} for i in range(20)])
         self.assertEqual('UP', profile)
         self.assertGreater(profit_markup, 0)
@@ -27,7 +33,7 @@ class TestAnalyze(unittest.TestCase):
         ta._current_time = lambda: 20
         deals = [{'date': str(i), 'trade_id': str(i), 'price': str(1200 - 10 * i)} for i in range(20)]
         ta._current_time = lambda: 20
-        profile, profit_markup, mean_price = ta.get_profile(
+        profile, profit_markup, reserve_markup, mean_price = ta.get_profile(
             deals)
         self.assertEqual('DOWN', profile)
         self.assertGreater(profit_markup, 0)
@@ -35,7 +41,7 @@ class TestAnalyze(unittest.TestCase):
     def test_switching_linear_neg_interpolation(self):
         ta = TrendAnalyzer(rolling_window=6, profit_multiplier=0.5, mean_price_period=10)
         ta._current_time = lambda: 20
-        profile, profit_markup, mean_price = ta.get_profile(
+        profile, profit_markup, reserve_markup, mean_price = ta.get_profile(
             [{'date': str(i), 'trade_id': str(i), 'price': str(1200 - 10 * i)} for i in
              [1, 2, 3, 3, 5, 8, 9, 10, 10, 12, 14, 15, 15, 17, 18, 21, 22, 23]])
         self.assertEqual('DOWN', profile)
@@ -47,7 +53,7 @@ class TestAnalyze(unittest.TestCase):
                  [1, 2, 3, 3, 5, 8, 9, 10, 10, 12, 14, 15, 15, 17, 18, 21, 22, 23]]
         ta._current_time = lambda: 20
         random.shuffle(deals)
-        profile, profit_markup, mean_price = ta.get_profile(
+        profile, profit_markup, reserve_markup, mean_price = ta.get_profile(
             deals)
         self.assertEqual('DOWN', profile)
         self.assertGreater(profit_markup, 0)
@@ -73,7 +79,7 @@ class TestAnalyze(unittest.TestCase):
             prices = all_prices[start_index:last_index]
             start_index += price_period
             ta._current_time = lambda: last_index
-            profile, profit_markup, mean_price = ta.get_profile(prices)
+            profile, profit_markup, reserve_markup, mean_price = ta.get_profile(prices)
             logging.debug('{} {}'.format(profile, profit_markup))
             last_price = int(all_prices[last_index]['date'])
             if last_price in range(19, 37) or last_price in range(105, 159) or last_price in range(230, 250):
@@ -106,7 +112,7 @@ class TestAnalyze(unittest.TestCase):
             prices = all_prices[start_index:last_index]
             start_index += price_period
             ta._current_time = lambda: last_index
-            profile, profit_markup, mean_price = ta.get_profile(prices)
+            profile, profit_markup, reserve_markup, mean_price = ta.get_profile(prices)
             logging.debug('{} {}'.format(profile, profit_markup))
             last_price = int(all_prices[last_index]['date'])
             if last_price in range(19, 37) or last_price in range(110, 159) or last_price in range(237, 250):
@@ -115,5 +121,41 @@ class TestAnalyze(unittest.TestCase):
                 self.assertEqual('DOWN', profile)
 
 
+    def test_rolling_mean(self):
+        values = np.array([np.nan, np.nan, 1, 2, 3, 4, 5, 6.5])
+        expected = pd.Series(values).rolling(3).mean().values
+        np.testing.assert_allclose(expected, rolling_mean(values, 3))
+        self.assertTrue(np.isnan(rolling_mean(np.array([1.0, 2.0]), 3)).all())
+
+    def test_mean_prices(self):
+        ta = TrendAnalyzer()
+        times, prices = ta._get_mean_prices(np.array([3, 1, 3, 2]), np.array([10.0, 20.0, 30.0, 40.0]))
+        self.assertEqual([1, 2, 3], times.tolist())
+        self.assertEqual([20.0, 40.0, 20.0], prices.tolist())
+
+    def test_epoch_dates(self):
+        # fit on raw epoch seconds is ill-conditioned, scaled time is not
+        ta = TrendAnalyzer(rolling_window=6, profit_multiplier=0.5, mean_price_period=100)
+        start = 1517170000
+        ta._current_time = lambda: start + 3000
+        deals = [{'date': str(start + 10 * i), 'trade_id': str(i), 'price': str(1200 + 0.01 * i)} for i in range(300)]
+        profile, profit_markup, reserve_markup, mean_price = ta.get_profile(deals)
+        self.assertEqual('UP', profile)
+        # derivative of the normalized price per second
+        self.assertAlmostEqual(0.5 * 0.001 / 1201.5, profit_markup, delta=1e-8)
+
+    @unittest.skipIf(importlib.util.find_spec('scipy') is None, 'scipy is not installed')
+    def test_engines_agree(self):
+        deals = [{'date': str(i), 'trade_id': str(i), 'price': str(1200 + 10 * i)} for i in range(100)]
+        profiles = []
+        for engine in ('numpy', 'scipy'):
+            ta = TrendAnalyzer(rolling_window=6, profit_multiplier=0.5, mean_price_period=10,
+                               derivative_engine=engine)
+            ta._current_time = lambda: 100
+            profiles.append(ta.get_profile(deals))
+        self.assertEqual(profiles[0][0], profiles[1][0])
+        self.assertAlmostEqual(profiles[0][1], profiles[1][1], delta=1e-6)
+        self.assertEqual(profiles[0][3], profiles[1][3])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from async_worker import AsyncApi, AsyncWorker
+from json_api import JsonStorage
+from order import Order
+
+
+class StorageMock(JsonStorage):
+    def __init__(self):
+        super(StorageMock, self).__init__()
+        self.archive = {}
+
+    def save_to_disk(self, obj, path):
+        pass
+
+    def delete(self, order_id, status, completed):
+        super(StorageMock, self).delete(order_id, status, completed)
+        self.archive[order_id] = status
+
+
+class SlowApi:
+    def __init__(self, open_orders, user_trades, delay=0.2):
+        self.open_orders = open_orders
+        self.user_trades = user_trades
+        self.delay = delay
+        self.created = []
+        self.canceled = []
+        self.lock = threading.Lock()
+
+    def get_open_orders(self, currency_1, currency_2):
+        time.sleep(self.delay)
+        return list(self.open_orders)
+
+    def get_user_trades(self, currency_1, currency_2):
+        time.sleep(self.delay)
+        return list(self.user_trades)
+
+    def cancel_order(self, order_id):
+        time.sleep(self.delay)
+        with self.lock:
+            self.canceled.append(order_id)
+
+    def create_order(self, currency_1, currency_2, quantity, price, type):
+        with self.lock:
+            order_id = str(100 + len(self.created))
+            self.created.append(order_id)
+            self.open_orders.append(Order(order_id=order_id, type=type, price=str(price), quantity=str(quantity)))
+        return order_id
+
+
+class Advisor:
+    def get_advice(self):
+        return 'UP', 0.001, 1000, 0.002
+
+
+class TestAsyncApi(unittest.TestCase):
+    def test_calls_run_concurrently(self):
+        api = AsyncApi(SlowApi([], []), max_concurrent=2)
+
+        async def fetch():
+            return await asyncio.gather(api.get_open_orders('BTC', 'USD'), api.get_user_trades('BTC', 'USD'))
+
+        start = time.monotonic()
+        asyncio.run(fetch())
+        self.assertLess(time.monotonic() - start, 0.35)
+
+    def test_min_interval(self):
+        api = AsyncApi(SlowApi([], [], delay=0), max_concurrent=3, min_interval=0.1)
+
+        async def fetch():
+            return await asyncio.gather(*[api.get_open_orders('BTC', 'USD') for i in range(3)])
+
+        start = time.monotonic()
+        asyncio.run(fetch())
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+
+class TestAsyncWorker(unittest.TestCase):
+    def _store_order(self, storage, order_id, order_type, status='OPEN'):
+        storage.orders[order_id] = Order(order_id=order_id, type='buy', price='1000', quantity='0.002', profile='UP',
+                                         order_type=order_type, status=status, base_order=None, profit_markup=None,
+                                         created=0)
+
+    def test_reserve_orders_completed(self):
+        api = SlowApi([], [{'order_id': '1'}, {'order_id': '2'}], delay=0.1)
+        storage = StorageMock()
+        self._store_order(storage, '1', 'RESERVE')
+        self._store_order(storage, '2', 'RESERVE')
+        worker = AsyncWorker(AsyncApi(api), storage, Advisor(), profit_markup=0.01, max_profit_orders_up=0)
+        asyncio.run(worker.main_flow())
+        self.assertEqual(['100', '101'], sorted(api.created))
+        profit_orders = [o for o in storage.get_open_orders() if o['order_type'] == 'PROFIT']
+        self.assertEqual({'1', '2'}, {o['base_order']['order_id'] for o in profit_orders})
+        self.assertEqual('WAIT_FOR_PROFIT', storage.orders['1']['status'])
+
+    def test_profile_changed_orders_canceled(self):
+        api = SlowApi([{'order_id': '1'}, {'order_id': '2'}], [], delay=0.1)
+        storage = StorageMock()
+        self._store_order(storage, '1', 'RESERVE')
+        self._store_order(storage, '2', 'RESERVE')
+        storage.orders['1']['profile'] = 'DOWN'
+        storage.orders['2']['profile'] = 'DOWN'
+
+        class DownAdvisor:
+            def get_advice(self):
+                return 'UP', 0.01, 1000, 0.0001
+
+        worker = AsyncWorker(AsyncApi(api), storage, DownAdvisor(), profit_markup=0.01)
+        asyncio.run(worker.main_flow())
+        self.assertEqual(['1', '2'], sorted(api.canceled))
+        self.assertEqual({'1': 'CANCELED', '2': 'CANCELED'}, storage.archive)
+
+
+if __name__ == "__main__":
+    unittest.main()
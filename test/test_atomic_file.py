@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from atomic_file import atomic_write
+
+
+class TestAtomicWrite(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'file.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_replace(self):
+        self.assertTrue(atomic_write(self.path, lambda f: f.write('1')))
+        self.assertTrue(atomic_write(self.path, lambda f: f.write('2')))
+        with open(self.path) as f:
+            self.assertEqual('2', f.read())
+        self.assertEqual(['file.txt'], os.listdir(self.folder))
+
+    def test_failed_write(self):
+        atomic_write(self.path, lambda f: f.write('1'))
+
+        def write(f):
+            f.write('2')
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            atomic_write(self.path, write)
+        with open(self.path) as f:
+            self.assertEqual('1', f.read())
+        self.assertEqual(['file.txt'], os.listdir(self.folder))
+
+    def test_empty_path(self):
+        cwd = os.getcwd()
+        os.chdir(self.folder)
+        try:
+            self.assertFalse(atomic_write('', lambda f: f.write('1')))
+        finally:
+            os.chdir(cwd)
+        self.assertEqual([], os.listdir(self.folder))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from json_api import JsonStorage
+from real_data_test.checkpoint import Checkpoint
+from real_data_test.market_simulator import MarketSimulator
+from trade_data import make_trades
+
+
+class Provider:
+    def __init__(self, trades, sim):
+        self.dates = trades.column('date')
+        self.get_time = sim.get_timestamp
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.trades = make_trades(100, 200, 1000)
+        self.path = os.path.join(self.folder, 'checkpoints', 'run.pickle')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _storage(self, name):
+        archive = os.path.join(self.folder, name, 'archive')
+        os.makedirs(archive)
+        return JsonStorage(os.path.join(self.folder, name, 'orders.json'), archive, journal=True)
+
+    def _sim(self, trades):
+        return MarketSimulator('', 1, 10000, 0.002, deals=trades)
+
+    def test_save_load(self):
+        storage = self._storage('run')
+        sim = self._sim(self.trades)
+        order_id = sim.create_order('BTC', 'USD', 0.5, 150, 'buy')
+        storage.create_order({'order_id': order_id, 'type': 'buy', 'price': 150, 'quantity': 0.5}, 'UP', 'RESERVE',
+                             created=sim.timestamp)
+        Checkpoint(self.path, self.trades, storage).save({'sim': sim, 'provider': Provider(self.trades, sim),
+                                                          'storage': storage})
+        sim.update_timestamp(sim.timestamp + 1000)
+
+        trades = make_trades(100, 200, 1000)
+        other_storage = self._storage('resumed')
+        state = Checkpoint(self.path, trades, other_storage).load()
+        restored = state['sim']
+        self.assertEqual(101, restored.index)
+        self.assertEqual([order_id], list(restored.orders))
+        self.assertEqual(10000 - 75, restored.balances['USD'])
+        # the dataset and the storage are the ones of the loading run
+        self.assertIs(trades, restored.trades)
+        self.assertIs(trades.column('date'), state['provider'].dates)
+        self.assertIs(other_storage, state['storage'])
+        self.assertEqual([order_id], list(other_storage.orders))
+        self.assertIs(restored, state['provider'].get_time.__self__)
+
+        restored.update_timestamp(restored.timestamp + 1000)
+        self.assertEqual(sim.balances, restored.balances)
+
+    def test_missing(self):
+        self.assertIsNone(Checkpoint(self.path, self.trades, self._storage('run')).load())
+
+    def test_other_dataset(self):
+        storage = self._storage('run')
+        Checkpoint(self.path, self.trades, storage).save({'sim': self._sim(self.trades)})
+        with self.assertRaises(ValueError):
+            Checkpoint(self.path, make_trades(101, 200, 1000), storage).load()
+
+
+if __name__ == "__main__":
+    unittest.main()
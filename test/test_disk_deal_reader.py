@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from disk_deal_reader import DiskDealReader
+
+
+class TestDiskDealReader(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _write(self, filename, trade_ids):
+        with open(os.path.join(self.folder, filename), 'w') as f:
+            json.dump({str(i): {'trade_id': i, 'date': i * 100, 'price': str(1000 + i)} for i in trade_ids}, f)
+
+    def test_reads_new_and_changed_files(self):
+        self._write('100.json', [1, 2, 3])
+        reader = DiskDealReader(self.folder)
+        self.assertEqual([1, 2, 3], [d['trade_id'] for d in reader.get_deals()])
+
+        self._write('400.json', [6, 4])
+        self.assertEqual([1, 2, 3, 4, 6], [d['trade_id'] for d in reader.get_deals()])
+
+        self._write('400.json', [4, 5, 6, 7])
+        self.assertEqual([1, 2, 3, 4, 5, 6, 7], [d['trade_id'] for d in reader.get_deals()])
+
+    def test_unchanged_files_not_parsed(self):
+        self._write('100.json', [1, 2, 3])
+        reader = DiskDealReader(self.folder)
+        reader.get_deals()
+        with open(os.path.join(self.folder, '100.json')) as f:
+            content = f.read()
+        # same size and mtime, different content: must be skipped
+        stat = os.stat(os.path.join(self.folder, '100.json'))
+        with open(os.path.join(self.folder, '100.json'), 'w') as f:
+            f.write(content.replace('1001', '1009'))
+        os.utime(os.path.join(self.folder, '100.json'), (stat.st_atime, stat.st_mtime))
+        self.assertEqual('1001', reader.get_deals()[0]['price'])
+
+    def test_evicts_old_deals(self):
+        self._write('300.json', [1, 2, 3, 4, 5])
+        reader = DiskDealReader(self.folder, deal_read_days=1)
+        reader._get_time = lambda: 24 * 60 * 60
+        self.assertEqual([1, 2, 3, 4, 5], [d['trade_id'] for d in reader.get_deals()])
+        reader._get_time = lambda: 24 * 60 * 60 + 250
+        self.assertEqual([3, 4, 5], [d['trade_id'] for d in reader.get_deals()])
+
+    def test_deal_window(self):
+        self._write('100.json', [1, 2, 3])
+        self._write('400.json', [4, 5, 6, 7])
+        reader = DiskDealReader(self.folder)
+        self.assertEqual([3, 4, 5], [d['trade_id'] for d in reader.get_deals(since=200, until=500)])
+        dates, prices = reader.get_deal_arrays(since=500)
+        self.assertEqual([600, 700], dates.tolist())
+        self.assertEqual([1006.0, 1007.0], prices.tolist())
+
+    def test_deal_arrays_extended(self):
+        self._write('200.json', [2, 3])
+        reader = DiskDealReader(self.folder)
+        dates, prices = reader.get_deal_arrays()
+        self._write('400.json', [4, 5])
+        self.assertEqual([200, 300, 400, 500], reader.get_deal_arrays()[0].tolist())
+        # returned arrays are not changed by later calls
+        self.assertEqual([1002.0, 1003.0], prices.tolist())
+        # deals older than the buffer are merged
+        self._write('100.json', [1])
+        self.assertEqual([100, 200, 300, 400, 500], reader.get_deal_arrays()[0].tolist())
+        self.assertEqual([1001.0, 1002.0], reader.get_deal_arrays(until=200)[1].tolist())
+        self.assertEqual([1002.0, 1003.0], prices.tolist())
+
+
+class TestSegments(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _append(self, filename, trade_ids):
+        with open(os.path.join(self.folder, filename), 'a') as f:
+            f.writelines(json.dumps({'trade_id': i, 'date': i * 100, 'price': 1000 + i, 'quantity': 1}) + '\n'
+                         for i in trade_ids)
+
+    def test_only_appended_lines_parsed(self):
+        self._append('100.ndjson', [1, 2])
+        reader = DiskDealReader(self.folder)
+        self.assertEqual([1001.0, 1002.0], reader.get_deal_arrays()[1].tolist())
+        path = os.path.join(self.folder, '100.ndjson')
+        with open(path) as f:
+            content = f.read()
+        # read lines are not parsed again
+        with open(path, 'w') as f:
+            f.write(content.replace('1001', '1009'))
+        self._append('100.ndjson', [3])
+        self._append('400.ndjson', [4])
+        self.assertEqual([1001.0, 1002.0, 1003.0, 1004.0], reader.get_deal_arrays()[1].tolist())
+        self.assertEqual([3, 4], [d['trade_id'] for d in reader.get_deals(since=200)])
+
+
+if __name__ == "__main__":
+    unittest.main()
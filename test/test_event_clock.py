@@ -0,0 +1,71 @@
+import unittest
+
+from real_data_test.event_clock import EventClock
+
+
+class SimMock:
+    def __init__(self):
+        self.version = 0
+        self.fill_date = None
+
+    def next_fill_date(self):
+        return self.fill_date
+
+
+class AdvisorMock:
+    def __init__(self):
+        self.last_update_ts = 0
+        self.period = 900
+
+    def next_update_timestamp(self):
+        return self.last_update_ts + self.period
+
+
+class TestEventClock(unittest.TestCase):
+    def setUp(self):
+        self.sim = SimMock()
+        self.advisor = AdvisorMock()
+
+    def _tick(self, clock, changed=False):
+        clock.begin_tick()
+        if changed:
+            self.sim.version += 1
+        clock.end_tick()
+
+    def test_step_mode(self):
+        clock = EventClock(self.sim, self.advisor, 100000, mode='step')
+        self._tick(clock)
+        self.assertEqual(1010, clock.next_timestamp(1000))
+
+    def test_exact_mode_steps_after_changes(self):
+        clock = EventClock(self.sim, self.advisor, 100000)
+        self.assertEqual(1010, clock.next_timestamp(1000))
+        self._tick(clock, changed=True)
+        self.assertEqual(1010, clock.next_timestamp(1000))
+
+    def test_exact_mode_jumps_to_next_event(self):
+        clock = EventClock(self.sim, self.advisor, 100000)
+        self.advisor.last_update_ts = 1000
+        self._tick(clock)
+        # advisor refreshes at the first tick later than 1900
+        self.assertEqual(1910, clock.next_timestamp(1000))
+        # deal dated 1455 is handled at the tick 1460
+        self.sim.fill_date = 1455
+        self.assertEqual(1460, clock.next_timestamp(1000))
+        self.sim.fill_date = 1460
+        self.assertEqual(1470, clock.next_timestamp(1000))
+
+    def test_exact_mode_max_gap_and_end(self):
+        clock = EventClock(self.sim, self.advisor, 1500, max_gap=300)
+        self.advisor.last_update_ts = 1000
+        self._tick(clock)
+        self.assertEqual(1300, clock.next_timestamp(1000))
+        self.assertEqual(1500, clock.next_timestamp(1300))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            EventClock(self.sim, self.advisor, 1000, mode='sometimes')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,7 @@
 import json
+import os
+import shutil
+import tempfile
 import time
 import unittest
 
@@ -856,5 +859,65 @@ class TestWorker(unittest.TestCase):
         self.assertEquals('COMPLETED', storage.archive[base_order_id])
 
 
+class PlacementApi:
+    def __init__(self, open_orders, user_trades):
+        self.open_orders = open_orders
+        self.user_trades = user_trades
+        self.created = []
+        self.get_open_orders_called = 0
+        self.get_user_trades_called = 0
+
+    def get_open_orders(self, currency_1, currency_2):
+        self.get_open_orders_called += 1
+        return list(self.open_orders)
+
+    def get_user_trades(self, currency_1, currency_2):
+        self.get_user_trades_called += 1
+        return list(self.user_trades)
+
+    def create_order(self, currency_1, currency_2, quantity, price, type):
+        order_id = str(100 + len(self.created))
+        self.created.append(order_id)
+        order = {'order_id': order_id, 'type': type, 'price': str(price), 'quantity': str(quantity)}
+        if order_id == '100':
+            # completed at once
+            self.user_trades.append(order)
+        else:
+            self.open_orders.append(order)
+        return order_id
+
+
+class TestWorkerOrderPlacement(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.folder, 'archive'))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_orders_of_tick_found_in_one_snapshot(self):
+        api = PlacementApi([], [{'order_id': '1'}, {'order_id': '2'}])
+        storage = JsonStorage(os.path.join(self.folder, 'orders.json'), os.path.join(self.folder, 'archive'))
+        for order_id in ('1', '2'):
+            storage.orders[order_id] = {'order_id': order_id, 'type': 'buy', 'price': 1000.0, 'quantity': 0.002,
+                                        'profile': 'UP', 'order_type': 'RESERVE', 'status': 'OPEN',
+                                        'base_order': None, 'profit_markup': None, 'created': 0}
+
+        class Advisor:
+            def get_advice(self):
+                return 'UP', 0.001, 1000, 0.002
+
+        worker = Worker(api, storage, Advisor(), profit_markup=0.01, max_profit_orders_up=0)
+        worker.main_flow()
+        self.assertEqual(['100', '101'], api.created)
+        # market orders of the tick + one snapshot for both created orders
+        self.assertEqual(2, api.get_open_orders_called)
+        self.assertEqual(2, api.get_user_trades_called)
+        profit_orders = {o['base_order']['order_id']: o for o in storage.get_open_orders()
+                         if o['order_type'] == 'PROFIT'}
+        self.assertEqual({'1', '2'}, set(profit_orders))
+        self.assertEqual({'100', '101'}, {o['order_id'] for o in profit_orders.values()})
+
+
 if __name__ == "__main__":
     unittest.main()
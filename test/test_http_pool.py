@@ -0,0 +1,103 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from http_pool import ConnectionPool
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.do_GET()
+
+    def do_GET(self):
+        self.server.requests.append(self.client_address)
+        if self.server.drop_responses:
+            # request processed, but the connection breaks before the response
+            self.close_connection = True
+            return
+        body = json.dumps({'result': True}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        if self.server.close_connections:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+        if self.server.drop_connections:
+            # close socket without telling the client, like an idle timeout on the server side
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.requests = []
+        self.server.close_connections = False
+        self.server.drop_connections = False
+        self.server.drop_responses = False
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.pool = ConnectionPool(pool_size=2, timeout=5)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def _request(self, http_method='POST', **kwargs):
+        body = 'nonce=1' if http_method == 'POST' else None
+        return self.pool.request('127.0.0.1', http_method, '/v1/user_info', body, scheme='http', port=self.port,
+                                 **kwargs)
+
+    def test_keep_alive(self):
+        for i in range(3):
+            status, response = self._request()
+            self.assertEqual(200, status)
+            self.assertEqual({'result': True}, json.loads(response.decode('utf-8')))
+        # all requests came from the same client socket
+        self.assertEqual(1, len(set(self.server.requests)))
+        self.assertEqual(1, self.pool.idle_count('127.0.0.1', scheme='http', port=self.port))
+
+    def test_connection_close(self):
+        self.server.close_connections = True
+        self._request()
+        self._request()
+        self.assertEqual(2, len(set(self.server.requests)))
+        self.assertEqual(0, self.pool.idle_count('127.0.0.1', scheme='http', port=self.port))
+
+    def test_reconnect_after_server_closed_connection(self):
+        self.server.drop_connections = True
+        self._request('GET')
+        self.assertEqual(1, self.pool.idle_count('127.0.0.1', scheme='http', port=self.port))
+        status, response = self._request('GET')
+        self.assertEqual(200, status)
+        self.assertEqual(2, len(set(self.server.requests)))
+
+    def test_post_not_sent_again(self):
+        self._request()
+        self.server.drop_responses = True
+        with self.assertRaises(ConnectionError):
+            self._request()
+        # sent once on the reused connection, the order may have been placed
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual(0, self.pool.idle_count('127.0.0.1', scheme='http', port=self.port))
+
+    def test_get_sent_again(self):
+        self._request('GET')
+        self.server.drop_responses = True
+        with self.assertRaises(ConnectionError):
+            self._request('GET')
+        # sent on the reused connection and once more on a new one
+        self.assertEqual(3, len(self.server.requests))
+
+
+if __name__ == "__main__":
+    unittest.main()
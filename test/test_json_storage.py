@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from json_api import JsonStorage, ARCHIVE_JOURNAL, load_archive
+
+
+class TestJsonStorageJournal(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.order_file = os.path.join(self.folder, 'orders.json')
+        self.archive = os.path.join(self.folder, 'archive')
+        os.makedirs(self.archive)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _storage(self, **kwargs):
+        return JsonStorage(self.order_file, self.archive, journal=True, **kwargs)
+
+    def _create(self, storage, order_id):
+        return storage.create_order({'order_id': order_id, 'type': 'buy', 'price': '100', 'quantity': '1'},
+                                    'UP', 'RESERVE', created=1)
+
+    def _journal_lines(self):
+        with open(self.order_file + '.journal') as f:
+            return f.readlines()
+
+    def test_load_orders_with_string_prices(self):
+        with open(self.order_file, 'w') as f:
+            json.dump({'1': {'order_id': '1', 'type': 'buy', 'price': '100', 'quantity': '0.5', 'status': 'OPEN',
+                             'base_order': {'order_id': '0', 'price': '90', 'quantity': '0.5'}}}, f)
+        storage = self._storage()
+        order = storage.orders['1']
+        self.assertEqual(100.0, order['price'])
+        self.assertEqual(90.0, order['base_order'].price)
+        storage.compact()
+        with open(self.order_file) as f:
+            self.assertEqual(0.5, json.load(f)['1']['quantity'])
+
+    def test_replay(self):
+        storage = self._storage()
+        self._create(storage, '1')
+        self._create(storage, '2')
+        storage.update_order_status('1', 'WAIT_FOR_PROFIT', 5)
+        storage.delete('2', 'CANCELED', 6)
+        self.assertFalse(os.path.exists(self.order_file))
+
+        restored = self._storage()
+        self.assertEqual(['1'], list(restored.orders))
+        self.assertEqual('WAIT_FOR_PROFIT', restored.orders['1']['status'])
+        self.assertEqual(5, restored.orders['1']['completed'])
+        with open(os.path.join(self.archive, ARCHIVE_JOURNAL)) as f:
+            archived = [json.loads(line) for line in f]
+        self.assertEqual([('2', 'CANCELED')], [(o['order_id'], o['status']) for o in archived])
+
+    def test_batch_writes_once(self):
+        storage = self._storage()
+        with storage.batch():
+            self._create(storage, '1')
+            self._create(storage, '2')
+            self.assertFalse(os.path.exists(self.order_file + '.journal'))
+        self.assertEqual(2, len(self._journal_lines()))
+
+    def test_compaction(self):
+        storage = self._storage(compact_every=3)
+        self._create(storage, '1')
+        self._create(storage, '2')
+        storage.delete('1', 'CANCELED', 2)
+        self.assertEqual([], self._journal_lines())
+        with open(self.order_file) as f:
+            self.assertEqual(['2'], list(json.load(f)))
+        self.assertEqual(['2'], list(self._storage().orders))
+
+    def test_torn_journal_line(self):
+        storage = self._storage()
+        self._create(storage, '1')
+        with open(self.order_file + '.journal', 'a') as f:
+            f.write('{"op": "delete", "ord')
+        self.assertEqual(['1'], list(self._storage().orders))
+
+    def test_without_journal_batch(self):
+        storage = JsonStorage(self.order_file, self.archive)
+        with storage.batch():
+            self._create(storage, '1')
+            self.assertFalse(os.path.exists(self.order_file))
+        with open(self.order_file) as f:
+            self.assertEqual(['1'], list(json.load(f)))
+
+    def test_without_files(self):
+        cwd = os.getcwd()
+        os.chdir(self.folder)
+        try:
+            self._create(JsonStorage(), '1')
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(['archive'], os.listdir(self.folder))
+
+    def test_failed_save_leaves_no_tmp_file(self):
+        storage = JsonStorage(self.order_file, self.archive)
+        storage.save_to_disk({'order': object()}, self.order_file)
+        self.assertEqual(['archive'], os.listdir(self.folder))
+
+    def test_snapshot_restore(self):
+        storage = self._storage()
+        self._create(storage, '1')
+        self._create(storage, '2')
+        storage.delete('2', 'CANCELED', 6)
+        snapshot = storage.snapshot()
+        self._create(storage, '3')
+        storage.delete('1', 'CANCELED', 7)
+
+        other_folder = os.path.join(self.folder, 'other')
+        os.makedirs(os.path.join(other_folder, 'archive'))
+        other = JsonStorage(os.path.join(other_folder, 'orders.json'), os.path.join(other_folder, 'archive'),
+                            journal=True)
+        other.restore(snapshot)
+        self.assertEqual(['1'], list(other.orders))
+        self.assertEqual(['2'], [o['order_id'] for o in load_archive(os.path.join(other_folder, 'archive'))])
+        restored = JsonStorage(os.path.join(other_folder, 'orders.json'), os.path.join(other_folder, 'archive'),
+                               journal=True)
+        self.assertEqual(['1'], list(restored.orders))
+
+
+if __name__ == "__main__":
+    unittest.main()
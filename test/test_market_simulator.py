@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from real_data_test.market_simulator import MarketSimulator, OrderBook
+
+
+class TestOrderBook(unittest.TestCase):
+    def test_pop_not_lower(self):
+        book = OrderBook()
+        book.add('1', 100.0)
+        book.add('2', 110.0)
+        book.add('3', 90.0)
+        self.assertEqual(['1', '2'], book.pop_not_lower(100.0))
+        self.assertEqual(1, len(book))
+
+    def test_pop_lower(self):
+        book = OrderBook()
+        book.add('1', 100.0)
+        book.add('2', 110.0)
+        book.add('3', 90.0)
+        self.assertEqual(['3'], book.pop_lower(100.0))
+        self.assertEqual(2, len(book))
+
+    def test_remove(self):
+        book = OrderBook()
+        book.add('1', 100.0)
+        book.add('2', 100.0)
+        self.assertTrue(book.remove('2', 100.0))
+        self.assertFalse(book.remove('2', 100.0))
+        self.assertEqual(['1'], book.pop_not_lower(0))
+
+
+class TestMarketSimulator(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        prices = [1000 + (i % 20) * 10 for i in range(300)]
+        deals = {str(i): {'trade_id': str(i), 'date': str(i), 'price': str(p), 'quantity': '0.1'}
+                 for i, p in enumerate(prices)}
+        with open(os.path.join(self.folder, '0.json'), 'w') as f:
+            json.dump(deals, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_fills_match_price_rules(self):
+        sim = MarketSimulator(self.folder, 10, 100000, 0.002)
+        buy_fill = sim.create_order('BTC', 'USD', 0.1, 1000.0, 'buy')
+        buy_rest = sim.create_order('BTC', 'USD', 0.1, 990.0, 'buy')
+        sell_fill = sim.create_order('BTC', 'USD', 0.1, 1180.0, 'sell')
+        sell_rest = sim.create_order('BTC', 'USD', 0.1, 1190.0, 'sell')
+        sim.update_timestamp(sim.get_timestamp() + 30)
+        completed = {o['order_id'] for o in sim.get_user_trades('BTC', 'USD')}
+        self.assertEqual({buy_fill, sell_fill}, completed)
+        self.assertEqual({buy_rest, sell_rest}, {o['order_id'] for o in sim.get_open_orders('BTC', 'USD')})
+
+    def test_canceled_order_not_filled(self):
+        sim = MarketSimulator(self.folder, 10, 100000, 0.002)
+        order_id = sim.create_order('BTC', 'USD', 0.1, 1100.0, 'buy')
+        sim.cancel_order(order_id)
+        sim.update_timestamp(sim.get_timestamp() + 30)
+        self.assertEqual([], sim.get_user_trades('BTC', 'USD'))
+
+    def test_next_fill_date(self):
+        sim = MarketSimulator(self.folder, 10, 100000, 0.002)
+        self.assertIsNone(sim.next_fill_date())
+        # prices cycle 1000..1190, only 1190 (dates 19 + 20k) is higher than the sell price
+        sim.create_order('BTC', 'USD', 0.1, 1185.0, 'sell')
+        fill_date = sim.next_fill_date()
+        self.assertGreater(fill_date, sim.get_timestamp() - 1)
+        self.assertEqual(19, fill_date % 20)
+        version = sim.version
+        sim.update_timestamp(fill_date)
+        self.assertEqual(version, sim.version)
+        sim.update_timestamp(fill_date + 1)
+        self.assertEqual(version + 1, sim.version)
+        self.assertIsNone(sim.next_fill_date())
+
+
+    def test_deal_window(self):
+        sim = MarketSimulator(self.folder, 10, 100000, 0.002)
+        sim.update_timestamp(150)
+        dates, prices = sim.get_deal_arrays(since=100)
+        self.assertEqual(list(range(101, 150)), dates.tolist())
+        self.assertEqual([120, 121], [d['date'] for d in sim.get_deals(since=119, until=121)])
+        self.assertEqual(150, len(sim.get_deals()))
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from metrics import Histogram, Metrics, MetricsReporter, TimedCall, TimedProxy, instrument, instrument_worker
+
+
+class Storage:
+    def __init__(self):
+        self.orders = {}
+
+    def get_open_orders(self):
+        return []
+
+    def batch(self):
+        return self
+
+
+class WorkerMock:
+    def __init__(self):
+        self._api = Storage()
+        self._storage = Storage()
+        self._advisor = Storage()
+        self.phases = []
+
+    def main_flow(self):
+        self._storage.get_open_orders()
+        self._handle_open_orders()
+        self._handle_orders_wait_for_profit()
+        self._make_reserve()
+        self._store_placed_orders()
+
+    def _handle_open_orders(self):
+        self.phases.append('open')
+
+    def _handle_orders_wait_for_profit(self):
+        self.phases.append('wait')
+
+    def _make_reserve(self):
+        self.phases.append('reserve')
+
+    def _store_placed_orders(self):
+        pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestHistogram(unittest.TestCase):
+    def test_quantiles(self):
+        histogram = Histogram()
+        for i in range(1, 1001):
+            histogram.record(i / 1000)
+        self.assertEqual(1000, histogram.count)
+        for q, expected in ((0.5, 0.5), (0.95, 0.95), (0.99, 0.99)):
+            self.assertAlmostEqual(expected, histogram.quantile(q), delta=expected * 0.05)
+        self.assertEqual(1.0, histogram.quantile(1))
+        self.assertEqual(0.0, Histogram().quantile(0.5))
+
+    def test_out_of_range(self):
+        histogram = Histogram()
+        histogram.record(0)
+        histogram.record(5000)
+        self.assertEqual(1e-6, histogram.quantile(0.5))
+        self.assertEqual(5000, histogram.quantile(0.99))
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.metrics = Metrics()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_instrument_worker(self):
+        worker = WorkerMock()
+        instrument_worker(worker, self.metrics)
+        instrument_worker(worker, self.metrics)
+        worker.main_flow()
+        self.assertEqual(['open', 'wait', 'reserve'], worker.phases)
+        summary = self.metrics.summary()
+        self.assertEqual(['storage.get_open_orders', 'worker.handle_open_orders',
+                          'worker.handle_orders_wait_for_profit', 'worker.main_flow', 'worker.make_reserve',
+                          'worker.store_placed_orders'], list(summary))
+        self.assertTrue(all(s['count'] == 1 for s in summary.values()))
+        self.assertIsInstance(worker._storage._obj, Storage)
+
+        restored = pickle.loads(pickle.dumps(worker))
+        restored.main_flow()
+        self.assertEqual(['open', 'wait', 'reserve'] * 2, restored.phases)
+
+    def test_proxy(self):
+        storage = Storage()
+        proxy = TimedProxy(storage, self.metrics, 'storage')
+        self.assertIs(storage.orders, proxy.orders)
+        self.assertIs(storage, proxy.batch())
+        self.assertEqual([], proxy.get_open_orders())
+        self.assertEqual(['storage.get_open_orders'], list(self.metrics.summary()))
+
+    def test_coroutine(self):
+        async def get_trades():
+            await asyncio.sleep(0.01)
+            return [1]
+
+        self.assertEqual([1], asyncio.run(TimedCall(self.metrics, 'api.get_trades', get_trades)()))
+        self.assertGreaterEqual(self.metrics.get_histogram('api.get_trades').max, 0.009)
+
+    def test_instrument(self):
+        storage = Storage()
+        instrument(storage, ('get_open_orders',), self.metrics, 'advisor')
+        storage.get_open_orders()
+        self.assertEqual(1, self.metrics.get_histogram('advisor.get_open_orders').count)
+
+    def test_report(self):
+        self.metrics.record('api.get_trades', 0.1)
+        clock = Clock()
+        path = os.path.join(self.folder, 'metrics.json')
+        reporter = MetricsReporter(self.metrics, period=60, path=path, clock=clock)
+        clock.now = 59
+        reporter.maybe_report()
+        self.assertFalse(os.path.exists(path))
+        clock.now = 60
+        with self.assertLogs('xmb', 'INFO') as logs:
+            reporter.maybe_report()
+        self.assertIn('api.get_trades: n=1', logs.output[0])
+        with open(path) as f:
+            self.assertEqual(1, json.load(f)['api.get_trades']['count'])
+
+        text_path = os.path.join(self.folder, 'metrics.txt')
+        self.metrics.write(text_path)
+        with open(text_path) as f:
+            self.assertIn('api.get_trades count 1\n', f.readlines())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import unittest
+
+from exmo_api import ExmoApi, ExmoPublicApi
+from order import Order, Trade
+
+
+class TestOrder(unittest.TestCase):
+    def test_numeric_fields(self):
+        order = Order({'order_id': '1', 'type': 'buy', 'price': '100.5', 'quantity': '0.002', 'profit_markup': None})
+        self.assertEqual(100.5, order['price'])
+        self.assertEqual(0.002, order.quantity)
+        self.assertIsNone(order.profit_markup)
+        order['price'] = '101'
+        self.assertEqual(101.0, order.price)
+        self.assertIsNone(order.completed)
+        self.assertNotIn('completed', order)
+
+    def test_base_order(self):
+        order = Order(order_id='2', base_order={'order_id': '1', 'price': '100'})
+        self.assertIsInstance(order.base_order, Order)
+        self.assertEqual(100.0, order.base_order.price)
+        order['base_order'] = None
+        self.assertIsNone(order.base_order)
+
+    def test_json(self):
+        order = Order({'order_id': '1', 'price': '100', 'quantity': '2', 'base_order': {'order_id': '0'},
+                       'base_order_id': '0'})
+        self.assertEqual(order, Order(json.loads(json.dumps(order))))
+        self.assertEqual('0', order['base_order_id'])
+
+    def test_trade(self):
+        trade = Trade.from_values(('trade_id', 'date', 'price'), (1, 10, 100.0))
+        self.assertEqual({'trade_id': 1, 'date': 10, 'price': 100.0}, trade)
+        self.assertEqual(10, trade.date)
+        self.assertEqual(2.0, Trade({'quantity': '2'}).quantity)
+
+
+class ResponsePool:
+    """Pool answering every request with the same exmo response."""
+
+    def __init__(self, response):
+        self.response = json.dumps(response).encode('utf-8')
+
+    def request(self, host, http_method, url, body=None, headers=None, **kwargs):
+        return 200, self.response
+
+
+class TestApiRecords(unittest.TestCase):
+    def test_exmo_api(self):
+        trade = {'trade_id': 3, 'date': 10, 'type': 'buy', 'price': '100.5', 'quantity': '0.002', 'amount': '0.201',
+                 'order_id': 7, 'pair': 'BTC_USD'}
+        order = {'order_id': '7', 'created': '10', 'type': 'buy', 'pair': 'BTC_USD', 'price': '100.5',
+                 'quantity': '0.002', 'amount': '0.201'}
+        api = ExmoApi('key', 'secret', ResponsePool({'BTC_USD': [trade]}))
+        for trades in (api.get_trades('BTC', 'USD'), api.get_user_trades('BTC', 'USD')):
+            self.assertIsInstance(trades[0], Trade)
+            self.assertEqual(100.5, trades[0]['price'])
+        open_orders = ExmoApi('key', 'secret', ResponsePool({'BTC_USD': [order]})).get_open_orders('BTC', 'USD')
+        self.assertIsInstance(open_orders[0], Order)
+        self.assertEqual(0.002, open_orders[0]['quantity'])
+        public_trades = ExmoPublicApi(pool=ResponsePool({'BTC_USD': [trade]})).get_trades('BTC', 'USD')
+        self.assertEqual(0.201, public_trades[0].amount)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import threading
+import time
+import unittest
+
+from exceptions import ApiError
+from rate_limiter import TokenBucket, RequestScheduler, ScheduledApi, get_error_code, PRIORITY_ORDER, \
+    PRIORITY_MARKET_DATA
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_refill(self):
+        clock = FakeClock()
+        bucket = TokenBucket(2, 4, clock=clock)
+        for _ in range(4):
+            self.assertEqual(0, bucket.wait_time())
+            bucket.take()
+        self.assertAlmostEqual(0.5, bucket.wait_time())
+        clock.now = 0.25
+        self.assertAlmostEqual(0.25, bucket.wait_time())
+        clock.now = 10
+        self.assertEqual(4, bucket.tokens)
+
+
+class Api:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = []
+
+    def get_trades(self, currency_1, currency_2):
+        self.calls.append('get_trades')
+        if self.errors:
+            raise self.errors.pop(0)
+        return []
+
+    def create_order(self, **kwargs):
+        self.calls.append('create_order')
+        if self.errors:
+            raise self.errors.pop(0)
+        return '1'
+
+    def name(self):
+        return 'api'
+
+
+class TestRequestScheduler(unittest.TestCase):
+    def test_rate(self):
+        scheduler = RequestScheduler(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            scheduler.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_priority(self):
+        scheduler = RequestScheduler(rate=10, capacity=1)
+        scheduler.acquire()
+        served = []
+
+        def acquire(priority):
+            scheduler.acquire(priority)
+            served.append(priority)
+
+        threads = []
+        for priority in (PRIORITY_MARKET_DATA, PRIORITY_MARKET_DATA, PRIORITY_ORDER):
+            thread = threading.Thread(target=acquire, args=(priority,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        self.assertEqual([PRIORITY_ORDER, PRIORITY_MARKET_DATA, PRIORITY_MARKET_DATA], served)
+
+    def test_back_off(self):
+        scheduler = RequestScheduler(rate=100, backoff=0.05)
+        api = ScheduledApi(Api([ApiError(-1003, 'Too many requests'), ApiError(-1003, 'Too many requests')]),
+                           scheduler)
+        start = time.monotonic()
+        self.assertEqual([], api.get_trades('BTC', 'USD'))
+        # 0.05 + 0.1 seconds
+        self.assertGreaterEqual(time.monotonic() - start, 0.14)
+        self.assertEqual(3, len(api._api.calls))
+
+    def test_exmo_back_off(self):
+        scheduler = RequestScheduler(rate=100, backoff=0.001)
+        api = ScheduledApi(Api([ApiError('Error 40015: Too many requests, rate limit exceeded'),
+                                ApiError('Error 40016: Maintenance work in progress')]), scheduler)
+        self.assertEqual([], api.get_trades('BTC', 'USD'))
+        self.assertEqual(3, len(api._api.calls))
+        self.assertGreater(scheduler.paused_until, 0)
+
+    def test_other_errors_not_retried(self):
+        api = ScheduledApi(Api([ApiError('Error 50304: Order was not found')]), RequestScheduler(rate=100))
+        with self.assertRaises(ApiError):
+            api.get_trades('BTC', 'USD')
+        self.assertEqual(1, len(api._api.calls))
+
+    def test_retries_exhausted(self):
+        scheduler = RequestScheduler(rate=100, backoff=0.001, max_retries=1)
+        api = ScheduledApi(Api([ConnectionResetError()] * 3), scheduler)
+        with self.assertRaises(ConnectionResetError):
+            api.get_trades('BTC', 'USD')
+        self.assertEqual(2, len(api._api.calls))
+
+    def test_create_order_not_repeated(self):
+        scheduler = RequestScheduler(rate=100, backoff=0.001)
+        api = ScheduledApi(Api([ConnectionResetError()]), scheduler)
+        with self.assertRaises(ConnectionResetError):
+            api.create_order(quantity=1)
+        self.assertEqual(['create_order'], api._api.calls)
+        self.assertGreater(scheduler.paused_until, 0)
+
+    def test_unscheduled_attributes(self):
+        api = ScheduledApi(Api(), RequestScheduler(rate=1))
+        self.assertEqual('api', api.name())
+
+    def test_error_code(self):
+        self.assertEqual(-1015, get_error_code(ApiError(-1015, 'Too many orders')))
+        self.assertEqual(40016, get_error_code(ApiError('Error 40016: Maintenance work in progress')))
+        self.assertIsNone(get_error_code(ApiError('Insufficient funds')))
+        self.assertIsNone(get_error_code(ValueError()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from real_data_test.result_cache import ResultCache, INDEX_FILE, dataset_fingerprint
+from trade_data import make_trades
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.trades = make_trades(100)
+        self.cache = ResultCache(self.folder, version='1')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_key(self):
+        cfg = {'stock_fee': 0.002, 'profit_markup': 0.01}
+        key = self.cache.get_key(cfg, self.trades)
+        self.assertEqual(key, self.cache.get_key({'profit_markup': 0.01, 'stock_fee': 0.002}, self.trades))
+        self.assertEqual(key, self.cache.get_key(dict(cfg, advice_cache='cache', result_cache='results'),
+                                                 self.trades))
+        self.assertNotEqual(key, self.cache.get_key(dict(cfg, profit_markup=0.02), self.trades))
+        self.assertNotEqual(key, self.cache.get_key(cfg, make_trades(101)))
+        self.assertNotEqual(key, ResultCache(self.folder, version='2').get_key(cfg, self.trades))
+
+    def test_fingerprint_is_computed_once(self):
+        fingerprint = dataset_fingerprint(self.trades)
+        self.trades.column('price')[0] = 1
+        self.assertEqual(fingerprint, dataset_fingerprint(self.trades))
+
+    def test_put_get(self):
+        cfg = {'profit_markup': 0.01, 'result_cache': self.folder}
+        key = self.cache.get_key(cfg, self.trades)
+        self.assertNotIn(key, self.cache)
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, cfg, [{'profit': 1}], {'USD': 2.5})
+        self.assertIn(key, self.cache)
+        self.assertEqual(([{'profit': 1}], {'USD': 2.5}), self.cache.get(key))
+
+        run_folder = os.path.join(self.folder, 'run')
+        os.makedirs(run_folder)
+        self.cache.copy_to(key, run_folder)
+        self.assertEqual(['ok_deals.json', 'stats.json'], sorted(os.listdir(run_folder)))
+
+    def test_find(self):
+        for markup in (0.01, 0.02, 0.03):
+            cfg = {'profit_markup': markup, 'stock_fee': 0.002}
+            self.cache.put(self.cache.get_key(cfg, self.trades), cfg, [], {'USD': markup * 100})
+        other_version = ResultCache(self.folder, version='2')
+        cfg = {'profit_markup': 0.02, 'stock_fee': 0.002}
+        other_version.put(other_version.get_key(cfg, self.trades), cfg, [], {'USD': 0})
+        # killed while writing the index
+        with open(os.path.join(self.folder, INDEX_FILE), 'a') as f:
+            f.write('{"key": ')
+
+        cache = ResultCache(self.folder, version='1')
+        self.assertEqual(3, len(cache.find()))
+        self.assertEqual(3, len(cache.find(stock_fee=0.002)))
+        self.assertEqual([{'USD': 2.0}], [e['stats'] for e in cache.find(profit_markup=0.02)])
+        self.assertEqual(2, len(cache.find(all_versions=True, profit_markup=0.02)))
+        self.assertEqual([], cache.find(trend_days=3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import math
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from rolling_mean import RollingMeanIndicator
+
+
+class TestRollingMeanIndicator(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.dates = np.arange(0, 3000, 3, dtype=np.int64) // 2
+        self.prices = 1000 + np.cumsum(rng.uniform(-1, 1, len(self.dates)))
+        self.means = pd.Series(self.prices).rolling(50).mean().values
+
+    def test_update_in_chunks(self):
+        indicator = RollingMeanIndicator(50, 200)
+        for stop in (10, 11, 300, 301, 1000):
+            # provider arrays grow, already consumed deals are skipped
+            indicator.update_arrays(self.dates[:stop], self.prices[:stop])
+            expected = self.means[stop - 1]
+            if math.isnan(expected):
+                self.assertTrue(math.isnan(indicator.mean_at_latest()))
+            else:
+                self.assertAlmostEqual(expected, indicator.mean_at_latest(), 9)
+
+    def test_mean_at(self):
+        indicator = RollingMeanIndicator(50, 200)
+        indicator.update_arrays(self.dates, self.prices)
+        timestamp = int(self.dates[-1]) - 150
+        index = int(np.searchsorted(self.dates, timestamp, side='left'))
+        self.assertAlmostEqual(self.means[index], indicator.mean_at(timestamp), 9)
+
+    def test_since(self):
+        indicator = RollingMeanIndicator(50, 200)
+        indicator.update_arrays(self.dates, self.prices)
+        last_date = int(self.dates[-1])
+        self.assertTrue(math.isnan(indicator.mean_at_latest(since=last_date - 10)))
+        self.assertFalse(math.isnan(indicator.mean_at_latest(since=last_date - 100)))
+
+    def test_mean_price(self):
+        indicator = RollingMeanIndicator(50, 200)
+        indicator.update([{'date': d, 'price': str(p)} for d, p in zip([1, 2, 3, 10], [10, 20, 30, 40])])
+        self.assertEqual(35, indicator.mean_price(8))
+
+
+if __name__ == "__main__":
+    unittest.main()
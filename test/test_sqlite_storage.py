@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlite_api import SQLiteStorage, Order
+
+
+class TestSQLiteStorage(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.storage = SQLiteStorage(os.path.join(self.folder, 'orders.db'))
+
+    def tearDown(self):
+        self.storage._db.close()
+        shutil.rmtree(self.folder)
+
+    def _create(self, order_id, order_type='RESERVE', base_order=None):
+        return self.storage.create_order({'order_id': order_id, 'type': 'buy', 'price': '100', 'quantity': '1'},
+                                         'UP', order_type, created=1, base_order=base_order)
+
+    def test_wal_and_indexes(self):
+        self.assertEqual('wal', self.storage._db.execute_sql('PRAGMA journal_mode').fetchone()[0])
+        indexes = {i.name for i in self.storage._db.get_indexes('order')}
+        self.assertIn('order_status_order_type', indexes)
+        self.assertIn('order_profile_order_type', indexes)
+
+    def test_open_orders_with_base_orders(self):
+        base = self._create('1')
+        self._create('2', 'PROFIT', base_order=base)
+        orders = {o['order_id']: o for o in self.storage.get_open_orders()}
+        self.assertIsNone(orders['1']['base_order'])
+        self.assertEqual('1', orders['2']['base_order']['order_id'])
+        self.assertEqual(100, orders['2']['base_order']['price'])
+
+    def test_archive_many(self):
+        base = self._create('1')
+        self._create('2', 'PROFIT', base_order=base)
+        self._create('3')
+        self.storage.archive_many(['2', '1'], 'COMPLETED', 10)
+        self.assertEqual(['3'], [o['order_id'] for o in self.storage.get_open_orders()])
+        archived = {o['order_id']: o for o in self.storage.get_archive_completed_orders()}
+        self.assertEqual('1', archived['2']['base_order_id'])
+        self.assertEqual(10, archived['1']['completed'])
+
+    def test_archive_many_missing_order(self):
+        self._create('1')
+        with self.assertRaises(Order.DoesNotExist):
+            self.storage.archive_many(['1', '5'], 'CANCELED', 10)
+        self.assertEqual(['1'], [o['order_id'] for o in self.storage.get_open_orders()])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from real_data_test.sweep import ResultsTable, RESULTS_FILE
+
+
+class TestResultsTable(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, RESULTS_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _read(self):
+        with open(self.path, newline='') as f:
+            reader = csv.DictReader(f)
+            return reader.fieldnames, list(reader)
+
+    def test_runner_keys_are_not_columns(self):
+        table = ResultsTable(self.path)
+        table.add({'stock_fee': 0.002, 'profit_markup': 0.01}, {'USD': 1})
+        table.add({'stock_fee': 0.002, 'profit_markup': 0.02, 'result_cache': 'cache', 'checkpoint_folder': 'cp'},
+                  {'USD': 2})
+        columns, rows = self._read()
+        self.assertEqual(['run_folder', 'profit_markup', 'stock_fee', 'stat_USD'], columns)
+        self.assertEqual(['1', '2'], [row['stat_USD'] for row in rows])
+
+    def test_sweep_started_again(self):
+        cfg = {'stock_fee': 0.002, 'profit_markup': 0.01}
+        ResultsTable(self.path).add(cfg, {'USD': 1})
+        table = ResultsTable(self.path)
+        self.assertIn(dict(cfg, result_cache='cache'), table)
+        self.assertFalse(table.add(dict(cfg, result_cache='cache'), {'USD': 1}))
+        # a run with a new config key extends the header of the existing file
+        self.assertTrue(table.add(dict(cfg, trend_days=2), {'USD': 3}))
+        columns, rows = self._read()
+        self.assertEqual(['run_folder', 'profit_markup', 'stock_fee', 'stat_USD', 'trend_days'], columns)
+        self.assertEqual([('1', ''), ('3', '2')], [(row['stat_USD'], row['trend_days']) for row in rows])
+
+
+if __name__ == "__main__":
+    unittest.main()
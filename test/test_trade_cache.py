@@ -0,0 +1,94 @@
+import unittest
+
+from trade_cache import UserTradeCache, CachedTradesApi
+
+
+def trade(trade_id, order_id, quantity=1.0):
+    return {'trade_id': trade_id, 'order_id': order_id, 'quantity': str(quantity), 'price': '100',
+            'type': 'buy', 'pair': 'BTC_USD', 'date': trade_id}
+
+
+class Api:
+    def __init__(self, trades=()):
+        # the newest first
+        self.trades = list(trades)
+        self.calls = []
+        self.partially_completed_calls = 0
+
+    def add(self, t):
+        self.trades.insert(0, t)
+
+    def get_user_trades(self, currency_1, currency_2, offset=0, limit=100):
+        self.calls.append((offset, limit))
+        return self.trades[offset:offset + limit]
+
+    def is_order_partially_completed(self, order_id):
+        self.partially_completed_calls += 1
+        return False
+
+    def get_balances(self):
+        return {'BTC': 1}
+
+
+class TestUserTradeCache(unittest.TestCase):
+    def test_incremental_poll(self):
+        api = Api([trade(i, 'o' + str(i)) for i in range(10, 0, -1)])
+        cache = UserTradeCache(api.get_user_trades, 'BTC', 'USD', initial_limit=5, poll_limit=2)
+        self.assertEqual(5, cache.poll())
+        self.assertEqual([(0, 5)], api.calls)
+        self.assertEqual([10, 9, 8, 7, 6], [t['trade_id'] for t in cache.get_trades()])
+
+        self.assertEqual(0, cache.poll())
+        self.assertEqual((0, 2), api.calls[-1])
+
+        for i in range(11, 16):
+            api.add(trade(i, 'o' + str(i)))
+        api.calls = []
+        self.assertEqual(5, cache.poll())
+        # pages are read until a known trade
+        self.assertEqual([(0, 2), (2, 2), (4, 2)], api.calls)
+        self.assertEqual(10, len(cache.get_trades()))
+        self.assertEqual(15, cache.get_trades()[0]['trade_id'])
+
+    def test_orders(self):
+        api = Api([trade(3, 'b', 0.5), trade(2, 'a', 0.4), trade(1, 'a', 0.6)])
+        cache = UserTradeCache(api.get_user_trades, 'BTC', 'USD')
+        cache.poll()
+        self.assertEqual({'a', 'b'}, cache.get_traded_order_ids())
+        self.assertTrue(cache.is_order_filled('a', 1.0))
+        self.assertFalse(cache.is_order_filled('b', 1.0))
+        self.assertTrue(cache.is_order_partially_completed('b'))
+        self.assertFalse(cache.is_order_partially_completed('c'))
+
+    def test_max_trades(self):
+        api = Api([trade(i, 'o' + str(i % 2)) for i in range(6, 0, -1)])
+        cache = UserTradeCache(api.get_user_trades, 'BTC', 'USD', max_trades=3)
+        cache.poll()
+        self.assertEqual([6, 5, 4], [t['trade_id'] for t in cache.get_trades()])
+        self.assertEqual(2, len(cache.get_order_trades('o0')))
+
+
+class TestCachedTradesApi(unittest.TestCase):
+    def test_get_user_trades(self):
+        api = Api([trade(1, 'a')])
+        cached = CachedTradesApi(api, poll_limit=1)
+        self.assertEqual([1], [t['trade_id'] for t in cached.get_user_trades('BTC', 'USD')])
+        api.add(trade(2, 'b'))
+        self.assertEqual([2, 1], [t['trade_id'] for t in cached.get_user_trades('BTC', 'USD')])
+        self.assertEqual([1], [t['trade_id'] for t in cached.get_user_trades('BTC', 'USD', offset=1, limit=1)])
+        self.assertEqual({'BTC': 1}, cached.get_balances())
+
+    def test_is_order_partially_completed(self):
+        api = Api([trade(1, 'a')])
+        cached = CachedTradesApi(api)
+        self.assertFalse(cached.is_order_partially_completed('a'))
+        self.assertEqual(1, api.partially_completed_calls)
+        cached.get_user_trades('BTC', 'USD')
+        api.add(trade(2, 'b'))
+        self.assertTrue(cached.is_order_partially_completed('b'))
+        self.assertFalse(cached.is_order_partially_completed('c'))
+        self.assertEqual(1, api.partially_completed_calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
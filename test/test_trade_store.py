@@ -0,0 +1,146 @@
+import json
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from trade_store import TradeStore, TradeColumns, SharedTrades, TradeRing, convert_json_folder, load_trades
+
+
+def _sum_prices(trades):
+    return float(trades.column('price').sum())
+
+
+class TestTradeStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _trade(self, trade_id, date, price):
+        return {'trade_id': trade_id, 'date': date, 'price': str(price), 'quantity': '0.5',
+                'amount': str(price * 0.5), 'type': 'buy'}
+
+    def test_append_skips_known_trades(self):
+        store = TradeStore(os.path.join(self.folder, 'store'))
+        self.assertEqual(2, store.append([self._trade(2, 20, 110), self._trade(1, 10, 100)]))
+        self.assertEqual(1, store.append([self._trade(2, 20, 110), self._trade(3, 30, 120)]))
+        self.assertEqual([1, 2, 3], store.column('trade_id').tolist())
+        self.assertEqual([100.0, 110.0, 120.0], store.column('price').tolist())
+
+    def test_reopen(self):
+        path = os.path.join(self.folder, 'store')
+        TradeStore(path).append([self._trade(1, 10, 100), self._trade(2, 20, 110)])
+        self.assertTrue(TradeStore.is_store(path))
+        store = TradeStore(path)
+        self.assertEqual(2, len(store))
+        self.assertEqual(2, store.last_trade_id())
+
+    def test_append_after_torn_write(self):
+        path = os.path.join(self.folder, 'store')
+        TradeStore(path).append([self._trade(1, 10, 100)])
+        # crash after the trade_id column of the second trade was written
+        with open(os.path.join(path, 'trade_id.bin'), 'ab') as f:
+            np.array([2], dtype=np.int64).tofile(f)
+        store = TradeStore(path)
+        self.assertEqual(1, len(store))
+        self.assertEqual(1, store.append([self._trade(3, 30, 120)]))
+        self.assertEqual([1, 3], store.column('trade_id').tolist())
+        self.assertEqual([10, 30], store.column('date').tolist())
+        self.assertEqual([100.0, 120.0], store.column('price').tolist())
+
+    def test_get_deals_window(self):
+        store = TradeStore(os.path.join(self.folder, 'store'))
+        store.append([self._trade(i, i * 10, 100 + i) for i in range(10)])
+        deals = store.get_deals(since=20, until=50)
+        self.assertEqual([3, 4, 5], [d['trade_id'] for d in deals])
+        self.assertEqual(103.0, deals[0]['price'])
+
+    def test_convert_json_folder(self):
+        json_folder = os.path.join(self.folder, 'json')
+        os.makedirs(json_folder)
+        with open(os.path.join(json_folder, '1.json'), 'w') as f:
+            json.dump({'1': self._trade(1, 10, 100), '2': self._trade(2, 20, 110)}, f)
+        with open(os.path.join(json_folder, '2.json'), 'w') as f:
+            json.dump({'2': self._trade(2, 20, 110), '3': self._trade(3, 30, 120)}, f)
+        store = convert_json_folder(json_folder, os.path.join(self.folder, 'store'))
+        self.assertEqual([10, 20, 30], store.column('date').tolist())
+
+    def test_store_pickled_by_folder(self):
+        store = TradeStore(os.path.join(self.folder, 'store'))
+        store.append([self._trade(i, i * 10, 100 + i) for i in range(10)])
+        self.assertLess(len(pickle.dumps(store)), 200)
+        self.assertEqual(list(range(10)), pickle.loads(pickle.dumps(store)).column('trade_id').tolist())
+
+
+class TestSharedTrades(unittest.TestCase):
+    def setUp(self):
+        deals = [{'trade_id': i, 'date': i * 10, 'price': str(100 + i), 'quantity': '0.5'} for i in range(100)]
+        self.trades = TradeColumns.from_deals(deals)
+        self.shared = SharedTrades.publish(self.trades)
+
+    def tearDown(self):
+        self.shared.unlink()
+
+    def test_publish(self):
+        self.assertEqual(100, len(self.shared))
+        self.assertEqual(self.trades.column('price').tolist(), self.shared.column('price').tolist())
+        self.assertEqual(50.0, self.shared.column('amount')[0])
+        self.assertEqual(self.trades.get_deals(since=200, until=300), self.shared.get_deals(since=200, until=300))
+        with self.assertRaises(ValueError):
+            self.shared.column('price')[0] = 1
+
+    def test_attach_in_other_process(self):
+        self.assertLess(len(pickle.dumps(self.shared)), 200)
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            self.assertEqual(_sum_prices(self.trades), pool.apply(_sum_prices, (self.shared,)))
+
+    def test_load_trades_json_folder(self):
+        folder = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(folder, '1.json'), 'w') as f:
+                json.dump({'2': {'trade_id': 2, 'date': 20, 'price': '110', 'quantity': '1'},
+                           '1': {'trade_id': 1, 'date': 10, 'price': '100', 'quantity': '1'}}, f)
+            trades = load_trades(folder, shared=True)
+            try:
+                self.assertIsInstance(trades, SharedTrades)
+                self.assertEqual([1, 2], trades.column('trade_id').tolist())
+            finally:
+                trades.unlink()
+        finally:
+            shutil.rmtree(folder)
+
+
+class TestTradeRing(unittest.TestCase):
+    def _trade(self, trade_id):
+        return {'trade_id': trade_id, 'date': trade_id * 10, 'price': str(100 + trade_id), 'quantity': '1'}
+
+    def test_keeps_last_trades(self):
+        ring = TradeRing(3)
+        self.assertEqual(2, ring.append([self._trade(2), self._trade(1)]))
+        dates, prices = ring.get_deal_arrays()
+        self.assertEqual([10, 20], dates.tolist())
+        self.assertEqual(0, ring.append([self._trade(2)]))
+        for trade_id in range(3, 10):
+            ring.append([self._trade(trade_id)])
+        self.assertEqual([7, 8, 9], [t['trade_id'] for t in ring.get_deals()])
+        self.assertEqual([80, 90], ring.get_deal_arrays(since=70)[0].tolist())
+        self.assertEqual((90, 9), ring.last_key())
+
+    def test_views_not_overwritten(self):
+        ring = TradeRing(2)
+        ring.append([self._trade(1), self._trade(2)])
+        dates, prices = ring.get_deal_arrays()
+        ring.append([self._trade(i) for i in range(3, 10)])
+        self.assertEqual([10, 20], dates.tolist())
+        self.assertEqual([80, 90], ring.get_deal_arrays()[0].tolist())
+        self.assertEqual(2, len(ring))
+
+
+if __name__ == "__main__":
+    unittest.main()
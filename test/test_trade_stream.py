@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+
+from exmo_api import ExmoPublicApi
+from http_pool import ConnectionPool
+from replay_server import ReplayServer
+from trade_store import TradeColumns
+from trade_stream import TradeStream, PollingTradeStream
+
+
+def trade(trade_id, date=None):
+    return {'trade_id': trade_id, 'date': date if date is not None else trade_id, 'price': '100',
+            'quantity': '1', 'amount': '100', 'type': 'buy'}
+
+
+class ListStream(TradeStream):
+    def __init__(self, reads, **kwargs):
+        super(ListStream, self).__init__(**kwargs)
+        self._reads = list(reads)
+
+    async def _read(self):
+        return self._reads.pop(0) if self._reads else None
+
+
+def collect(stream):
+    async def read():
+        return [t['trade_id'] async for t in stream]
+
+    return asyncio.run(read())
+
+
+class TestTradeStream(unittest.TestCase):
+    def test_dedup(self):
+        stream = ListStream([[trade(2), trade(1)], [trade(3), trade(2)], [trade(3)], [trade(5), trade(4), trade(3)]])
+        self.assertEqual([1, 2, 3, 4, 5], collect(stream))
+        self.assertEqual([], stream.gaps)
+
+    def test_gap_without_overlap(self):
+        gaps = []
+        stream = ListStream([[trade(2), trade(1)], [trade(5), trade(4)]], on_gap=lambda *gap: gaps.append(gap))
+        self.assertEqual([1, 2, 4, 5], collect(stream))
+        self.assertEqual([(2, 4)], stream.gaps)
+        self.assertEqual([(2, 4)], gaps)
+
+    def test_gap_contiguous_ids(self):
+        stream = ListStream([[trade(1)], [trade(2)], [trade(4), trade(3)], [trade(6)]], contiguous_ids=True)
+        self.assertEqual([1, 2, 3, 4, 6], collect(stream))
+        self.assertEqual([(4, 6)], stream.gaps)
+
+    def test_batches(self):
+        stream = ListStream([[trade(2), trade(1)], [trade(2)], [trade(3), trade(2)]])
+
+        async def read():
+            return [[t['trade_id'] for t in batch] async for batch in stream.batches()]
+
+        self.assertEqual([[1, 2], [3]], asyncio.run(read()))
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.now = 10
+        trades = TradeColumns.from_deals([trade(i, 10 * i) for i in range(1, 31)])
+        self.server = ReplayServer(trades, clock=lambda: self.now, limit=5).start()
+        host, port = self.server.address
+        self.pool = ConnectionPool(timeout=5)
+        self.api = ExmoPublicApi(host, port, scheme='http', pool=self.pool)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def test_get_trades(self):
+        self.now = 45
+        self.assertEqual([4, 3, 2, 1], [t['trade_id'] for t in self.api.get_trades('BTC', 'USD')])
+        self.now = 300
+        trades = self.api.get_trades('BTC', 'USD')
+        self.assertEqual([30, 29, 28, 27, 26], [t['trade_id'] for t in trades])
+        self.assertEqual(100.0, trades[0]['price'])
+        self.assertEqual([], self.api.get_trades('BTC', 'EUR'))
+
+    def test_polling_stream(self):
+        stream = PollingTradeStream(self.api, period=0.01, max_period=0.05)
+        times = iter([20, 40, 60, 200, 300])
+
+        async def read():
+            ids = []
+            async for batch in stream.batches():
+                ids.extend(t['trade_id'] for t in batch)
+                try:
+                    self.now = next(times)
+                except StopIteration:
+                    stream.close()
+            return ids
+
+        self.assertEqual([1, 2, 3, 4, 5, 6, 16, 17, 18, 19, 20, 26, 27, 28, 29, 30], asyncio.run(read()))
+        self.assertEqual([(60, 160), (200, 260)], stream.gaps)
+
+
+if __name__ == "__main__":
+    unittest.main()
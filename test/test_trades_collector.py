@@ -0,0 +1,131 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from disk_deal_reader import DiskDealReader
+from trade_store import TradeStore, load_segments, load_trades
+from trade_stream import TradeStream
+from trades_collector import SegmentWriter, Collector
+
+
+def trade(trade_id):
+    return {'trade_id': trade_id, 'date': 10 * trade_id, 'price': '100', 'quantity': '1', 'amount': '100',
+            'type': 'buy'}
+
+
+class ListStream(TradeStream):
+    def __init__(self, reads):
+        super(ListStream, self).__init__()
+        self._reads = list(reads)
+
+    async def _read(self):
+        return self._reads.pop(0) if self._reads else None
+
+
+class TestSegmentWriter(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _check_rotation(self, fmt):
+        writer = SegmentWriter(self.folder, fmt=fmt, segment_trades=3)
+        self.assertEqual(2, writer.append([trade(2), trade(1)]))
+        self.assertEqual(3, writer.append([trade(i) for i in range(1, 6)]))
+        writer.close()
+        self.assertEqual(2, len(os.listdir(self.folder)))
+
+        # restarted writer skips written trades
+        writer = SegmentWriter(self.folder, fmt=fmt, segment_trades=3)
+        self.assertEqual(1, writer.append([trade(5), trade(6)]))
+        writer.close()
+        self.assertEqual(3, len(os.listdir(self.folder)))
+        self.assertEqual(list(range(1, 7)), load_segments(self.folder).column('trade_id').tolist())
+
+    def test_binary(self):
+        self._check_rotation('binary')
+        self.assertEqual([10, 20, 30], TradeStore(os.path.join(self.folder, '10')).column('date').tolist())
+
+    def test_ndjson(self):
+        self._check_rotation('ndjson')
+        with open(os.path.join(self.folder, '40.ndjson')) as f:
+            self.assertEqual(2, len(f.readlines()))
+
+    def test_torn_segment(self):
+        writer = SegmentWriter(self.folder)
+        writer.append([trade(1)])
+        writer.close()
+        # killed after writing the first column of the next trade
+        with open(os.path.join(self.folder, '10', 'trade_id.bin'), 'ab') as f:
+            f.write(b'\0' * 8)
+        writer = SegmentWriter(self.folder)
+        self.assertEqual(1, writer.append([dict(trade(2), date=10)]))
+        writer.close()
+        store = TradeStore(os.path.join(self.folder, '10'))
+        self.assertEqual([1, 2], store.column('trade_id').tolist())
+        self.assertEqual([10, 10], store.column('date').tolist())
+
+    def test_torn_ndjson_line(self):
+        writer = SegmentWriter(self.folder, fmt='ndjson')
+        writer.append([trade(1)])
+        writer.close()
+        with open(os.path.join(self.folder, '10.ndjson'), 'a') as f:
+            f.write('{"trade_id": 2, "da')
+        writer = SegmentWriter(self.folder, fmt='ndjson')
+        self.assertEqual(1, writer.append([dict(trade(2), date=10)]))
+        writer.close()
+        self.assertEqual([1, 2], load_segments(self.folder).column('trade_id').tolist())
+
+    def test_fsync_cadence(self):
+        writer = SegmentWriter(self.folder, fsync_trades=3, fsync_seconds=1000)
+        writer.append([trade(1), trade(2)])
+        self.assertEqual(2, writer._unsynced)
+        writer.append([trade(3)])
+        self.assertEqual(0, writer._unsynced)
+        writer.close()
+
+
+class TestCollector(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_feeds(self):
+        collector = Collector(self.folder, ring_size=2, fmt='ndjson')
+        collector.add_feed('exmo', ListStream([[trade(2), trade(1)], [trade(3), trade(2)]]), 'BTC', 'USD')
+        collector.add_feed('binance', ListStream([[trade(7)]]), 'BTC', 'USDT')
+        asyncio.run(collector.run())
+        self.assertEqual([2, 3], [t['trade_id'] for t in collector.get_ring('exmo', 'BTC', 'USD').get_deals()])
+        self.assertEqual([70], collector.get_ring('binance', 'BTC', 'USDT').get_deal_arrays()[0].tolist())
+        self.assertEqual([1, 2, 3],
+                         load_segments(os.path.join(self.folder, 'exmo', 'BTC_USD')).column('trade_id').tolist())
+
+    def _check_readers(self, fmt):
+        collector = Collector(self.folder, fmt=fmt, segment_trades=2)
+        collector.add_feed('exmo', ListStream([[trade(2), trade(1)], [trade(3), trade(4), trade(5)]]), 'BTC', 'USD')
+        asyncio.run(collector.run())
+        folder = collector.get_folder('exmo', 'BTC', 'USD')
+        self.assertEqual(3, len(os.listdir(folder)))
+        self.assertEqual([1, 2, 3, 4, 5], load_trades(folder).column('trade_id').tolist())
+        reader = DiskDealReader(folder)
+        self.assertEqual([1, 2, 3, 4, 5], [d['trade_id'] for d in reader.get_deals()])
+        self.assertEqual([30, 40], [d['date'] for d in reader.get_deals(since=20, until=40)])
+        self.assertEqual([40, 50], reader.get_deal_arrays(since=30)[0].tolist())
+        # the collector folder holds the folders of exchanges, not trades
+        with self.assertRaises(ValueError):
+            load_trades(self.folder)
+
+    def test_binary_segments_readers(self):
+        self._check_readers('binary')
+
+    def test_ndjson_segments_readers(self):
+        self._check_readers('ndjson')
+
+
+if __name__ == "__main__":
+    unittest.main()
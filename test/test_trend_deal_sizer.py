@@ -0,0 +1,137 @@
+import random
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from trade_store import date_range
+from trend_deal_sizer import TrendDealSizer
+
+
+class ListDealsProvider:
+    def __init__(self, deals):
+        self.deals = deals
+
+    def get_deals(self):
+        return self.deals
+
+
+class ArraysProvider:
+    def __init__(self, deals):
+        self.dates = np.array([d['date'] for d in deals], dtype=np.int64)
+        self.prices = np.array([float(d['price']) for d in deals])
+        self.index = len(deals)
+        self.requested = []
+
+    def get_deal_arrays(self, since=None, until=None):
+        start, stop = date_range(self.dates[:self.index], since, until)
+        self.requested.append(stop - start)
+        return self.dates[start:stop], self.prices[start:stop]
+
+
+def reference_deal_size(deals, now, trend_days, window, diff_hours, mean_price_period):
+    deals = [d for d in deals if d['date'] > now - trend_days * 24 * 3600]
+    df = pd.DataFrame({'date': [d['date'] for d in deals], 'price': [float(d['price']) for d in deals]})
+    df['mean'] = df['price'].rolling(window).mean()
+    last_deal = df.iloc[-1]
+    first_deal = df[df['date'] >= int(last_deal['date']) - diff_hours * 3600].iloc[0]
+    prices = df[int(last_deal['date']) - df['date'] < mean_price_period]['price']
+    return last_deal['mean'], first_deal['mean'], prices.mean()
+
+
+class TestTrendDealSizer(unittest.TestCase):
+    def setUp(self):
+        random.seed(1)
+        price = 10000
+        self.deals = []
+        for i in range(20000):
+            price += random.uniform(-10, 10.5)
+            self.deals.append({'trade_id': i, 'date': 1000000 + i * 20, 'price': str(price)})
+        self.now = self.deals[-1]['date'] + 5
+
+    def _sizer(self, **kwargs):
+        sizer = TrendDealSizer(ListDealsProvider(self.deals), trend_days=3, trend_rolling_window=500,
+                               trend_diff_hours=5, mean_price_period=100, trend_multiplier=30,
+                               currency_1_deal_size=0.002, trend_max_deal_size=1, **kwargs)
+        sizer._get_time = lambda: self.now
+        return sizer
+
+    def test_matches_rolling_mean(self):
+        profile, profit_markup, avg_price, deal_size = self._sizer().get_deal_size()
+        last_mean, first_mean, ref_avg_price = reference_deal_size(self.deals, self.now, 3, 500, 5, 100)
+        diff = (last_mean - first_mean) / first_mean
+        self.assertEqual('UP' if diff > 0 else 'DOWN', profile)
+        self.assertAlmostEqual(ref_avg_price, avg_price, 6)
+        self.assertAlmostEqual((abs(diff) * 30 + 1) * 0.002, deal_size, 9)
+
+    def test_deal_arrays_provider(self):
+        sizer = self._sizer()
+        expected = sizer.get_deal_size()
+        sizer._deals_provider = ArraysProvider(self.deals)
+        self.assertEqual(expected, sizer.get_deal_size())
+        # only the trend_days window is requested
+        self.assertEqual([3 * 24 * 3600 // 20], sizer._deals_provider.requested)
+
+    def test_incremental_requests_new_deals(self):
+        full = self._sizer()
+        incremental = self._sizer(trend_incremental=True)
+        full._deals_provider = ArraysProvider(self.deals)
+        incremental._deals_provider = ArraysProvider(self.deals)
+        for index in range(1000, len(self.deals), 1500):
+            self.now = self.deals[index - 1]['date'] + 5
+            full._deals_provider.index = index
+            incremental._deals_provider.index = index
+            expected = full.get_deal_size()
+            actual = incremental.get_deal_size()
+            self.assertEqual(expected[0], actual[0])
+            np.testing.assert_allclose(expected[3], actual[3], rtol=1e-9)
+        # after the first call only deals since the last consumed one are requested
+        self.assertTrue(all(count <= 1501 for count in incremental._deals_provider.requested[1:]))
+
+    def test_incremental_matches_full_recalculation(self):
+        class GrowingProvider:
+            def __init__(self, deals):
+                self.deals = deals
+                self.index = 0
+
+            def get_deals(self):
+                return self.deals[:self.index]
+
+        full = self._sizer()
+        incremental = self._sizer(trend_incremental=True)
+        full._deals_provider = GrowingProvider(self.deals)
+        incremental._deals_provider = GrowingProvider(self.deals)
+        for index in range(1000, len(self.deals), 1500):
+            self.now = self.deals[index - 1]['date'] + 5
+            full._deals_provider.index = index
+            incremental._deals_provider.index = index
+            expected = full.get_deal_size()
+            actual = incremental.get_deal_size()
+            self.assertEqual(expected[0], actual[0])
+            self.assertAlmostEqual(expected[2], actual[2], 6)
+            # deal size is NaN until the rolling window is filled
+            np.testing.assert_allclose(expected[3], actual[3], rtol=1e-9)
+
+    def test_no_deals(self):
+        self.deals = []
+        self.assertEqual((None, None, None, None), self._sizer().get_deal_size())
+
+    def test_deal_sizes_match_deal_size(self):
+        sizer = self._sizer()
+        provider = ArraysProvider(self.deals)
+        sizer._deals_provider = provider
+        times = [self.deals[0]['date'] + 5, self.deals[0]['date'] + 5000] + \
+                [self.deals[i]['date'] + 7 for i in range(1000, len(self.deals), 1500)]
+        cutoffs = [0] + [t - 10 for t in times[1:]]
+        expected = []
+        for now, cutoff in zip(times, cutoffs):
+            self.now = now
+            provider.index = int(np.searchsorted(provider.dates, cutoff, side='left'))
+            expected.append(sizer.get_deal_size())
+        actual = sizer.get_deal_sizes(provider.dates, provider.prices, times, cutoffs)
+        self.assertEqual((None, None, None, None), actual[0])
+        np.testing.assert_equal(expected, actual)
+
+
+if __name__ == "__main__":
+    unittest.main()
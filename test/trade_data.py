@@ -0,0 +1,7 @@
+from trade_store import TradeColumns
+
+
+def make_trades(first_price, count=100, first_date=0):
+    """Trade columns with a trade every 10 seconds and a price growing by 1 from first_price."""
+    return TradeColumns.from_deals([{'trade_id': i, 'date': first_date + i * 10, 'price': first_price + i,
+                                     'quantity': 1, 'amount': first_price + i} for i in range(count)])
@@ -0,0 +1,139 @@
+import logging
+import threading
+
+logger = logging.getLogger('xmb')
+
+
+class UserTradeCache:
+    """Deduplicated user trades of a currency pair, keyed by trade_id.
+
+    The first poll reads `initial_limit` last trades. Later polls read pages of `poll_limit` trades
+    (exmo returns the newest first) until a known trade is reached, so only new trades are transferred
+    and fills are not lost when more than a page of trades happened between polls.
+    At most max_trades newest trades are kept.
+    """
+
+    def __init__(self, get_user_trades, currency_1, currency_2, initial_limit=100, poll_limit=10, max_pages=20,
+                 max_trades=10000):
+        self._get_user_trades = get_user_trades
+        self._currency_1 = currency_1
+        self._currency_2 = currency_2
+        self._initial_limit = initial_limit
+        self._poll_limit = poll_limit
+        self._max_pages = max_pages
+        self._max_trades = max_trades
+        self._trades = {}
+        self._trades_by_order = {}
+        self._last_trade_id = None
+        self._polled = False
+        self._lock = threading.Lock()
+
+    def poll(self):
+        """Reads trades newer than the last known one. Returns the number of new trades."""
+        with self._lock:
+            new_trades = self._read_new_trades()
+            for trade in reversed(new_trades):
+                self._add(trade)
+            self._polled = True
+            self._evict()
+            return len(new_trades)
+
+    def _read_new_trades(self):
+        if not self._polled:
+            return self._get_user_trades(self._currency_1, self._currency_2, offset=0, limit=self._initial_limit)
+        new_trades = []
+        for page in range(self._max_pages):
+            trades = self._get_user_trades(self._currency_1, self._currency_2, offset=page * self._poll_limit,
+                                           limit=self._poll_limit)
+            last_trade_id = self._last_trade_id if self._last_trade_id is not None else -1
+            new_trades.extend(t for t in trades if int(t['trade_id']) > last_trade_id)
+            if len(trades) < self._poll_limit or any(int(t['trade_id']) <= last_trade_id for t in trades):
+                return new_trades
+        logger.warning('More than {} new user trades, older ones are not read'.format(
+            self._max_pages * self._poll_limit))
+        return new_trades
+
+    def _add(self, trade):
+        trade_id = int(trade['trade_id'])
+        if trade_id in self._trades:
+            return
+        self._trades[trade_id] = trade
+        self._trades_by_order.setdefault(str(trade['order_id']), []).append(trade)
+        if self._last_trade_id is None or trade_id > self._last_trade_id:
+            self._last_trade_id = trade_id
+
+    def _evict(self):
+        if len(self._trades) <= self._max_trades:
+            return
+        for trade_id in sorted(self._trades)[:len(self._trades) - self._max_trades]:
+            trade = self._trades.pop(trade_id)
+            order_trades = self._trades_by_order[str(trade['order_id'])]
+            order_trades.remove(trade)
+            if not order_trades:
+                del self._trades_by_order[str(trade['order_id'])]
+
+    def get_trades(self):
+        """Cached trades, the newest first like in exmo responses."""
+        with self._lock:
+            return [self._trades[trade_id] for trade_id in sorted(self._trades, reverse=True)]
+
+    def get_order_trades(self, order_id):
+        with self._lock:
+            return list(self._trades_by_order.get(str(order_id), ()))
+
+    def get_traded_order_ids(self):
+        with self._lock:
+            return set(self._trades_by_order)
+
+    def get_filled_quantity(self, order_id):
+        return sum(float(t['quantity']) for t in self.get_order_trades(order_id))
+
+    def is_order_filled(self, order_id, quantity):
+        """Whether trades of the order sum up to its quantity (with rounding tolerance of exchange amounts)."""
+        return self.get_filled_quantity(order_id) >= float(quantity) * (1 - 1e-6)
+
+    def is_order_partially_completed(self, order_id):
+        return str(order_id) in self._trades_by_order
+
+
+class CachedTradesApi:
+    """Exmo api whose user trades are answered from a UserTradeCache per currency pair.
+
+    get_user_trades polls only for new trades and returns all cached trades instead of the last page.
+    Other calls are passed to the wrapped api.
+    """
+
+    def __init__(self, api, **kwargs):
+        self._api = api
+        self._cache_args = kwargs
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
+    def get_cache(self, currency_1, currency_2):
+        with self._lock:
+            key = (currency_1, currency_2)
+            if key not in self._caches:
+                self._caches[key] = UserTradeCache(self._api.get_user_trades, currency_1, currency_2,
+                                                   **self._cache_args)
+            return self._caches[key]
+
+    def get_user_trades(self, currency_1, currency_2, offset=0, limit=None):
+        cache = self.get_cache(currency_1, currency_2)
+        cache.poll()
+        trades = cache.get_trades()
+        return trades[offset:] if limit is None else trades[offset:offset + limit]
+
+    def is_order_partially_completed(self, order_id):
+        # trades of the order are looked up in the caches, the exchange is asked only before the first poll
+        with self._lock:
+            caches = list(self._caches.values())
+        for cache in caches:
+            cache.poll()
+            if cache.is_order_partially_completed(order_id):
+                return True
+        if caches:
+            return False
+        return self._api.is_order_partially_completed(order_id)
@@ -0,0 +1,434 @@
+import argparse
+import json
+import logging
+import os
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from order import Trade
+
+logger = logging.getLogger('xmb')
+
+COLUMNS = (
+    ('trade_id', np.int64),
+    ('date', np.int64),
+    ('price', np.float64),
+    ('quantity', np.float64),
+    ('amount', np.float64),
+)
+
+# extension of the json lines segments of trades_collector.SegmentWriter
+NDJSON_EXTENSION = '.ndjson'
+
+
+def get_value(trade, name):
+    """Value of a column of an exmo format trade, the amount is computed when the trade has none."""
+    if name in trade:
+        return trade[name]
+    if name == 'amount':
+        return float(trade['price']) * float(trade['quantity'])
+    return 0
+
+
+class TradeColumns:
+    """Trades sorted by (date, trade_id) as numpy arrays, one per column of COLUMNS."""
+
+    def __init__(self, columns):
+        self._columns = columns
+
+    @classmethod
+    def from_deals(cls, deals):
+        """Columns of exmo format dicts already sorted by (date, trade_id)."""
+        return cls({name: np.array([get_value(t, name) for t in deals], dtype=dtype) for name, dtype in COLUMNS})
+
+    def __len__(self):
+        return len(self._columns['trade_id'])
+
+    def column(self, name):
+        return self._columns[name]
+
+    def get_range(self, since=None, until=None):
+        """Returns (start, stop) indexes of trades with since < date <= until."""
+        return date_range(self._columns['date'], since, until)
+
+    def get_deals(self, since=None, until=None):
+        """Trades in the exmo dict format expected by deal sizers and the market simulator."""
+        return self.slice_deals(*self.get_range(since, until))
+
+    def slice_deals(self, start, stop):
+        names = [name for name, dtype in COLUMNS]
+        columns = [self._columns[name][start:stop].tolist() for name in names]
+        return [Trade.from_values(names, row) for row in zip(*columns)]
+
+
+class SharedTrades(TradeColumns):
+    """Trade columns in a multiprocessing shared memory block.
+
+    Only the block name is pickled: a copy unpickled in another process attaches zero-copy views
+    of the same memory. The publishing process must unlink() the block when it is not needed.
+    """
+
+    def __init__(self, name, length):
+        self._name = name
+        self._length = length
+        self._shm = shared_memory.SharedMemory(name)
+        super(SharedTrades, self).__init__(self._views())
+
+    @classmethod
+    def publish(cls, trades):
+        length = len(trades)
+        size = max(1, sum(np.dtype(dtype).itemsize for name, dtype in COLUMNS) * length)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        offset = 0
+        for name, dtype in COLUMNS:
+            view = np.ndarray((length,), dtype=dtype, buffer=shm.buf, offset=offset)
+            view[:] = trades.column(name)
+            offset += view.nbytes
+        shared = cls(shm.name, length)
+        shm.close()
+        return shared
+
+    def _views(self):
+        columns = {}
+        offset = 0
+        for name, dtype in COLUMNS:
+            view = np.ndarray((self._length,), dtype=dtype, buffer=self._shm.buf, offset=offset)
+            # readonly: the block is shared by all backtest processes
+            view.flags.writeable = False
+            columns[name] = view
+            offset += view.nbytes
+        return columns
+
+    def __getstate__(self):
+        return {'name': self._name, 'length': self._length}
+
+    def __setstate__(self, state):
+        self.__init__(state['name'], state['length'])
+
+    def close(self):
+        self._columns = {}
+        self._shm.close()
+
+    def unlink(self):
+        self.close()
+        self._shm.unlink()
+
+
+class TradeStore(TradeColumns):
+    """Append-only columnar trade history, one raw binary file per column.
+
+    Trades are kept sorted by (date, trade_id). Columns are opened with numpy.memmap,
+    so loading is independent of the history size and the pages are shared by processes
+    reading the same store.
+    """
+
+    def __init__(self, folder):
+        self._folder = folder
+        os.makedirs(folder, exist_ok=True)
+        super(TradeStore, self).__init__({})
+        self.reload()
+
+    def __reduce__(self):
+        # reopen the memory mapped files instead of copying the columns
+        return TradeStore, (self._folder,)
+
+    @staticmethod
+    def is_store(folder):
+        return os.path.isfile(os.path.join(folder, TradeStore._column_file_name(COLUMNS[0][0])))
+
+    @staticmethod
+    def _column_file_name(name):
+        return name + '.bin'
+
+    def _column_path(self, name):
+        return os.path.join(self._folder, self._column_file_name(name))
+
+    def reload(self):
+        sizes = []
+        for name, dtype in COLUMNS:
+            path = self._column_path(name)
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            sizes.append(os.path.getsize(path) // np.dtype(dtype).itemsize)
+        # A crash between column writes leaves columns of different length, ignore the tail
+        length = min(sizes)
+        for name, dtype in COLUMNS:
+            if length:
+                self._columns[name] = np.memmap(self._column_path(name), dtype=dtype, mode='r', shape=(length,))
+            else:
+                self._columns[name] = np.empty(0, dtype=dtype)
+
+    def last_trade_id(self):
+        if not len(self):
+            return None
+        return int(self._columns['trade_id'][-1])
+
+    def last_date(self):
+        if not len(self):
+            return None
+        return int(self._columns['date'][-1])
+
+    def append(self, trades):
+        """Append trades (exmo format dicts), skipping ones not newer than the last stored trade."""
+        last_trade_id = self.last_trade_id()
+        last_date = self.last_date()
+        new_trades = sorted(
+            (t for t in trades if last_trade_id is None
+             or (int(t['date']), int(t['trade_id'])) > (last_date, last_trade_id)),
+            key=lambda t: (int(t['date']), int(t['trade_id'])))
+        if not new_trades:
+            return 0
+        # the torn tail of an interrupted append would shift the new rows of the longer columns
+        align_columns(self._folder, len(self))
+        for name, dtype in COLUMNS:
+            values = np.array([get_value(t, name) for t in new_trades], dtype=dtype)
+            with open(self._column_path(name), 'ab') as f:
+                values.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        self.reload()
+        return len(new_trades)
+
+
+def align_columns(folder, length=None):
+    """Truncates the column files of a store folder to `length` rows, by default to the shortest column.
+
+    Returns the number of rows. Writers call it before appending to a store written by a crashed process.
+    """
+    paths = [(os.path.join(folder, TradeStore._column_file_name(name)), np.dtype(dtype).itemsize)
+             for name, dtype in COLUMNS]
+    if length is None:
+        length = min(os.path.getsize(path) // itemsize if os.path.exists(path) else 0 for path, itemsize in paths)
+    for path, itemsize in paths:
+        if os.path.exists(path) and os.path.getsize(path) != length * itemsize:
+            logger.warning('Truncating torn column {} to {} trades'.format(path, length))
+            os.truncate(path, length * itemsize)
+    return length
+
+
+class TradeRing(TradeColumns):
+    """Last `size` trades in memory, appended by a collector and read by deal sizers in the same process.
+
+    Columns live in buffers of twice the size: trades are appended after the live window and the window
+    is copied to a new buffer when the end is reached. Returned views are never overwritten, so readers
+    in other threads need no copies.
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._buffers = {name: np.empty(2 * size, dtype=dtype) for name, dtype in COLUMNS}
+        self._start = 0
+        self._stop = 0
+        self._lock = threading.Lock()
+
+    @property
+    def _columns(self):
+        with self._lock:
+            return {name: buffer[self._start:self._stop] for name, buffer in self._buffers.items()}
+
+    def snapshot(self):
+        """Trade columns as of now, unaffected by later appends."""
+        return TradeColumns(self._columns)
+
+    def get_deals(self, since=None, until=None):
+        return self.snapshot().get_deals(since, until)
+
+    def get_deal_arrays(self, since=None, until=None):
+        trades = self.snapshot()
+        start, stop = trades.get_range(since, until)
+        return trades.column('date')[start:stop], trades.column('price')[start:stop]
+
+    def last_key(self):
+        with self._lock:
+            if self._stop == self._start:
+                return None
+            return int(self._buffers['date'][self._stop - 1]), int(self._buffers['trade_id'][self._stop - 1])
+
+    def append(self, trades):
+        """Appends trades (exmo format dicts) newer than the last trade. Returns the number of appended trades."""
+        last_key = self.last_key()
+        new_trades = sorted((t for t in trades if last_key is None or (int(t['date']), int(t['trade_id'])) > last_key),
+                            key=lambda t: (int(t['date']), int(t['trade_id'])))[-self._size:]
+        if not new_trades:
+            return 0
+        count = len(new_trades)
+        values = {name: np.array([get_value(t, name) for t in new_trades], dtype=dtype) for name, dtype in COLUMNS}
+        with self._lock:
+            if self._stop + count > 2 * self._size:
+                keep = min(self._stop - self._start, self._size - count)
+                buffers = {name: np.empty(2 * self._size, dtype=dtype) for name, dtype in COLUMNS}
+                for name in buffers:
+                    buffers[name][:keep] = self._buffers[name][self._stop - keep:self._stop]
+                self._buffers = buffers
+                self._start, self._stop = 0, keep
+            for name in self._buffers:
+                self._buffers[name][self._stop:self._stop + count] = values[name]
+            self._stop += count
+            self._start = max(self._start, self._stop - self._size)
+        return count
+
+
+def deals_to_arrays(deals):
+    """Converts exmo format deals to (dates, prices) int64 and float64 arrays."""
+    dates = np.fromiter((int(d['date']) for d in deals), dtype=np.int64, count=len(deals))
+    prices = np.fromiter((float(d['price']) for d in deals), dtype=np.float64, count=len(deals))
+    return dates, prices
+
+
+def date_range(dates, since=None, until=None):
+    """Returns (start, stop) indexes of sorted dates with since < date <= until."""
+    start = 0 if since is None else int(np.searchsorted(dates, since, side='right'))
+    stop = len(dates) if until is None else int(np.searchsorted(dates, until, side='right'))
+    return start, stop
+
+
+def get_deal_arrays(deals_provider, since=None, until=None):
+    """(dates, prices) of deals with since < date <= until from a deals provider.
+
+    Providers implementing get_deal_arrays(since, until) return views of their columns, for others
+    all deals are converted.
+    """
+    if hasattr(deals_provider, 'get_deal_arrays'):
+        return deals_provider.get_deal_arrays(since=since, until=until)
+    dates, prices = deals_to_arrays(deals_provider.get_deals())
+    start, stop = date_range(dates, since, until)
+    return dates[start:stop], prices[start:stop]
+
+
+def list_json_files(folder):
+    """Names of the json trade dumps in folder. Folders of other layouts are rejected."""
+    filenames = os.listdir(folder)
+    for filename in filenames:
+        if os.path.isdir(os.path.join(folder, filename)):
+            raise ValueError('{} is neither a trade store, nor a folder of trade segments or json trade files: '
+                             'it contains the folder {}'.format(folder, filename))
+    return filenames
+
+
+def read_json_folder(folder):
+    deals = {}
+    for filename in list_json_files(folder):
+        with open(os.path.join(folder, filename)) as f:
+            try:
+                d = json.load(f)
+                deals.update(d)
+            except:
+                logger.exception('Cannot read trades file {}'.format(filename))
+    return sorted(deals.values(), key=lambda v: (int(v['date']), int(v['trade_id'])))
+
+
+def _segment_date(name):
+    return int(name.split('.')[0])
+
+
+def is_segment_folder(folder):
+    """Whether folder holds the segments of a pair written by trades_collector.SegmentWriter.
+
+    Segments are named by the date of their first trade: trade store folders or <date>.ndjson files.
+    """
+    names = os.listdir(folder) if os.path.isdir(folder) else []
+    return bool(names) and all(name.split('.')[0].isdigit() and (
+        name.endswith(NDJSON_EXTENSION) or os.path.isdir(os.path.join(folder, name))) for name in names)
+
+
+class NdjsonSegment(TradeColumns):
+    """Trade columns of an ndjson segment, reload() parses only the lines appended since the last read."""
+
+    def __init__(self, path):
+        super(NdjsonSegment, self).__init__({name: np.empty(0, dtype) for name, dtype in COLUMNS})
+        self._path = path
+        self._offset = 0
+        self.reload()
+
+    def reload(self):
+        with open(self._path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # the last line may be partially written
+        end = data.rfind(b'\n') + 1
+        if not end:
+            return
+        self._offset += end
+        new_trades = TradeColumns.from_deals([json.loads(line) for line in data[:end].splitlines() if line.strip()])
+        self._columns = {name: np.concatenate([self._columns[name], new_trades.column(name)]) for name in self._columns}
+
+
+class SegmentReader:
+    """Trade columns of the segments of a pair folder written by trades_collector.SegmentWriter.
+
+    Segments already read are kept: binary segments are memory mapped and reloaded, of ndjson segments
+    only appended lines are parsed. The columns of the segments are joined again only when one changed.
+    """
+
+    def __init__(self, folder):
+        self._folder = folder
+        self._segments = {}
+        self._lengths = None
+        self._trades = None
+
+    def read(self, since=None):
+        """Trade columns of the segments, with since only of the segments holding trades with date > since."""
+        names = sorted(os.listdir(self._folder), key=_segment_date)
+        if since is not None:
+            # a segment ends where the next one begins
+            names = names[max([i for i, name in enumerate(names) if _segment_date(name) <= since], default=0):]
+        for name in set(self._segments) - set(names):
+            self._segments.pop(name)
+        for name in names:
+            if name in self._segments:
+                self._segments[name].reload()
+            elif name.endswith(NDJSON_EXTENSION):
+                self._segments[name] = NdjsonSegment(os.path.join(self._folder, name))
+            else:
+                self._segments[name] = TradeStore(os.path.join(self._folder, name))
+        lengths = [(name, len(self._segments[name])) for name in names]
+        if lengths != self._lengths:
+            self._lengths = lengths
+            trades = [self._segments[name] for name in names]
+            self._trades = TradeColumns({name: np.concatenate([t.column(name) for t in trades]) if trades
+                                         else np.empty(0, dtype) for name, dtype in COLUMNS})
+        return self._trades
+
+
+def load_segments(folder, since=None):
+    """Trade columns of all segments of a pair folder written by trades_collector.SegmentWriter.
+
+    With since, segments holding only trades with date <= since are not read.
+    """
+    return SegmentReader(folder).read(since)
+
+
+def load_trades(folder, shared=False):
+    """Trade columns of a dataset folder.
+
+    A trade store is memory mapped. The segments of a pair written by the trades collector and a folder
+    of json dumps are read into memory, and with shared=True published in shared memory, so that backtest
+    processes attach to it instead of reading it again.
+    """
+    if TradeStore.is_store(folder):
+        return TradeStore(folder)
+    if is_segment_folder(folder):
+        trades = load_segments(folder)
+    else:
+        trades = TradeColumns.from_deals(read_json_folder(folder))
+    if shared:
+        return SharedTrades.publish(trades)
+    return trades
+
+
+def convert_json_folder(json_folder, store_folder):
+    store = TradeStore(store_folder)
+    count = store.append(read_json_folder(json_folder))
+    logger.info('Converted {} trades from {} to {}'.format(count, json_folder, store_folder))
+    return store
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Convert folder of json trade dumps to columnar trade store')
+    parser.add_argument('json_folder', type=str, help='Folder with <timestamp>.json trade files')
+    parser.add_argument('store_folder', type=str, help='Trade store folder')
+    sysargs = parser.parse_args()
+    convert_json_folder(sysargs.json_folder, sysargs.store_folder)
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger('xmb')
+
+
+def _trade_key(trade):
+    return int(trade['date']), int(trade['trade_id'])
+
+
+class TradeStream:
+    """Async iterator of new market trades (exmo format dicts) in (date, trade_id) order.
+
+    Subclasses implement _read() returning the trades currently known to the source, in any order.
+    Trades already yielded are dropped by trade_id (the last dedup_size ids are remembered).
+    A gap is reported when trades between two reads may have been lost: with contiguous_ids (binance)
+    when trade ids are skipped, otherwise when a read contains no trade seen before.
+    Gaps are kept in `gaps` as (last seen date, first new date) and passed to on_gap.
+    """
+
+    def __init__(self, contiguous_ids=False, dedup_size=10000, on_gap=None):
+        self._contiguous_ids = contiguous_ids
+        self._seen = set()
+        self._seen_order = deque()
+        self._dedup_size = dedup_size
+        self._on_gap = on_gap
+        self._buffer = deque()
+        self._last = None
+        self._closed = False
+        self.gaps = []
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._buffer:
+            if self._closed:
+                raise StopAsyncIteration
+            self._buffer.extend(await self._next_batch())
+        return self._buffer.popleft()
+
+    async def batches(self):
+        """Yields lists of new trades, one per read of the source."""
+        while not self._closed:
+            if self._buffer:
+                batch = list(self._buffer)
+                self._buffer.clear()
+            else:
+                batch = await self._next_batch()
+            if batch:
+                yield batch
+
+    def close(self):
+        self._closed = True
+
+    async def _next_batch(self):
+        trades = await self._read()
+        if trades is None:
+            self.close()
+            return []
+        return self._accept(trades)
+
+    async def _read(self):
+        raise NotImplementedError()
+
+    def _accept(self, trades):
+        new_trades = []
+        overlap = False
+        for trade in trades:
+            trade_id = int(trade['trade_id'])
+            if trade_id in self._seen or self._last is not None and _trade_key(trade) <= self._last:
+                overlap = True
+            else:
+                new_trades.append(trade)
+        new_trades.sort(key=_trade_key)
+        if new_trades and self._last is not None:
+            first = new_trades[0]
+            if self._contiguous_ids and int(first['trade_id']) > self._last[1] + 1 \
+                    or not self._contiguous_ids and not overlap:
+                self._report_gap(self._last[0], int(first['date']))
+        for trade in new_trades:
+            self._remember(int(trade['trade_id']))
+        if new_trades:
+            self._last = _trade_key(new_trades[-1])
+        return new_trades
+
+    def _remember(self, trade_id):
+        self._seen.add(trade_id)
+        self._seen_order.append(trade_id)
+        if len(self._seen_order) > self._dedup_size:
+            self._seen.discard(self._seen_order.popleft())
+
+    def _report_gap(self, last_date, first_date):
+        logger.warning('Trades between {} and {} may be lost'.format(last_date, first_date))
+        self.gaps.append((last_date, first_date))
+        if self._on_gap is not None:
+            self._on_gap(last_date, first_date)
+
+
+class PollingTradeStream(TradeStream):
+    """Trade stream over a REST get_trades endpoint (ExmoApi, ExmoApiProxy, ExmoPublicApi, BinanceApi).
+
+    The poll period adapts to the market: it is halved down to min_period after a gap and
+    grows by a quarter up to max_period while polls return no new trades.
+    """
+
+    def __init__(self, api, currency_1='BTC', currency_2='USD', period=3.0, min_period=None, max_period=None,
+                 **kwargs):
+        super(PollingTradeStream, self).__init__(**kwargs)
+        self._api = api
+        self._currency_1 = currency_1
+        self._currency_2 = currency_2
+        self._min_period = min_period if min_period is not None else period
+        self._max_period = max_period if max_period is not None else period
+        self.period = period
+        self._next_poll = 0
+        self.polls = 0
+
+    async def _next_batch(self):
+        now = time.monotonic()
+        if self._next_poll > now:
+            await asyncio.sleep(self._next_poll - now)
+        gaps = len(self.gaps)
+        try:
+            new_trades = await super(PollingTradeStream, self)._next_batch()
+        except Exception as e:
+            logger.exception('Cannot read trades')
+            new_trades = []
+        if len(self.gaps) > gaps:
+            self.period = max(self._min_period, self.period / 2)
+        elif not new_trades:
+            self.period = min(self._max_period, self.period * 1.25)
+        self._next_poll = time.monotonic() + self.period
+        return new_trades
+
+    async def _read(self):
+        self.polls += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._api.get_trades, self._currency_1, self._currency_2)
@@ -1,40 +1,228 @@
+import argparse
+import asyncio
 import json
 import logging
-import os.path
+import os
+import threading
 import time
 
+import numpy as np
+
+from binance_api import BinanceApi
 from exmo_api_proxy import ExmoApiProxy
+from rate_limiter import ScheduledApi, get_scheduler
+from trade_store import COLUMNS, NDJSON_EXTENSION, TradeRing, TradeStore, align_columns, get_value
+from trade_stream import PollingTradeStream
 
-FOLDER = 'trades-2018-02-15'
-TRADES_PER_FILE = 1000
-TRADES_TO_SAVE = 100
+logger = logging.getLogger('xmb')
 
+FOLDER = 'trades'
+FORMATS = ('binary', 'ndjson')
 
-def save_trades(trades, filename):
-    with open(os.path.join(FOLDER, '{}.json'.format(filename)), 'w') as f:
-        json.dump(trades, f)
 
+def _trade_key(trade):
+    return int(trade['date']), int(trade['trade_id'])
 
-if __name__ == '__main__':
-    api = ExmoApiProxy('localhost', 9050)
-    trades = {}
-    os.makedirs(FOLDER, exist_ok=True)
-    last_saved = 0
-    filename = str(int(time.time()))
-    while True:
+
+def _truncate_torn_line(path):
+    # the next trade would continue a line partially written by a killed process
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - 65536))
+        tail = f.read()
+        if tail and not tail.endswith(b'\n'):
+            logger.warning('Truncating torn line of {}'.format(path))
+            f.truncate(size - len(tail) + tail.rfind(b'\n') + 1)
+
+
+class SegmentWriter:
+    """Appends trades of one pair to rotating segment files in `folder`.
+
+    A segment is named by the date of its first trade and holds at most segment_trades trades.
+    'binary' segments are folders in the TradeStore layout (one raw file per column), 'ndjson'
+    segments are files with a json trade per line. Files stay open and are fsynced every
+    fsync_trades trades or fsync_seconds seconds, whichever comes first, and on close.
+    The segments of a folder are read by trade_store.load_segments.
+    """
+
+    def __init__(self, folder, fmt='binary', segment_trades=1000000, fsync_trades=1000, fsync_seconds=10):
+        if fmt not in FORMATS:
+            raise ValueError('Unknown segment format: {}'.format(fmt))
+        self._folder = folder
+        self._format = fmt
+        self._segment_trades = segment_trades
+        self._fsync_trades = fsync_trades
+        self._fsync_seconds = fsync_seconds
+        self._files = []
+        self._segment_count = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        os.makedirs(folder, exist_ok=True)
+        self._last_key = self._read_last_key()
+
+    def _segments(self):
+        names = [name for name in os.listdir(self._folder) if
+                 name.endswith(NDJSON_EXTENSION) == (self._format == 'ndjson')]
+        return sorted(names, key=lambda name: int(os.path.splitext(name)[0]))
+
+    def _read_last_key(self):
+        # trades written before a restart are not written again
+        segments = self._segments()
+        if not segments:
+            return None
+        path = os.path.join(self._folder, segments[-1])
+        if self._format == 'binary':
+            store = TradeStore(path)
+            return (store.last_date(), store.last_trade_id()) if len(store) else None
+        last_line = None
+        with open(path) as f:
+            for line in f:
+                if line.strip() and line.endswith('\n'):
+                    last_line = line
+        return _trade_key(json.loads(last_line)) if last_line is not None else None
+
+    def append(self, trades):
+        """Writes trades newer than the last written one. Returns the number of written trades."""
+        new_trades = sorted((t for t in trades if self._last_key is None or _trade_key(t) > self._last_key),
+                            key=_trade_key)
+        written = 0
+        while new_trades:
+            if not self._files or self._segment_count >= self._segment_trades:
+                self._open_segment(int(new_trades[0]['date']))
+            count = self._segment_trades - self._segment_count
+            chunk, new_trades = new_trades[:count], new_trades[count:]
+            self._write(chunk)
+            self._segment_count += len(chunk)
+            self._unsynced += len(chunk)
+            written += len(chunk)
+            self._last_key = _trade_key(chunk[-1])
+        if self._unsynced >= self._fsync_trades or time.monotonic() - self._last_sync >= self._fsync_seconds:
+            self.sync()
+        return written
+
+    def _open_segment(self, first_date):
+        self.close()
+        name = str(first_date)
+        if self._format == 'binary':
+            path = os.path.join(self._folder, name)
+            os.makedirs(path, exist_ok=True)
+            # a segment written before a crash may end with a torn trade
+            align_columns(path)
+            self._files = [open(os.path.join(path, TradeStore._column_file_name(column)), 'ab')
+                           for column, dtype in COLUMNS]
+        else:
+            path = os.path.join(self._folder, name + NDJSON_EXTENSION)
+            if os.path.exists(path):
+                _truncate_torn_line(path)
+            self._files = [open(path, 'a')]
+        self._segment_count = 0
+
+    def _write(self, trades):
+        if self._format == 'binary':
+            for f, (name, dtype) in zip(self._files, COLUMNS):
+                np.array([get_value(t, name) for t in trades], dtype=dtype).tofile(f)
+        else:
+            self._files[0].writelines(json.dumps(t) + '\n' for t in trades)
+
+    def sync(self):
+        for f in self._files:
+            f.flush()
+            os.fsync(f.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        for f in self._files:
+            f.close()
+        self._files = []
+
+
+class Feed:
+    """Trades of a pair on an exchange: a trade stream written to segments and kept in a ring buffer."""
+
+    def __init__(self, stream, writer, ring):
+        self.stream = stream
+        self.writer = writer
+        self.ring = ring
+
+    async def run(self):
         try:
-            deals = api.get_trades('BTC', 'USD')
-            for d in deals:
-                trades[d['trade_id']] = d
-            if len(trades) - last_saved > TRADES_TO_SAVE:
-                save_trades(trades, filename)
-                last_saved = len(trades)
-            if len(trades) >= TRADES_PER_FILE:
-                save_trades(trades, filename)
-                trades.clear()
-                last_saved = 0
-                filename = str(int(time.time()))
-            time.sleep(3)
-        except:
-            logging.exception('Cannot get deals')
-            pass
+            async for trades in self.stream.batches():
+                self.ring.append(trades)
+                try:
+                    self.writer.append(trades)
+                except Exception as e:
+                    logger.exception('Cannot write trades')
+        finally:
+            self.writer.close()
+
+
+class Collector:
+    """Collects trades of several pairs and exchanges in one process.
+
+    Trades of each feed go to <folder>/<exchange>/<pair> segments and to a ring buffer of the last
+    ring_size trades, which deal sizers in the same process read with get_ring() instead of the files.
+    Writer options (fmt, segment_trades, fsync_trades, fsync_seconds) are passed to SegmentWriter.
+    """
+
+    def __init__(self, folder=FOLDER, ring_size=100000, **kwargs):
+        self._folder = folder
+        self._ring_size = ring_size
+        self._writer_args = kwargs
+        self._feeds = {}
+
+    def get_folder(self, exchange, currency_1, currency_2):
+        """Segment folder of a pair, which trade_store.load_trades and DiskDealReader read."""
+        return os.path.join(self._folder, exchange, currency_1 + '_' + currency_2)
+
+    def add_feed(self, exchange, stream, currency_1, currency_2, ring=None):
+        pair = currency_1 + '_' + currency_2
+        writer = SegmentWriter(self.get_folder(exchange, currency_1, currency_2), **self._writer_args)
+        feed = Feed(stream, writer, ring if ring is not None else TradeRing(self._ring_size))
+        self._feeds[(exchange, pair)] = feed
+        return feed
+
+    def get_ring(self, exchange, currency_1, currency_2):
+        return self._feeds[(exchange, currency_1 + '_' + currency_2)].ring
+
+    async def run(self):
+        await asyncio.gather(*[feed.run() for feed in self._feeds.values()])
+
+    def run_in_thread(self):
+        thread = threading.Thread(target=asyncio.run, args=(self.run(),), daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        for feed in self._feeds.values():
+            feed.stream.close()
+
+
+def _create_stream(exchange, currency_1, currency_2):
+    if exchange == 'binance':
+        api = ScheduledApi(BinanceApi(), get_scheduler('binance'))
+        # binance trade ids are contiguous per symbol
+        return PollingTradeStream(api, currency_1, currency_2, period=3, min_period=1, max_period=10,
+                                  contiguous_ids=True)
+    api = ScheduledApi(ExmoApiProxy('localhost', 9050), get_scheduler('exmo'))
+    return PollingTradeStream(api, currency_1, currency_2, period=3, min_period=1, max_period=10)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Collect trades of several pairs and exchanges')
+    parser.add_argument('feeds', nargs='*', default=['exmo:BTC_USD'], help='<exchange>:<pair>, e.g. binance:BTC_USDT')
+    parser.add_argument('--folder', type=str, default=FOLDER)
+    parser.add_argument('--format', type=str, choices=FORMATS, default='binary')
+    parser.add_argument('--segment-trades', type=int, default=1000000)
+    parser.add_argument('--fsync-trades', type=int, default=1000)
+    parser.add_argument('--fsync-seconds', type=float, default=10)
+    sysargs = parser.parse_args()
+    collector = Collector(sysargs.folder, fmt=sysargs.format, segment_trades=sysargs.segment_trades,
+                          fsync_trades=sysargs.fsync_trades, fsync_seconds=sysargs.fsync_seconds)
+    for feed in sysargs.feeds:
+        exchange, pair = feed.split(':')
+        currency_1, currency_2 = pair.split('_')
+        collector.add_feed(exchange, _create_stream(exchange, currency_1, currency_2), currency_1, currency_2)
+    asyncio.run(collector.run())
@@ -5,13 +5,34 @@ from collections import defaultdict
 
 import numpy as np
 import pandas as pd
-import scipy.misc as sp
+
+from trade_store import deals_to_arrays
 
 logger = logging.getLogger('xmb')
 
+# moved to numpy.exceptions in numpy 2
+RankWarning = getattr(np, 'RankWarning', None) or np.exceptions.RankWarning
+
+# number of samples of the interpolated price function
+SAMPLES = 100
+
+
+def rolling_mean(values, window):
+    """Mean of each `window` consecutive values, NaN until the window is full, like pandas rolling().mean().
+
+    Leading NaNs are skipped, a window containing them is NaN.
+    """
+    result = np.full(len(values), np.nan)
+    first = int(np.argmax(~np.isnan(values))) if len(values) else 0
+    finite = values[first:]
+    if len(finite) >= window:
+        sums = np.cumsum(np.concatenate(([0.0], finite)))
+        result[first + window - 1:] = (sums[window:] - sums[:-window]) / window
+    return result
+
 class TrendAnalyzer:
     def __init__(self, **kwargs):
-        warnings.simplefilter('ignore', np.RankWarning)
+        warnings.simplefilter('ignore', RankWarning)
 
         if 'rolling_window' in kwargs:
             self._rolling_window = kwargs['rolling_window']
@@ -43,6 +64,11 @@ class TrendAnalyzer:
         else:
             self._reserve_multiplier = 0
 
+        # 'numpy' or 'scipy': the original implementation with scipy.misc.derivative, kept for comparison
+        if 'derivative_engine' in kwargs:
+            self._derivative_engine = kwargs['derivative_engine']
+        else:
+            self._derivative_engine = 'numpy'
 
     def _get_prices_for_period(self, deals):
         c = defaultdict(list)
@@ -54,6 +80,33 @@ class TrendAnalyzer:
 
         return result
 
+    def _get_mean_prices(self, dates, prices):
+        """Sorted distinct deal times and mean price of the deals of each time."""
+        times, inverse = np.unique(dates, return_inverse=True)
+        return times, np.bincount(inverse, weights=prices) / np.bincount(inverse)
+
+    def _get_derivative(self, times, prices):
+        """Rolling mean of the derivative of the rolling mean of the normalized interpolated price.
+
+        The polynomial is fitted on time centered and scaled to [-1, 1], raw epoch seconds make
+        the degree 20 fit ill-conditioned. Derivatives are central differences of the samples.
+        """
+        center = (times[0] + times[-1]) / 2
+        scale = (times[-1] - times[0]) / 2
+        x_lin = np.linspace(times[0], times[-1], SAMPLES)
+        step = (x_lin[-1] - x_lin[0]) / (len(x_lin) - 1)
+        polyfit = np.polyfit((times - center) / scale, prices, self._interpolation_degree)
+        price_func = np.polyval(polyfit, (x_lin - center) / scale)
+        rolling_mean_price_func = rolling_mean(price_func / price_func.mean(), self._rolling_window)
+        derivative_func = (rolling_mean_price_func[2:] - rolling_mean_price_func[:-2]) / 2 / step
+        return rolling_mean(derivative_func, self._rolling_window)
+
+    def _get_last_derivative(self, trades):
+        if self._derivative_engine == 'scipy':
+            return self._get_derivative_func(self._get_prices_for_period(trades)).iloc[-1]
+        times, prices = self._get_mean_prices(*deals_to_arrays(trades))
+        return self._get_derivative(times.astype(np.float64), prices)[-1]
+
     def _get_derivative_func(self, deals):
         # TODO make function(time)!!!
         deals_df = pd.DataFrame([p for p in deals])
@@ -68,6 +121,7 @@ class TrendAnalyzer:
         return rolling_mean_derivative_func
 
     def _get_der_func(self, rolling_mean_price_func, step):
+        import scipy.misc as sp
         return [sp.derivative(lambda x: rolling_mean_price_func[x], i) / step for i in
                 range(1, len(rolling_mean_price_func) - 1)]
 
@@ -91,10 +145,7 @@ class TrendAnalyzer:
 
     def get_profile(self, trades):
         try:
-            last_deals = self._get_prices_for_period(trades)
-            derivative_func = self._get_derivative_func(last_deals)
-            index = -1
-            last_derivative = derivative_func.iloc[index]
+            last_derivative = self._get_last_derivative(trades)
             profit_markup = abs(self._profit_multiplier * last_derivative) + self._profit_free_weight
             reserve_markup = abs(self._reserve_multiplier * last_derivative)
             period = self._mean_price_period
@@ -117,15 +168,25 @@ class TrendAnalyzer:
             return None, None, None, None
 
     def _calculate_mean_price(self, deals, mean_price_period):
-        prices = []
-        for deal in deals:
-            time_passed = self._current_time() - int(deal['date'])
-            if time_passed < mean_price_period:
-                prices.append(float(deal['price']))
-        if prices:
-            avg_price = sum(prices) / len(prices)
-            return avg_price
+        dates, prices = deals_to_arrays(deals)
+        prices = prices[self._current_time() - dates < mean_price_period]
+        if len(prices):
+            return float(prices.mean())
         return None
 
     def _current_time(self):
         return time.time()
+
+
+if __name__ == '__main__':
+    # compares the engines on 5 hours of synthetic deals
+    rng = np.random.default_rng(0)
+    dates = np.sort(rng.integers(1517170000, 1517170000 + 5 * 3600, 3000))
+    prices = 10000 + 200 * np.sin((dates - dates[0]) / 3000) + rng.normal(0, 10, len(dates))
+    deals = [{'date': str(d), 'trade_id': str(i), 'price': str(p)} for i, (d, p) in enumerate(zip(dates, prices))]
+    for engine in ('numpy', 'scipy'):
+        ta = TrendAnalyzer(derivative_engine=engine)
+        ta._current_time = lambda: int(dates[-1])
+        start = time.perf_counter()
+        profile = ta.get_profile(deals)
+        print('{}: {:.4f} s {}'.format(engine, time.perf_counter() - start, profile))
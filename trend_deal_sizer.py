@@ -2,7 +2,10 @@ import logging
 import time
 from datetime import timedelta
 
-import pandas as pd
+import numpy as np
+
+from rolling_mean import RollingMeanIndicator
+from trade_store import get_deal_arrays
 
 logger = logging.getLogger('xmb')
 
@@ -55,49 +58,114 @@ class TrendDealSizer:
         else:
             self._trend_max_deal_size = 1
 
+        # keep rolling mean state between calls instead of recomputing it from the deals
+        if 'trend_incremental' in kwargs and kwargs['trend_incremental']:
+            history_seconds = max(timedelta(hours=self._trend_diff_hours).total_seconds(), self._mean_price_period)
+            self._indicator = RollingMeanIndicator(self._trend_rolling_window, history_seconds)
+        else:
+            self._indicator = None
+
     def get_deal_size(self):
         try:
-            ds = self._deals_provider.get_deals()
             delta = timedelta(days=self._trend_days).total_seconds()
             start_time = self._get_time() - delta
-            deals = [d for d in ds if d['date'] > start_time]
-            prices = [float(p['price']) for p in deals]
-            deals_df = pd.DataFrame(deals).convert_objects(convert_numeric=True)
-            # deals_df['time'] = pd.to_datetime(deals_df['date'], unit='s')
-            # deals_df = deals_df.set_index('time')
-            deals_df['mean'] = deals_df['price'].rolling(self._trend_rolling_window).mean()
-            last_deal = deals_df.iloc[-1]
             der_delta = timedelta(hours=self._trend_diff_hours).total_seconds()
-            start_time = int(last_deal['date']) - der_delta
-            first_deal = deals_df[deals_df['date'] >= start_time].iloc[0]
-
-            mean_price_diff = (last_deal['mean'] - first_deal['mean']) / first_deal['mean']
-            profile = 'UP' if mean_price_diff > 0 else 'DOWN'
-
-            mult_base = abs(
-                mean_price_diff) * self._trend_multiplier + 1
-            deal_same = mult_base * self._currency_1_deal_size
-            avg_price = self._calculate_mean_price(deals, self._mean_price_period)
+            if self._indicator is not None:
+                last_mean, first_mean, avg_price = self._get_means_incremental(start_time, der_delta)
+            else:
+                last_mean, first_mean, avg_price = self._get_means(start_time, der_delta)
 
-            logger.debug(
-                'Profile: {}\nAvg price: {}\nMean price:{}\nPrev mean price: {}\nDeal size: {}\nMultiplier: {}'.format(
-                    profile, avg_price, last_deal['mean'], first_deal['mean'], deal_same, mult_base))
-            return profile, self._profit_markup, avg_price, min(deal_same, self._trend_max_deal_size)
+            return self._get_advice(last_mean, first_mean, avg_price)
         except:
             logger.exception('Cannot calculate deal size')
             return None, None, None, None
 
-    def _calculate_mean_price(self, deals, mean_price_period):
-        prices = []
-        last_deal_date = int(deals[-1]['date'])
-        for deal in deals:
-            time_passed = last_deal_date - int(deal['date'])
-            if time_passed < mean_price_period:
-                prices.append(float(deal['price']))
-        if prices:
-            avg_price = sum(prices) / len(prices)
-            return avg_price
-        return None
+    def get_deal_sizes(self, dates, prices, times, cutoffs):
+        """Results of get_deal_size() at each of `times`, seeing the deals with date < cutoff.
+
+        dates and prices are sorted arrays of all deals. Window bounds of all times are found in one
+        vectorized pass; the means are taken over the same slices as get_deal_size() does, so the
+        results are identical to calling it at each time with a deals provider cut at cutoff.
+        """
+        times = np.asarray(times)
+        delta = timedelta(days=self._trend_days).total_seconds()
+        der_delta = timedelta(hours=self._trend_diff_hours).total_seconds()
+        starts = np.searchsorted(dates, times - delta, side='right')
+        stops = np.searchsorted(dates, np.asarray(cutoffs), side='left')
+        last_indexes = stops - 1
+        last_dates = dates[np.maximum(last_indexes, 0)] if len(dates) else np.zeros(len(times), dtype=np.int64)
+        first_indexes = np.maximum(starts, np.searchsorted(dates, last_dates - der_delta, side='left'))
+        avg_starts = np.maximum(starts, np.searchsorted(dates, last_dates - self._mean_price_period, side='right'))
+        result = []
+        for start, last_index, first_index, avg_start in zip(starts.tolist(), last_indexes.tolist(),
+                                                             first_indexes.tolist(), avg_starts.tolist()):
+            if last_index < start:
+                # no deals in the window
+                result.append((None, None, None, None))
+                continue
+            try:
+                last_mean = self._rolling_mean(prices, last_index, start)
+                first_mean = self._rolling_mean(prices, first_index, start)
+                avg_price = float(prices[avg_start:last_index + 1].mean())
+                result.append(self._get_advice(last_mean, first_mean, avg_price))
+            except:
+                logger.exception('Cannot calculate deal size')
+                result.append((None, None, None, None))
+        return result
+
+    def _get_advice(self, last_mean, first_mean, avg_price):
+        mean_price_diff = (last_mean - first_mean) / first_mean
+        profile = 'UP' if mean_price_diff > 0 else 'DOWN'
+
+        mult_base = abs(
+            mean_price_diff) * self._trend_multiplier + 1
+        deal_same = mult_base * self._currency_1_deal_size
+
+        logger.debug(
+            'Profile: {}\nAvg price: {}\nMean price:{}\nPrev mean price: {}\nDeal size: {}\nMultiplier: {}'.format(
+                profile, avg_price, last_mean, first_mean, deal_same, mult_base))
+        return profile, self._profit_markup, avg_price, min(deal_same, self._trend_max_deal_size)
+
+    def _get_means(self, start_time, der_delta):
+        dates, prices = self._get_deal_arrays(since=start_time)
+        last_index = len(prices) - 1
+        last_date = int(dates[last_index])
+        first_index = int(np.searchsorted(dates, last_date - der_delta, side='left'))
+        last_mean = self._rolling_mean(prices, last_index)
+        first_mean = self._rolling_mean(prices, first_index)
+        avg_price = self._calculate_mean_price(dates, prices, self._mean_price_period)
+        return last_mean, first_mean, avg_price
+
+    def _get_means_incremental(self, start_time, der_delta):
+        # deal provider has to be append-only: deals inserted before already consumed ones are not seen
+        last_date = self._indicator.last_date
+        # only deals not consumed yet are requested
+        since = start_time if last_date is None else max(start_time, last_date - 1)
+        dates, prices = self._get_deal_arrays(since=since)
+        self._indicator.update_arrays(dates, prices)
+        last_date = self._indicator.last_date
+        if last_date is None or last_date <= start_time:
+            raise ValueError('No deals since {}'.format(start_time))
+        last_mean = self._indicator.mean_at_latest(since=start_time)
+        first_mean = self._indicator.mean_at(last_date - der_delta, since=start_time)
+        avg_price = self._indicator.mean_price(self._mean_price_period, since=start_time)
+        return last_mean, first_mean, avg_price
+
+    def _get_deal_arrays(self, since=None):
+        return get_deal_arrays(self._deals_provider, since=since)
+
+    def _rolling_mean(self, prices, index, start=0):
+        # same as prices[start:].rolling(window).mean() at index: NaN until the window is filled
+        window = self._trend_rolling_window
+        if index - start < window - 1:
+            return np.nan
+        return float(prices[index - window + 1:index + 1].mean())
+
+    def _calculate_mean_price(self, dates, prices, mean_price_period):
+        if not len(prices):
+            return None
+        start = np.searchsorted(dates, int(dates[-1]) - mean_price_period, side='right')
+        return float(prices[start:].mean())
 
     def _get_time(self):
         return int(time.time())